@@ -1,26 +1,31 @@
+import json
 import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
 import pandas as pd
 import numpy as np
-from datetime import date
 from supabase import create_client
 
+import route_baseline
+from dtd_curve import RECONSTRUCTED_NOTE
+from holiday_calendar import calendar_features
+from route_momentum import capped_pct_change, group_ids, rise_share, rolling_std
+
 SUPABASE_URL = os.environ["MIZAR_SUPABASE_URL"]
 SUPABASE_KEY = os.environ["MIZAR_SUPABASE_SERVICE_ROLE_KEY"]
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-UK_BANK_HOLIDAYS = [
-    date(2025, 1, 1), date(2025, 4, 18), date(2025, 4, 21),
-    date(2025, 5, 5), date(2025, 5, 26), date(2025, 8, 25),
-    date(2025, 12, 25), date(2025, 12, 26),
-    date(2026, 1, 1), date(2026, 4, 3), date(2026, 4, 6),
-    date(2026, 5, 4), date(2026, 5, 25), date(2026, 8, 31),
-    date(2026, 12, 25), date(2026, 12, 28),
-    date(2027, 1, 1), date(2027, 3, 26), date(2027, 3, 29),
-    date(2027, 5, 3), date(2027, 5, 31), date(2027, 8, 30),
-    date(2027, 12, 27), date(2027, 12, 28),
-]
+# incremental: rows on or after the watermark (the earliest snapshot_date
+# still missing features), the momentum cells they touch, and their route
+# baselines extended from the stored state. full: every row, with the route
+# baseline store rebuilt from scratch.
+MODE = os.environ.get("ATLAS_BACKFILL_MODE", "incremental").strip().lower()
+SINCE = os.environ.get("ATLAS_BACKFILL_SINCE", "").strip()
+GROUP_BATCH = int(os.environ.get("ATLAS_BACKFILL_GROUP_BATCH", "25"))
 
 FEATURE_COLS = [
     "season_bucket", "days_to_next_bank_holiday", "trip_overlaps_holiday",
@@ -29,73 +34,35 @@ FEATURE_COLS = [
     "trend_3d", "trend_7d", "volatility_7d", "direction_consistency_7d",
     "jet_fuel_7d_change_pct",
 ]
+CALENDAR_COLS = FEATURE_COLS[:4]
+BASELINE_COLS = ["price_z_score", "price_percentile", "price_ratio", "baseline_mu", "baseline_sigma"]
+MOMENTUM_COLS = ["trend_3d", "trend_7d", "volatility_7d", "direction_consistency_7d"]
+FUEL_COLS = ["jet_fuel_7d_change_pct"]
+
+SNAPSHOT_COLS = (
+    "snapshot_id,snapshot_date,origin_iata,destination_iata,"
+    "outbound_date,return_date,dtd,price_gbp,jet_fuel_usd_gal,"
+    + ",".join(FEATURE_COLS)
+)
+
+# Modelled DTD-curve points are not fares; features only see real searches.
+OBSERVED_ROWS = f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}"
 
-UPDATE_MAX_ATTEMPTS = 3
-UPDATE_BACKOFF_SECONDS = [1.0, 3.0]
-
-
-def assign_season_bucket(d):
-    if isinstance(d, str):
-        d = date.fromisoformat(str(d)[:10])
-    elif hasattr(d, "date"):
-        d = d.date()
-    m, day = d.month, d.day
-    if (m == 12 and day >= 20) or (m == 1 and day <= 5):
-        return "christmas"
-    if (m == 4 and 1 <= day <= 15) or (m == 3 and 24 <= day <= 31):
-        return "easter"
-    if (m == 7 and day >= 15) or m == 8 or (m == 9 and day <= 1):
-        return "summer_peak"
-    if m == 1 and day >= 15 or m == 2 or (m == 3 and day <= 15):
-        return "ski"
-    if m == 2 and 14 <= day <= 21:
-        return "half_term"
-    if m == 10 and 19 <= day <= 30:
-        return "half_term"
-    if m in [4, 5, 6, 9, 10]:
-        return "shoulder"
-    return "off_peak"
-
-
-def days_to_next_bh(d):
-    if isinstance(d, str):
-        d = date.fromisoformat(str(d)[:10])
-    elif hasattr(d, "date"):
-        d = d.date()
-    future = [h for h in UK_BANK_HOLIDAYS if h >= d]
-    return (min(future) - d).days if future else 365
-
-
-def trip_overlaps(outbound, ret):
-    if isinstance(outbound, str):
-        outbound = date.fromisoformat(str(outbound)[:10])
-    elif hasattr(outbound, "date"):
-        outbound = outbound.date()
-    if isinstance(ret, str):
-        ret = date.fromisoformat(str(ret)[:10])
-    elif hasattr(ret, "date"):
-        ret = ret.date()
-    return any(outbound <= h <= ret for h in UK_BANK_HOLIDAYS)
-
-
-def intensity(outbound):
-    if isinstance(outbound, str):
-        outbound = date.fromisoformat(str(outbound)[:10])
-    elif hasattr(outbound, "date"):
-        outbound = outbound.date()
-    season = assign_season_bucket(outbound)
-    base = {
-        "christmas": 0.95,
-        "easter": 0.85,
-        "summer_peak": 0.90,
-        "half_term": 0.75,
-        "ski": 0.70,
-        "shoulder": 0.45,
-        "off_peak": 0.20,
-    }.get(season, 0.30)
-    if days_to_next_bh(outbound) <= 3:
-        base = min(1.0, base + 0.15)
-    return round(base, 3)
+BASELINE_KEY = route_baseline.KEY_COLUMNS
+MOMENTUM_KEY = ["origin_iata", "destination_iata", "outbound_date"]
+FUEL_PERIODS = 7
+
+# Writes: update_snapshot_features RPC (snapshot_feature_update.sql) keyed
+# on snapshot_id, CHUNK_SIZE rows per request, over
+# WRITE_WORKERS threads, with a checkpoint so a restarted run resumes.
+CHUNK_SIZE = int(os.environ.get("ATLAS_BACKFILL_CHUNK_SIZE", "500"))
+WRITE_WORKERS = int(os.environ.get("ATLAS_BACKFILL_WORKERS", "4"))
+CHECKPOINT_PATH = os.environ.get(
+    "ATLAS_BACKFILL_CHECKPOINT", ".cache/atlas_backfill_v2_checkpoint.json"
+).strip()
+
+WRITE_MAX_ATTEMPTS = 3
+WRITE_BACKOFF_SECONDS = [2.0, 5.0]
 
 
 def clean_val(val, col):
@@ -124,213 +91,535 @@ def clean_val(val, col):
         return None
 
 
-def update_snapshot_with_retry(snapshot_id, enrichment_columns):
-    global supabase
+_local = threading.local()
+
+
+def thread_client():
+    """One Supabase client per writer thread, rebuilt after a failed request."""
+    if getattr(_local, "client", None) is None:
+        _local.client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _local.client
+
+
+def update_chunk_with_retry(chunk):
     last_error = None
 
-    for attempt in range(1, UPDATE_MAX_ATTEMPTS + 1):
+    for attempt in range(1, WRITE_MAX_ATTEMPTS + 1):
         try:
-            result = (
-                supabase.table("snapshots")
-                .update(enrichment_columns)
-                .eq("snapshot_id", str(snapshot_id))
-                .execute()
-            )
-            if not result.data:
-                return False, "update matched no row"
+            result = thread_client().rpc("update_snapshot_features", {"rows": chunk}).execute()
+            updated = result.data if isinstance(result.data, int) else 0
+            if updated != len(chunk):
+                return False, f"update returned {updated} of {len(chunk)} rows"
             return True, None
         except Exception as exc:
             last_error = exc
-            if attempt >= UPDATE_MAX_ATTEMPTS:
+            if attempt >= WRITE_MAX_ATTEMPTS:
                 break
 
-            sleep_for = UPDATE_BACKOFF_SECONDS[min(attempt - 1, len(UPDATE_BACKOFF_SECONDS) - 1)]
+            sleep_for = WRITE_BACKOFF_SECONDS[min(attempt - 1, len(WRITE_BACKOFF_SECONDS) - 1)]
             print(
-                f"  RETRY snapshot_id {snapshot_id}: attempt {attempt}/{UPDATE_MAX_ATTEMPTS} "
+                f"  RETRY chunk starting {chunk[0]['snapshot_id']}: attempt {attempt}/{WRITE_MAX_ATTEMPTS} "
                 f"failed: {exc}; sleeping {sleep_for:.1f}s"
             )
             time.sleep(sleep_for)
-            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+            _local.client = None
 
     return False, str(last_error)
 
 
-print("Fetching snapshots...")
-rows = []
-page_size = 1000
-offset = 0
-while True:
-    batch = (
+class WriteCheckpoint:
+    """
+    Chunks still to be written by today's run, kept next to CHECKPOINT_PATH.
+
+    The chunks are saved once, before the first write; each chunk index is
+    appended to a .done file once its update succeeds. A run that finds a
+    checkpoint from the same UTC day writes the chunks not yet done before
+    its own watermark pass, and the file is removed once every chunk is in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done_path = f"{path}.done"
+        self.today = datetime.now(timezone.utc).date().isoformat()
+        self.chunks = []
+        self.done = set()
+        self.label = ""
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("date") != self.today:
+                print(f"Ignoring checkpoint {self.path} from {saved.get('date')}")
+                return False
+            self.chunks = saved.get("chunks") or []
+            self.label = saved.get("label") or ""
+            if os.path.exists(self.done_path):
+                with open(self.done_path, "r", encoding="utf-8") as f:
+                    self.done = {int(line) for line in f if line.strip()}
+        except Exception as exc:
+            print(f"Warning: ignoring unreadable checkpoint {self.path}: {exc}")
+            return False
+        return True
+
+    def start(self, chunks, label):
+        self.chunks = chunks
+        self.done = set()
+        self.label = label
+        if not self.path:
+            return
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"date": self.today, "label": label, "chunks": chunks}, f)
+        if os.path.exists(self.done_path):
+            os.remove(self.done_path)
+        os.replace(tmp_path, self.path)
+
+    def mark(self, index):
+        self.done.add(index)
+        if self.path:
+            with open(self.done_path, "a", encoding="utf-8") as f:
+                f.write(f"{index}\n")
+
+    def clear(self):
+        for path in (self.path, self.done_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def write_chunks(checkpoint):
+    """Update the checkpoint's pending chunks over WRITE_WORKERS threads."""
+    pending = [i for i in range(len(checkpoint.chunks)) if i not in checkpoint.done]
+    total_rows = sum(len(checkpoint.chunks[i]) for i in pending)
+    print(
+        f"\nWriting {total_rows} rows in {len(pending)} chunk(s) "
+        f"of up to {CHUNK_SIZE} over {WRITE_WORKERS} worker(s)..."
+    )
+
+    written = 0
+    failed_chunks = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+        futures = {pool.submit(update_chunk_with_retry, checkpoint.chunks[i]): i for i in pending}
+        for n, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            ok, error_message = future.result()
+            if ok:
+                checkpoint.mark(i)
+                written += len(checkpoint.chunks[i])
+            else:
+                failed_chunks += 1
+                print(f"  ERROR chunk {i} ({len(checkpoint.chunks[i])} rows): {error_message}")
+            if n % 10 == 0 or n == len(pending):
+                elapsed = max(time.monotonic() - started, 1e-9)
+                print(f"  {n}/{len(pending)} chunks | {written} rows | {written / elapsed:.0f} rows/s")
+
+    elapsed = time.monotonic() - started
+    return written, failed_chunks, elapsed
+
+
+# ------------------------------------------------------------
+# Loading
+# ------------------------------------------------------------
+
+def fetch_snapshots(apply_filters=None, label="", page_size=1000, observed_filter=True):
+    """
+    Observed snapshot rows matching apply_filters. Pass observed_filter=False
+    when apply_filters already carries the reconstructed-row exclusion inside
+    its own or().
+    """
+    rows = []
+    offset = 0
+    while True:
+        query = supabase.table("snapshots").select(SNAPSHOT_COLS)
+        if observed_filter:
+            query = query.or_(OBSERVED_ROWS)
+        if apply_filters is not None:
+            query = apply_filters(query)
+        batch = query.order("snapshot_id").range(offset, offset + page_size - 1).execute()
+        if not batch.data:
+            break
+        rows.extend(batch.data)
+        if label:
+            print(f"  {len(rows)} {label} rows fetched")
+        if len(batch.data) < page_size:
+            break
+        offset += page_size
+    return rows
+
+
+def find_watermark():
+    """Earliest snapshot_date with a row that was never enriched, or None."""
+    result = (
         supabase.table("snapshots")
-        .select(
-            "snapshot_id,snapshot_date,origin_iata,destination_iata,"
-            "outbound_date,return_date,dtd,price_gbp,jet_fuel_usd_gal"
-        )
-        .range(offset, offset + page_size - 1)
+        .select("snapshot_date")
+        .is_("season_bucket", "null")
+        .or_(OBSERVED_ROWS)
+        .order("snapshot_date")
+        .limit(1)
         .execute()
     )
-    if not batch.data:
-        break
-    rows.extend(batch.data)
-    print(f"  {len(rows)} rows fetched")
-    if len(batch.data) < page_size:
-        break
-    offset += page_size
-
-print(f"Total: {len(rows)}")
-if not rows:
-    print("ERROR: no rows")
-    sys.exit(1)
-
-df = pd.DataFrame(rows)
-original_ids = set(df["snapshot_id"].dropna())
-print(f"Unique snapshot_ids: {len(original_ids)}")
-
-print("Calendar features...")
-df["season_bucket"] = df["outbound_date"].apply(assign_season_bucket)
-df["days_to_next_bank_holiday"] = df["outbound_date"].apply(days_to_next_bh)
-df["trip_overlaps_holiday"] = df.apply(
-    lambda r: trip_overlaps(r["outbound_date"], r["return_date"]), axis=1
-)
-df["holiday_intensity_score"] = df["outbound_date"].apply(intensity)
-print(f"  seasons: {df['season_bucket'].value_counts().to_dict()}")
-
-print("Price position features...")
-df["dtd_bucket"] = pd.cut(
-    df["dtd"].astype(float),
-    bins=[-1, 7, 21, 60, 120, 9999],
-    labels=["0-7", "8-21", "22-60", "61-120", "120+"],
-)
-df["route"] = df["origin_iata"] + "-" + df["destination_iata"]
-baseline = (
-    df.groupby(["route", "dtd_bucket", "season_bucket"], observed=False)["price_gbp"]
-    .agg(baseline_mu="mean", baseline_sigma="std")
-    .reset_index()
-)
-baseline["baseline_sigma"] = baseline["baseline_sigma"].fillna(10.0).clip(lower=5.0)
-df = df.merge(
-    baseline,
-    on=["route", "dtd_bucket", "season_bucket"],
-    how="left",
-)
-df["price_z_score"] = (
-    (df["price_gbp"] - df["baseline_mu"]) / df["baseline_sigma"]
-).round(4)
-df["price_ratio"] = (df["price_gbp"] / df["baseline_mu"]).round(4)
-df["price_percentile"] = (
-    df.groupby(
-        ["route", "dtd_bucket", "season_bucket"],
-        observed=False,
-    )["price_gbp"]
-    .rank(pct=True)
-    .mul(100)
-    .clip(upper=100.0)
-    .round(2)
-)
+    return str(result.data[0]["snapshot_date"])[:10] if result.data else None
 
-df = df[df["snapshot_id"].isin(original_ids)].copy()
-print(f"  Rows after ID safety filter: {len(df)} (expected {len(original_ids)})")
-print(f"  price_z_score non-null: {df['price_z_score'].notna().sum()}")
-print(f"  season_bucket non-null: {df['season_bucket'].notna().sum()}")
 
-print("Momentum features...")
-df = df.sort_values(
-    ["origin_iata", "destination_iata", "outbound_date", "snapshot_date"]
-)
-key = ["origin_iata", "destination_iata", "outbound_date"]
-
-df["trend_3d"] = df.groupby(key)["price_gbp"].transform(
-    lambda x: x.pct_change(periods=min(3, max(1, len(x) - 1)))
-).round(4)
-df["trend_7d"] = df.groupby(key)["price_gbp"].transform(
-    lambda x: x.pct_change(periods=min(7, max(1, len(x) - 1)))
-).round(4)
-df["volatility_7d"] = df.groupby(key)["price_gbp"].transform(
-    lambda x: x.rolling(7, min_periods=2).std()
-).round(4)
-
-df["_up"] = df.groupby(key)["price_gbp"].transform(
-    lambda x: (x.diff() > 0).astype(float)
-)
-df["direction_consistency_7d"] = df.groupby(key)["_up"].transform(
-    lambda x: x.rolling(7, min_periods=2).mean()
-).round(3)
-df.drop(columns=["_up"], inplace=True)
-print(f"  trend_7d non-null: {df['trend_7d'].notna().sum()}")
-
-print("Fuel velocity...")
-df = df.sort_values("snapshot_date")
-fuel = df.groupby("snapshot_date")["jet_fuel_usd_gal"].first().reset_index()
-fuel["jet_fuel_7d_change_pct"] = fuel["jet_fuel_usd_gal"].pct_change(periods=7).round(4)
-df = df.merge(
-    fuel[["snapshot_date", "jet_fuel_7d_change_pct"]],
-    on="snapshot_date",
-    how="left",
-)
-df = df[df["snapshot_id"].isin(original_ids)].copy()
-print(
-    "  jet_fuel_7d_change_pct non-null: "
-    f"{df['jet_fuel_7d_change_pct'].notna().sum()}"
-)
-print(f"  Final row count: {len(df)}")
+def _or_batches(clauses):
+    for start in range(0, len(clauses), GROUP_BATCH):
+        yield ",".join(clauses[start:start + GROUP_BATCH])
 
-print(f"\nUpdating {len(df)} existing snapshot rows...")
-updated = 0
-errors = 0
 
-for _, row in df.iterrows():
-    sid = row["snapshot_id"]
-    if pd.isna(sid) or sid not in original_ids:
-        continue
+def fetch_group_history(watermark, groups):
+    """Observed rows before the watermark in the given baseline groups."""
+    bins = route_baseline.DTD_BINS
+    clauses = []
+    for route, bucket, season in groups:
+        origin, dest = route.split("-", 1)
+        i = route_baseline.DTD_LABELS.index(bucket)
+        clauses.append(
+            f"and(origin_iata.eq.{origin},destination_iata.eq.{dest},season_bucket.eq.{season},"
+            f"dtd.gt.{bins[i]},dtd.lte.{bins[i + 1]},or({OBSERVED_ROWS}))"
+        )
 
-    enrichment_columns = {}
-    for col in FEATURE_COLS:
-        if col in df.columns:
-            enrichment_columns[col] = clean_val(row[col], col)
-
-    ok, error_message = update_snapshot_with_retry(sid, enrichment_columns)
-    if ok:
-        updated += 1
-        if updated % 500 == 0 or updated == len(df):
-            print(f"  {updated}/{len(df)}")
-    else:
-        errors += 1
-        print(f"  ERROR snapshot_id {sid}: {error_message}")
+    rows = []
+    for clause in _or_batches(clauses):
+        rows.extend(
+            fetch_snapshots(
+                lambda q, c=clause: q.lt("snapshot_date", watermark).or_(c),
+                observed_filter=False,
+            )
+        )
+    return rows
+
+
+def fetch_cell_history(watermark, cells):
+    """Rows before the watermark in the given momentum cells."""
+    clauses = [
+        f"and(origin_iata.eq.{origin},destination_iata.eq.{dest},outbound_date.eq.{outbound},"
+        f"or({OBSERVED_ROWS}))"
+        for origin, dest, outbound in cells
+    ]
+
+    rows = []
+    for clause in _or_batches(clauses):
+        rows.extend(
+            fetch_snapshots(
+                lambda q, c=clause: q.lt("snapshot_date", watermark).or_(c),
+                observed_filter=False,
+            )
+        )
+    return rows
+
+
+def fetch_fuel_before(watermark, periods=FUEL_PERIODS):
+    """
+    First jet_fuel_usd_gal of each of the `periods` snapshot dates before the
+    watermark, so 7-date fuel changes from the watermark on match a full run.
+    """
+    daily = {}
+    cursor = watermark
+    for _ in range(periods):
+        result = (
+            supabase.table("snapshots")
+            .select("snapshot_date,jet_fuel_usd_gal")
+            .lt("snapshot_date", cursor)
+            .order("snapshot_date", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if not result.data:
+            break
+        cursor = str(result.data[0]["snapshot_date"])[:10]
+        fuel = result.data[0].get("jet_fuel_usd_gal")
+        if fuel is None:
+            priced = (
+                supabase.table("snapshots")
+                .select("jet_fuel_usd_gal")
+                .eq("snapshot_date", cursor)
+                .not_.is_("jet_fuel_usd_gal", "null")
+                .limit(1)
+                .execute()
+            ).data
+            fuel = priced[0]["jet_fuel_usd_gal"] if priced else None
+        daily[cursor] = fuel
+    return pd.Series(daily, dtype=float)
 
-print(f"\nDone. Updated: {updated} | Errors: {errors}")
 
-r1 = (
-    supabase.table("snapshots")
-    .select("snapshot_id", count="exact")
-    .not_.is_("price_z_score", "null")
-    .execute()
-)
-r2 = (
-    supabase.table("snapshots")
-    .select("snapshot_id", count="exact")
-    .not_.is_("season_bucket", "null")
-    .execute()
-)
-r3 = (
-    supabase.table("snapshots")
-    .select("snapshot_id", count="exact")
-    .not_.is_("trend_7d", "null")
-    .execute()
-)
-print(f"price_z_score populated: {r1.count}")
-print(f"season_bucket populated: {r2.count}")
-print(f"trend_7d populated:      {r3.count}")
-print(f"Total rows:              {len(df)}")
+# ------------------------------------------------------------
+# Features
+# ------------------------------------------------------------
 
-if errors > 0:
-    print(f"ENRICHMENT FAILED: {errors} row updates failed. Exiting 1.")
-    sys.exit(1)
+def add_keys(df):
+    for col, values in calendar_features(df["outbound_date"], df["return_date"]).items():
+        df[col] = values
+    df["dtd_bucket"] = route_baseline.dtd_buckets(df["dtd"])
+    df["route"] = df["origin_iata"] + "-" + df["destination_iata"]
+    return df
 
-if updated != len(df):
+
+def build_baselines(df, base=None):
+    """Daily baseline states of every group in df, starting from base."""
+    return route_baseline.accumulate(
+        df["route"], df["dtd_bucket"], df["season_bucket"],
+        df["snapshot_date"], df["price_gbp"], base,
+    )
+
+
+def add_price_position(df, baselines):
+    """Price position of each row against its group as of its snapshot_date."""
+    position = route_baseline.lookup(
+        baselines, df["route"], df["dtd_bucket"], df["season_bucket"],
+        df["price_gbp"], as_of=df["snapshot_date"],
+    )
+    df["baseline_mu"] = position["baseline_mu"]
+    df["baseline_sigma"] = position["baseline_sigma"]
+    df["price_z_score"] = np.round(position["price_z_score"], 4)
+    df["price_ratio"] = np.round(position["price_ratio"], 4)
+    df["price_percentile"] = np.round(np.minimum(position["price_percentile"], 100.0), 2)
+    return df
+
+
+def add_momentum(df):
+    df = df.sort_values(MOMENTUM_KEY + ["snapshot_date"])
+    groups = group_ids(df, MOMENTUM_KEY)
+    prices = df["price_gbp"].to_numpy(dtype=float)
+
+    df["trend_3d"] = np.round(capped_pct_change(prices, groups, 3), 4)
+    df["trend_7d"] = np.round(capped_pct_change(prices, groups, 7), 4)
+    df["volatility_7d"] = np.round(rolling_std(prices, groups, 7), 4)
+    df["direction_consistency_7d"] = np.round(rise_share(prices, groups, 7), 3)
+    return df
+
+
+def add_fuel_velocity(df, earlier_fuel=None):
+    daily = df.groupby("snapshot_date")["jet_fuel_usd_gal"].first()
+    if earlier_fuel is not None and len(earlier_fuel):
+        daily = pd.concat([earlier_fuel, daily[~daily.index.isin(earlier_fuel.index)]]).sort_index()
+    change = daily.pct_change(periods=FUEL_PERIODS).round(4)
+    df["jet_fuel_7d_change_pct"] = df["snapshot_date"].map(change)
+    return df
+
+
+def group_keys(df, key):
+    return sorted(set(map(tuple, df[key].dropna().astype(str).values)))
+
+
+def in_groups(df, key, keys):
+    complete = df[key].notna().all(axis=1)
+    index = pd.MultiIndex.from_frame(df[key].astype(str))
+    return pd.Series(index.isin(keys), index=df.index) & complete
+
+
+def changed_columns(df, scopes):
+    """
+    (snapshot_id, {column: value}) for every row where a recomputed feature
+    differs from the stored one. scopes maps column groups to boolean row
+    masks saying where that group was computed from complete history.
+    """
+    changes = {}
+    for cols, scope in scopes:
+        part = df.loc[scope, ["snapshot_id"] + cols + [f"stored_{c}" for c in cols]]
+        for record in part.to_dict("records"):
+            for col in cols:
+                value = clean_val(record[col], col)
+                if value != clean_val(record[f"stored_{col}"], col):
+                    changes.setdefault(record["snapshot_id"], {})[col] = value
+    return list(changes.items())
+
+
+def build_chunks(rows, changes):
+    """
+    update_snapshot_features payloads for the changed rows, CHUNK_SIZE per chunk.
+
+    Each payload is snapshot_id and every FEATURE_COLS column: the changed
+    features as recomputed, the rest as read. The RPC is a plain UPDATE, so
+    only feature columns are written and no insert row has to satisfy the
+    snapshots NOT NULL constraints.
+    """
+    by_id = {row["snapshot_id"]: row for row in rows}
+    payloads = [
+        {"snapshot_id": sid, **{col: by_id[sid].get(col) for col in FEATURE_COLS}, **columns}
+        for sid, columns in sorted(changes, key=lambda c: str(c[0]))
+    ]
+    return [payloads[i:i + CHUNK_SIZE] for i in range(0, len(payloads), CHUNK_SIZE)]
+
+
+def load_frame(rows):
+    df = pd.DataFrame(rows).drop_duplicates("snapshot_id")
+    df = df[df["snapshot_id"].notna()]
+    for col in FEATURE_COLS:
+        if col not in df.columns:
+            df[col] = None
+    df = df.rename(columns={col: f"stored_{col}" for col in FEATURE_COLS})
+    df["price_gbp"] = pd.to_numeric(df["price_gbp"], errors="coerce")
+    df["jet_fuel_usd_gal"] = pd.to_numeric(df["jet_fuel_usd_gal"], errors="coerce")
+    df["snapshot_date"] = df["snapshot_date"].astype(str).str[:10]
+    return df
+
+
+# ------------------------------------------------------------
+# Main
+# ------------------------------------------------------------
+
+def report(checkpoint, written, failed_chunks, elapsed):
+    total = sum(len(chunk) for chunk in checkpoint.chunks)
+    rate = written / elapsed if elapsed > 0 else 0.0
     print(
-        "ENRICHMENT FAILED: updated row count does not match calculated row count. "
-        "Exiting 1."
+        f"\nDone. Written: {written} rows | Failed chunks: {failed_chunks} | "
+        f"{elapsed:.1f}s | {rate:.0f} rows/s"
     )
-    sys.exit(1)
 
-print("ENRICHMENT SUCCESS: all calculated rows persisted.")
+    r1 = (
+        supabase.table("snapshots")
+        .select("snapshot_id", count="exact")
+        .not_.is_("price_z_score", "null")
+        .execute()
+    )
+    r2 = (
+        supabase.table("snapshots")
+        .select("snapshot_id", count="exact")
+        .not_.is_("season_bucket", "null")
+        .execute()
+    )
+    r3 = (
+        supabase.table("snapshots")
+        .select("snapshot_id", count="exact")
+        .not_.is_("trend_7d", "null")
+        .execute()
+    )
+    print(f"price_z_score populated: {r1.count}")
+    print(f"season_bucket populated: {r2.count}")
+    print(f"trend_7d populated:      {r3.count}")
+    print(f"Still missing features from: {find_watermark() or 'none'}")
+
+    if failed_chunks > 0:
+        print(
+            f"ENRICHMENT FAILED: {failed_chunks} chunk(s) failed; rerun today to resume "
+            f"from {checkpoint.path}. Exiting 1."
+        )
+        return 1
+
+    done_rows = sum(len(checkpoint.chunks[i]) for i in checkpoint.done)
+    if done_rows != total:
+        print(
+            "ENRICHMENT FAILED: written row count does not match changed row count. "
+            "Exiting 1."
+        )
+        return 1
+
+    checkpoint.clear()
+    print("ENRICHMENT SUCCESS: all changed rows persisted.")
+    return 0
+
+
+def main():
+    checkpoint = WriteCheckpoint(CHECKPOINT_PATH)
+    if checkpoint.load():
+        print(
+            f"Resuming {checkpoint.label} from {checkpoint.path}: "
+            f"{len(checkpoint.done)}/{len(checkpoint.chunks)} chunks already written"
+        )
+        status = report(checkpoint, *write_chunks(checkpoint))
+        if status:
+            return status
+        # Rows captured since the checkpoint was taken still need features.
+        print("\nPending chunks written; continuing with the watermark pass.")
+
+    watermark = None
+    store_ok = True
+    if MODE != "full":
+        watermark = SINCE or find_watermark()
+        if watermark is None:
+            print("Every snapshot already has features; nothing to do.")
+            return 0
+
+    if watermark is None:
+        print("Fetching snapshots (full)...")
+        rows = fetch_snapshots(label="snapshot")
+        if not rows:
+            print("ERROR: no rows")
+            return 1
+        df = add_keys(load_frame(rows))
+        baselines = build_baselines(df)
+        everything = pd.Series(True, index=df.index)
+        scopes = [
+            (CALENDAR_COLS, everything),
+            (BASELINE_COLS, everything),
+            (MOMENTUM_COLS, everything),
+            (FUEL_COLS, everything),
+        ]
+        earlier_fuel = None
+        label = "full run"
+    else:
+        print(f"Fetching snapshots on or after watermark {watermark}...")
+        new_rows = fetch_snapshots(lambda q: q.gte("snapshot_date", watermark), label="new")
+        if not new_rows:
+            print("No snapshots on or after the watermark; nothing to do.")
+            return 0
+        new = add_keys(load_frame(new_rows))
+        baseline_groups = group_keys(new, BASELINE_KEY)
+        cells = group_keys(new, MOMENTUM_KEY)
+        print(
+            f"  {len(new)} rows touch {len(baseline_groups)} baseline group(s) "
+            f"and {len(cells)} momentum cell(s)"
+        )
+
+        print("Loading stored baselines of touched groups...")
+        try:
+            base = route_baseline.base_states(supabase, baseline_groups, watermark)
+        except Exception as exc:
+            print(
+                f"  WARNING: route baseline store unavailable ({exc}); rebuilding touched "
+                "groups from history without saving (apply workers/route_baseline.sql)"
+            )
+            base, store_ok = {}, False
+        print(f"  {len(base)} of {len(baseline_groups)} groups have a stored baseline")
+
+        # A group without stored state may still have older fares; seed it
+        # from its full history, never from the rows after the watermark alone.
+        unseeded = [group for group in baseline_groups if group not in base]
+        group_history = fetch_group_history(watermark, unseeded) if unseeded else []
+        print(f"  {len(group_history)} history rows for {len(unseeded)} unseeded group(s)")
+
+        print("Fetching history of touched momentum cells...")
+        history = fetch_cell_history(watermark, cells)
+        print(f"  {len(history)} history rows")
+        rows = new_rows + history + group_history
+        df = add_keys(load_frame(rows))
+
+        # Stored groups already hold everything before the watermark.
+        fold_in = (df["snapshot_date"] >= watermark) | in_groups(df, BASELINE_KEY, unseeded)
+        baselines = build_baselines(df[fold_in], base)
+
+        scopes = [
+            (CALENDAR_COLS, pd.Series(True, index=df.index)),
+            (BASELINE_COLS, df["snapshot_date"] >= watermark),
+            (MOMENTUM_COLS, in_groups(df, MOMENTUM_KEY, cells)),
+            (FUEL_COLS, df["snapshot_date"] >= watermark),
+        ]
+        earlier_fuel = fetch_fuel_before(watermark)
+        label = f"incremental run from {watermark}"
+
+    print(f"Computing features for {len(df)} rows...")
+    print(f"  seasons: {df['season_bucket'].value_counts().to_dict()}")
+    df = add_price_position(df, baselines)
+    df = add_momentum(df)
+    df = add_fuel_velocity(df, earlier_fuel)
+    scopes = [(cols, scope.reindex(df.index)) for cols, scope in scopes]
+
+    if store_ok:
+        saved = route_baseline.save(supabase, baselines)
+        print(f"  {saved} daily baseline state(s) saved for {len(baselines.keys())} group(s)")
+
+    changes = changed_columns(df, scopes)
+    print(f"  {len(changes)} of {len(df)} rows have changed features")
+
+    checkpoint.start(build_chunks(rows, changes), label)
+    return report(checkpoint, *write_chunks(checkpoint))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+workers/atlas_capture_merge.py
+ATLAS — SHARDED CAPTURE MERGE
+
+Runs after every shard of atlas_snapshot_capture.py has finished. Reads
+each shard's checkpoint and checks the shards agreed on the run:
+- same snapshot date and capture time
+- same total plan size
+- planned route keys that do not overlap and together cover the plan
+
+It then checks the plan against the rows actually written to snapshots,
+prints the combined run summary and coverage matrix, and appends them to
+the GitHub job summary when GITHUB_STEP_SUMMARY is set. With sparse DTD
+sampling it also writes the run's reconstructed curve points, which no
+single shard can do because a route's DTDs are spread across shards.
+
+Env:
+- ATLAS_SHARD_COUNT        number of shards the capture ran with (default 1)
+- ATLAS_CHECKPOINT_DIR     folder holding the shard checkpoints (default .cache)
+- ATLAS_MIN_COVERAGE       written / planned below this fails the job (default 0.95)
+- ATLAS_DTD_TARGETS        as in the capture, for the coverage matrix
+- ATLAS_DTD_SAMPLE_SIZE    as in the capture; > 0 reconstructs unsampled DTDs (default 0)
+- ATLAS_RECONSTRUCT_MAX_AGE_DAYS  oldest price used as a curve knot (default 14)
+
+Exits non-zero on a missing shard, inconsistent plans or low coverage.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import datetime as dt
+from typing import Any, Dict, List, Tuple
+
+import atlas_snapshot_capture as capture
+from dtd_curve import RECONSTRUCTED_NOTE
+
+NOTE_STATUS = {
+    None: "success",
+    "no_calibration_population": "no_calibration_population",
+    "no_pareto_frontier": "no_pareto_frontier",
+    "no_credible_connecting_fare": "no_credible_connecting_fare",
+    "no_duffel_offers": "no_offers",
+    "rate_limited": "rate_limited",
+    "duffel_search_failed": "failed",
+}
+
+
+def load_shard_checkpoints(
+    directory: str,
+    shard_count: int,
+) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """Checkpoint contents by shard index, plus the shard indexes with no readable checkpoint."""
+    found: Dict[int, Dict[str, Any]] = {}
+    missing: List[int] = []
+    for shard_index in range(shard_count):
+        path = os.path.join(
+            directory, os.path.basename(capture.checkpoint_default_path(shard_index, shard_count))
+        )
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                found[shard_index] = json.load(f)
+        except Exception as ex:
+            print(f"Warning: shard {shard_index}: no checkpoint at {path} ({ex})")
+            missing.append(shard_index)
+    return found, missing
+
+
+def main() -> int:
+    shard_count = max(1, capture.env_int("ATLAS_SHARD_COUNT", 1))
+    checkpoint_dir = capture.env_str("ATLAS_CHECKPOINT_DIR", ".cache")
+    min_coverage = capture.env_float("ATLAS_MIN_COVERAGE", 0.95)
+    dtd_targets = capture.env_int_list("ATLAS_DTD_TARGETS", [14, 21, 30, 45, 60, 84])
+    dtd_sample_size = capture.env_int("ATLAS_DTD_SAMPLE_SIZE", 0)
+    reconstruct_max_age = capture.env_int("ATLAS_RECONSTRUCT_MAX_AGE_DAYS", 14)
+
+    print("=" * 70)
+    print(f"ATLAS CAPTURE MERGE ({shard_count} shard(s))")
+    print("=" * 70)
+
+    shards, missing = load_shard_checkpoints(checkpoint_dir, shard_count)
+    problems: List[str] = [f"shard {i} has no checkpoint" for i in missing]
+    if not shards:
+        print("No shard checkpoints found.")
+        return 1
+
+    runs = {(cp.get("snapshot_date"), cp.get("capture_time_utc")) for cp in shards.values()}
+    plan_totals = {cp.get("plan_total") for cp in shards.values()}
+    if len(runs) > 1:
+        problems.append(f"shards disagree on snapshot date / capture time: {sorted(runs)}")
+    if len(plan_totals) > 1:
+        problems.append(f"shards disagree on the total plan size: {sorted(plan_totals)}")
+    snapshot_date, capture_time = sorted(runs)[0]
+    plan_total = max(plan_totals)
+
+    owner: Dict[str, int] = {}
+    overlaps = 0
+    for shard_index, cp in sorted(shards.items()):
+        for key in cp.get("planned") or []:
+            if key in owner:
+                overlaps += 1
+            owner.setdefault(key, shard_index)
+    if overlaps:
+        problems.append(f"{overlaps} route(s) planned by more than one shard")
+    if not missing and len(owner) != plan_total:
+        problems.append(f"shard plans cover {len(owner)} route(s), the run planned {plan_total}")
+
+    supabase = capture.init_supabase()
+    rows = capture.fetch_run_rows(supabase, snapshot_date, capture_time)
+    written: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if row.get("notes") == RECONSTRUCTED_NOTE:
+            continue
+        key = capture.route_key(
+            row["origin_iata"], row["destination_iata"], str(row["outbound_date"])[:10], str(row["return_date"])[:10]
+        )
+        written[key] = row
+
+    covered = [key for key in owner if key in written]
+    coverage = len(covered) / plan_total if plan_total else 0.0
+    status_counts: Dict[str, int] = {}
+    for key in covered:
+        status = NOTE_STATUS.get(written[key].get("notes"), "other")
+        status_counts[status] = status_counts.get(status, 0) + 1
+    priced = sum(1 for key in covered if written[key].get("price_gbp") is not None)
+
+    print(f"Snapshot date: {snapshot_date}  capture time: {capture_time}")
+    print(f"\n{'shard':>5} {'planned':>8} {'written':>8} {'checkpointed':>13}")
+    shard_lines = []
+    for shard_index in range(shard_count):
+        cp = shards.get(shard_index)
+        if cp is None:
+            line = (shard_index, None, None, None)
+        else:
+            keys = cp.get("planned") or []
+            line = (
+                shard_index,
+                len(keys),
+                sum(1 for key in keys if key in written),
+                len(cp.get("completed") or []),
+            )
+        shard_lines.append(line)
+        print(
+            f"{line[0]:>5} {('-' if line[1] is None else line[1]):>8} "
+            f"{('-' if line[2] is None else line[2]):>8} {('-' if line[3] is None else line[3]):>13}"
+        )
+
+    print("\nRun summary:")
+    print(f"  planned    : {plan_total}")
+    print(f"  written    : {len(covered)} ({round(coverage * 100, 1)}%)")
+    print(f"  priced     : {priced}")
+    print(f"  fill pct   : {round(priced * 100.0 / len(covered), 1) if covered else 0.0}%")
+    print(f"  unplanned  : {len(written) - len(covered)} row(s) not in any shard plan")
+    for status, count in sorted(status_counts.items()):
+        print(f"  {status}: {count}")
+
+    matrix: Dict[capture.Cell, bool] = {}
+    for key in covered:
+        row = written[key]
+        matrix[(row["origin_iata"], row["destination_iata"], int(row["dtd"]))] = row.get("price_gbp") is not None
+    capture.print_coverage_matrix(capture.ATLAS_ORIGINS, capture.ATLAS_DESTINATIONS, dtd_targets, matrix)
+
+    if dtd_sample_size > 0 and shard_count > 1:
+        day = dt.date.fromisoformat(snapshot_date)
+        try:
+            history = capture.load_capture_history(
+                supabase,
+                capture.ATLAS_ORIGINS,
+                capture.ATLAS_DESTINATIONS,
+                since=day - dt.timedelta(days=reconstruct_max_age),
+                until=day,
+            )
+            new_rows, counts = capture.reconstruct_sparse_dtds(
+                rows, history, dtd_targets, day, capture_time, set(owner), reconstruct_max_age
+            )
+            writer = capture.SnapshotWriter(supabase, capture.CaptureCheckpoint("", day, capture_time))
+            for row, key in new_rows:
+                writer.add(row, key)
+            writer.flush()
+            print("\n" + capture.describe_reconstruction(writer.written, counts))
+        except Exception as ex:
+            problems.append(f"sparse DTD reconstruction failed: {ex}")
+
+    if coverage < min_coverage:
+        problems.append(f"coverage {coverage:.1%} is below {min_coverage:.0%}")
+
+    step_summary = os.getenv("GITHUB_STEP_SUMMARY")
+    if step_summary:
+        with open(step_summary, "a", encoding="utf-8") as f:
+            f.write(f"### Atlas capture {snapshot_date} {capture_time} ({shard_count} shard(s))\n\n")
+            f.write("| shard | planned | written | checkpointed |\n|---:|---:|---:|---:|\n")
+            for line in shard_lines:
+                f.write("| " + " | ".join("-" if v is None else str(v) for v in line) + " |\n")
+            f.write(
+                f"\nWritten {len(covered)}/{plan_total} ({coverage:.1%}), priced {priced}, "
+                + ", ".join(f"{status} {count}" for status, count in sorted(status_counts.items()))
+                + "\n"
+            )
+            for problem in problems:
+                f.write(f"\n- :x: {problem}")
+            f.write("\n")
+
+    print("=" * 70)
+    if problems:
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        return 1
+    print(f"OK: {len(covered)}/{plan_total} planned routes written across {shard_count} shard(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,6 +4,8 @@ import httpx
 from datetime import datetime, timezone, timedelta
 from supabase import create_client
 
+from dtd_curve import RECONSTRUCTED_NOTE
+
 SUPABASE_URL = os.environ["MIZAR_SUPABASE_URL"]
 SUPABASE_KEY = os.environ["MIZAR_SUPABASE_SERVICE_ROLE_KEY"]
 NOTION_TOKEN = os.environ["NOTION_TOKEN"]
@@ -122,6 +124,7 @@ snap_count_res = (
     sb.table("snapshots")
     .select("snapshot_date", count="exact")
     .eq("snapshot_date", today)
+    .or_(f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}")
     .execute()
 )
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+workers/atlas_dtd_backtest.py
+ATLAS — SPARSE DTD RECONSTRUCTION BACK-TEST
+
+Replays sparse DTD sampling (dtd_curve.py) over snapshots that were really
+searched. For every evaluation day and route, the DTDs the sparse schedule
+would have searched that day are treated as today's fresh prices, and every
+other DTD searched that day is held out and reconstructed from the fresh
+prices plus earlier captures from the days the schedule would have
+searched them, exactly as the capture would. With
+BACKTEST_SAMPLE_SIZE=0 each priced DTD is held out in turn against all the
+route's other prices that day (leave-one-out).
+
+The error of the reconstruction is reported overall, by method and by DTD,
+next to the naive alternative of reusing the DTD's last captured price,
+together with how often the error falls inside the band implied by the
+route's fit residual.
+Share within 10% matters most: rose/fell labels and price_ratio work on
+10% moves.
+
+Env:
+- BACKTEST_SAMPLE_SIZE            DTDs searched per route per day (default 2, 0 = leave-one-out)
+- BACKTEST_DAYS                   evaluation days ending yesterday (default 28)
+- BACKTEST_MAX_AGE_DAYS           oldest price used as a knot (default 14)
+- ATLAS_DTD_TARGETS               as in the capture
+"""
+
+from __future__ import annotations
+
+import math
+import datetime as dt
+from typing import Any, Dict, List, Optional, Tuple
+
+import atlas_snapshot_capture as capture
+from dtd_curve import METHODS, RECONSTRUCTED_NOTE, reconstruct_curve, sparse_dtd_targets
+
+Cell = Tuple[str, str, int]
+
+
+def load_priced_history(
+    supabase: Any,
+    since: dt.date,
+    until: dt.date,
+    dtd_targets: List[int],
+    page_size: int = 1000,
+) -> Dict[Cell, Dict[dt.date, float]]:
+    """Last real captured price per cell and snapshot date in [since, until)."""
+    series: Dict[Cell, Dict[dt.date, float]] = {}
+    start = 0
+    while True:
+        page = (
+            supabase.table("snapshots")
+            .select("origin_iata,destination_iata,dtd,snapshot_date,price_gbp,notes")
+            .in_("dtd", dtd_targets)
+            .gte("snapshot_date", str(since))
+            .lt("snapshot_date", str(until))
+            .gt("price_gbp", 0)
+            .order("snapshot_date")
+            .order("capture_time_utc")
+            .order("snapshot_id")
+            .range(start, start + page_size - 1)
+            .execute()
+        ).data or []
+        for row in page:
+            if row.get("notes") == RECONSTRUCTED_NOTE or row.get("dtd") is None:
+                continue
+            cell = (row["origin_iata"], row["destination_iata"], int(row["dtd"]))
+            day = dt.date.fromisoformat(str(row["snapshot_date"])[:10])
+            series.setdefault(cell, {})[day] = float(row["price_gbp"])
+        if len(page) < page_size:
+            break
+        start += page_size
+    return series
+
+
+def _last_before(
+    prices: Dict[dt.date, float],
+    day: dt.date,
+    sampled_on: Optional[Any] = None,
+) -> Optional[Tuple[float, int]]:
+    """(price, age in days) of the last capture before day, only counting days sampled_on(d) allows."""
+    earlier = [d for d in prices if d < day and (sampled_on is None or sampled_on(d))]
+    if not earlier:
+        return None
+    last = max(earlier)
+    return prices[last], (day - last).days
+
+
+def _summary(errors: List[float]) -> str:
+    """n, mean / median / p90 absolute % error, share within 10%, mean log bias."""
+    if not errors:
+        return f"{0:>6} {'-':>7} {'-':>7} {'-':>7} {'-':>7} {'-':>7}"
+    ape = sorted(abs(math.exp(e) - 1) * 100 for e in errors)
+    p90 = ape[min(len(ape) - 1, int(0.9 * len(ape)))]
+    within = sum(1 for v in ape if v <= 10) * 100.0 / len(ape)
+    bias = sum(errors) / len(errors) * 100
+    return (
+        f"{len(ape):>6} {sum(ape) / len(ape):>7.1f} {ape[len(ape) // 2]:>7.1f} "
+        f"{p90:>7.1f} {within:>7.1f} {bias:>+7.1f}"
+    )
+
+
+def main() -> int:
+    sample_size = capture.env_int("BACKTEST_SAMPLE_SIZE", 2)
+    days = capture.env_int("BACKTEST_DAYS", 28)
+    max_age = capture.env_int("BACKTEST_MAX_AGE_DAYS", 14)
+    dtd_targets = sorted(capture.env_int_list("ATLAS_DTD_TARGETS", [14, 21, 30, 45, 60, 84]))
+
+    until = dt.date.today()
+    first_day = until - dt.timedelta(days=days)
+    mode = "leave-one-out" if sample_size <= 0 else f"{sample_size} of {len(dtd_targets)} DTDs per route-day"
+
+    print("=" * 70)
+    print("ATLAS SPARSE DTD BACK-TEST")
+    print("=" * 70)
+    print(f"Evaluation: {first_day} .. {until - dt.timedelta(days=1)} ({mode}, knots up to {max_age} day(s) old)")
+
+    supabase = capture.init_supabase()
+    series = load_priced_history(supabase, first_day - dt.timedelta(days=max_age), until, dtd_targets)
+    print(f"Loaded {sum(len(s) for s in series.values())} priced snapshots over {len(series)} cell(s)")
+
+    by_route_day: Dict[Tuple[str, str, dt.date], Dict[int, float]] = {}
+    for (origin, dest, dtd), prices in series.items():
+        for day, price in prices.items():
+            if day >= first_day:
+                by_route_day.setdefault((origin, dest, day), {})[dtd] = price
+
+    errors: Dict[str, List[float]] = {method: [] for method in METHODS}
+    naive: List[float] = []
+    naive_paired: List[float] = []
+    by_dtd: Dict[int, List[float]] = {dtd: [] for dtd in dtd_targets}
+    held_out = anchored = banded = with_residual = 0
+    for (origin, dest, day), today in sorted(by_route_day.items()):
+        if sample_size > 0:
+            sampled = set(sparse_dtd_targets(origin, dest, dtd_targets, sample_size, day))
+            cases = [({t: p for t, p in today.items() if t in sampled}, t) for t in today if t not in sampled]
+        else:
+            cases = [({u: p for u, p in today.items() if u != t}, t) for t in today]
+
+        # Under sparse sampling a DTD only has prices from the days it was scheduled.
+        stale = {}
+        samples: List[Tuple[int, int, float]] = []
+        for dtd in dtd_targets:
+            prices = series.get((origin, dest, dtd), {})
+            sampled_on = None
+            if sample_size > 0:
+                sampled_on = lambda d, dtd=dtd: dtd in sparse_dtd_targets(origin, dest, dtd_targets, sample_size, d)
+            last = _last_before(prices, day, sampled_on)
+            if last is not None:
+                stale[dtd] = last
+            samples.extend(
+                (dtd, (day - d).days, price)
+                for d, price in prices.items()
+                if d < day and (sampled_on is None or sampled_on(d))
+            )
+
+        for fresh, target in cases:
+            held_out += 1
+            actual = today[target]
+            previous = stale.get(target)
+            if previous is not None and previous[1] <= max_age:
+                naive.append(math.log(previous[0]) - math.log(actual))
+            if not fresh:
+                continue
+            anchored += 1
+            estimates, residual = reconstruct_curve(dtd_targets, fresh, samples, max_age)
+            if target not in estimates:
+                continue
+            price, method = estimates[target]
+            error = math.log(price) - math.log(actual)
+            if not math.isnan(residual):
+                banded += int(abs(error) <= 1.645 * residual)
+                with_residual += 1
+            errors[method].append(error)
+            by_dtd[target].append(error)
+            if previous is not None and previous[1] <= max_age:
+                naive_paired.append(math.log(previous[0]) - math.log(actual))
+
+    reconstructed = [e for method in METHODS for e in errors[method]]
+    searches_saved = 0.0 if sample_size <= 0 else 1 - min(sample_size, len(dtd_targets)) / len(dtd_targets)
+    print(f"Held-out points: {held_out} ({anchored} with a fresh price on the same route and day)")
+    if sample_size > 0:
+        print(f"Searches per route-day: {min(sample_size, len(dtd_targets))} of {len(dtd_targets)} ({searches_saved:.0%} fewer)")
+
+    header = f"{'':<22} {'n':>6} {'mean %':>7} {'med %':>7} {'p90 %':>7} {'<=10%':>7} {'bias %':>7}"
+    print("\n" + header)
+    print(f"{'reconstructed':<22} {_summary(reconstructed)}")
+    for method in METHODS:
+        print(f"{'  ' + method:<22} {_summary(errors[method])}")
+    print(f"{'last price, same set':<22} {_summary(naive_paired)}")
+    print(f"{'last price, all':<22} {_summary(naive)}")
+    if with_residual:
+        print(
+            f"Residual estimate: {banded * 100.0 / with_residual:.1f}% of {with_residual} errors inside "
+            f"+/-1.645 x the route's fit residual (90% if calibrated)"
+        )
+
+    print(f"\n{'DTD':<22} {'n':>6} {'mean %':>7} {'med %':>7} {'p90 %':>7} {'<=10%':>7} {'bias %':>7}")
+    for dtd in dtd_targets:
+        print(f"{dtd:<22} {_summary(by_dtd[dtd])}")
+
+    print("=" * 70)
+    return 0 if reconstructed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
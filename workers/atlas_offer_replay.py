@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+workers/atlas_offer_replay.py
+ATLAS — OFFLINE REFERENCE-FARE POLICY REPLAY
+
+Re-runs the capture's reference-fare selection over archived offers
+(offer_archive.py) instead of paying for new Duffel searches. Each policy
+variant is one combination of the connecting max-slice ceiling and the
+European price ceiling; the first combination is the baseline the others
+are compared against. LCC detection can be re-tested by listing carrier
+codes that count as low-cost.
+
+Selection runs vectorised over the archive columns, so months of archives
+replay in seconds. A sample of searches is also pushed through the
+capture's own select_reference_fare() and must agree exactly. Both sides
+convert EUR/USD offers with the rates stored in each archive, as the
+capture did before selecting.
+
+Env:
+- REPLAY_ARCHIVE_DIR            archive folder (default .cache/atlas_offer_archive)
+- REPLAY_SINCE / REPLAY_UNTIL   snapshot date range, YYYY-MM-DD (optional)
+- REPLAY_CONNECTING_MAX_MINUTES ceilings to try (default 500)
+- REPLAY_EUROPEAN_CEILING_GBP   ceilings to try (default 800)
+- REPLAY_LCC_CODES              carrier codes treated as LCC (optional, e.g. FR,U2,W6,DY)
+- REPLAY_VERIFY_SEARCHES        searches checked against the capture code (default 500, 0 = off)
+
+Exits non-zero when the vectorised selection disagrees with the capture.
+"""
+
+from __future__ import annotations
+
+import time
+import datetime as dt
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+import atlas_snapshot_capture as capture
+from offer_archive import archive_fx, archive_paths, load_archive, load_columns
+
+STATUSES = [
+    "success",
+    "no_calibration_population",
+    "no_credible_connecting_fare",
+    "no_offers",
+]
+
+POLICY_COLUMNS = [
+    "search_offer_count",
+    "search_distance_km",
+    "offer_price",
+    "offer_currency",
+    "offer_lcc_present",
+    "offer_slice_start",
+    "offer_slice_count",
+    "slice_minutes",
+    "slice_segments",
+    "fx_currency",
+    "fx_rate",
+    "fx_signal_date",
+]
+
+
+def _date_env(name: str) -> Optional[dt.date]:
+    raw = capture.env_str(name)
+    if not raw:
+        return None
+    try:
+        return dt.date.fromisoformat(raw)
+    except ValueError:
+        print(f"Warning: ignoring {name}={raw!r}; expected YYYY-MM-DD")
+        return None
+
+
+def _first_per_search(search_ids: Any, keys: List[Any], mask: Any, n_searches: int) -> Any:
+    """Index of the first offer per search after sorting masked offers by keys (-1 when none)."""
+    picked = np.full(n_searches, -1, dtype=np.int64)
+    candidates = np.flatnonzero(mask)
+    if not len(candidates):
+        return picked
+    order = np.lexsort(tuple(key[candidates] for key in keys) + (search_ids[candidates],))
+    ranked = candidates[order]
+    first_search, first_at = np.unique(search_ids[ranked], return_index=True)
+    picked[first_search] = ranked[first_at]
+    return picked
+
+
+def gbp_prices(columns: Dict[str, Any]) -> Tuple[Any, Any]:
+    """
+    Offer prices in GBP: GBP offers as quoted, others converted with the
+    archive's rates exactly as FxRates.to_gbp() does in the capture, NaN
+    when there is no rate. Returns (prices, converted mask).
+    """
+    fx = archive_fx(columns)
+    price = columns["offer_price"].astype(np.float64, copy=True)
+    currency = columns["offer_currency"]
+    foreign = currency != "GBP"
+    price[foreign] = np.nan
+    converted = np.zeros(len(price), dtype=bool)
+    for code in fx.rates:
+        if code == "GBP":
+            continue
+        at = np.flatnonzero((currency == code) & ~np.isnan(columns["offer_price"]))
+        price[at] = [fx.to_gbp(p, code) for p in columns["offer_price"][at].tolist()]
+        converted[at] = True
+    return price, converted
+
+
+def select_reference_fares(
+    columns: Dict[str, Any],
+    connecting_max_minutes: int,
+    price_ceiling_gbp: float,
+    prices: Optional[Any] = None,
+) -> Tuple[Any, Any, Any]:
+    """
+    capture.select_reference_fare() for every search in one archive at once.
+
+    The cheapest direct calibration offer wins when there is one. Otherwise
+    the fastest connecting offer (cheapest among equally fast) is taken,
+    which is exactly the fastest point of the Pareto frontier the capture
+    builds. Ties fall to the earliest offer, as min() does in the capture.
+
+    Returns (status index into STATUSES, selected offer index or -1,
+    selected-is-direct) per search. prices are gbp_prices(columns)[0],
+    computed here when not passed.
+    """
+    counts = columns["search_offer_count"]
+    n_searches = len(counts)
+    search_ids = np.repeat(np.arange(n_searches), counts)
+    offer_ids = np.arange(len(search_ids))
+    price = gbp_prices(columns)[0] if prices is None else prices
+
+    # One padding slot lets offers without exactly two slices index safely.
+    minutes = np.append(columns["slice_minutes"], -1)
+    segments = np.append(columns["slice_segments"], 0)
+    two_slices = columns["offer_slice_count"] == 2
+    first = np.where(two_slices, columns["offer_slice_start"], len(minutes) - 1)
+    second = np.where(two_slices, columns["offer_slice_start"] + 1, len(minutes) - 1)
+    max_minutes = np.maximum(minutes[first], minutes[second])
+    durations_known = two_slices & (minutes[first] >= 0) & (minutes[second] >= 0)
+    direct = (segments[first] == 1) & (segments[second] == 1)
+
+    distance = columns["search_distance_km"][search_ids]
+    priced = ~np.isnan(price)
+    over_ceiling = (distance >= 0) & (distance < 3000) & (price > price_ceiling_gbp)
+    calibration = priced & durations_known & ~over_ceiling
+
+    direct_pick = _first_per_search(search_ids, [offer_ids, price], calibration & direct, n_searches)
+    connecting_pick = _first_per_search(
+        search_ids, [offer_ids, price, max_minutes], calibration & ~direct, n_searches
+    )
+
+    has_direct = direct_pick >= 0
+    selected = np.where(has_direct, direct_pick, connecting_pick)
+    # Index -1 (no pick) lands on the padding slot.
+    credible = has_direct | (
+        (connecting_pick >= 0) & (np.append(max_minutes, -1)[connecting_pick] <= connecting_max_minutes)
+    )
+
+    status = np.full(n_searches, STATUSES.index("no_calibration_population"), dtype=np.int8)
+    status[selected >= 0] = STATUSES.index("no_credible_connecting_fare")
+    status[credible] = STATUSES.index("success")
+    status[counts == 0] = STATUSES.index("no_offers")
+    return status, np.where(credible, selected, -1), has_direct
+
+
+def verify_against_capture(
+    path: str,
+    limit: int,
+    connecting_max_minutes: int,
+    price_ceiling_gbp: float,
+) -> int:
+    """Compare the first `limit` searches of one archive with the capture's own selection."""
+    columns = load_columns(path, POLICY_COLUMNS)
+    prices, _ = gbp_prices(columns)
+    status, selected, _ = select_reference_fares(columns, connecting_max_minutes, price_ceiling_gbp, prices)
+    fx = archive_fx(columns)
+    mismatches = 0
+    for i, search in enumerate(load_archive(path)[:limit]):
+        offers, _ = fx.normalise(search.offers)
+        result, expected = capture.select_reference_fare(
+            offers,
+            search.distance_km,
+            "economy",
+            search.complete,
+            connecting_max_minutes=connecting_max_minutes,
+            price_ceiling_gbp=price_ceiling_gbp,
+        )
+        expected = "no_calibration_population" if expected == "no_pareto_frontier" else expected
+        expected_price = result["price_gbp"] if result else None
+        price = float(prices[selected[i]]) if selected[i] >= 0 else None
+        if STATUSES[status[i]] != expected or price != expected_price:
+            mismatches += 1
+            print(
+                f"MISMATCH {search.snapshot_key}: capture={expected}/{expected_price} "
+                f"replay={STATUSES[status[i]]}/{price}"
+            )
+    return mismatches
+
+
+def main() -> int:
+    archive_dir = capture.env_str("REPLAY_ARCHIVE_DIR", ".cache/atlas_offer_archive")
+    since = _date_env("REPLAY_SINCE")
+    until = _date_env("REPLAY_UNTIL")
+    connecting_ceilings = capture.env_int_list(
+        "REPLAY_CONNECTING_MAX_MINUTES", [capture.CONNECTING_MAX_SLICE_MINUTES]
+    )
+    price_ceilings = capture.env_int_list(
+        "REPLAY_EUROPEAN_CEILING_GBP", [capture.EUROPEAN_PRICE_CEILING_GBP]
+    )
+    raw_lcc = capture.env_str("REPLAY_LCC_CODES")
+    lcc_codes: Set[str] = {code.strip().upper() for code in raw_lcc.split(",") if code.strip()}
+    verify_searches = capture.env_int("REPLAY_VERIFY_SEARCHES", 500)
+
+    print("=" * 70)
+    print("ATLAS OFFER REPLAY")
+    print("=" * 70)
+
+    paths = archive_paths(archive_dir, since, until)
+    if not paths:
+        print(f"No archives found in {archive_dir}")
+        return 1
+
+    started = time.perf_counter()
+    names = POLICY_COLUMNS + (["offer_carriers"] if lcc_codes else [])
+    archives = [load_columns(path, names) for path in paths]
+    n_searches = sum(len(columns["search_offer_count"]) for columns in archives)
+    n_offers = sum(len(columns["offer_price"]) for columns in archives)
+    print(
+        f"Loaded {len(paths)} archive(s): {n_searches} searches, {n_offers} offers "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+
+    lcc_flags = []
+    for columns in archives:
+        if lcc_codes:
+            carriers = columns["offer_carriers"].tolist()
+            lcc_flags.append(
+                np.array([any(code in lcc_codes for code in c.split("|")) for c in carriers], dtype=bool)
+            )
+        else:
+            lcc_flags.append(columns["offer_lcc_present"])
+    print(f"LCC detection: {'codes ' + ','.join(sorted(lcc_codes)) if lcc_codes else 'as captured'}")
+
+    archive_prices = [gbp_prices(columns) for columns in archives]
+    with_rates = [archive_fx(columns) for columns in archives if len(columns["fx_currency"])]
+    n_converted = sum(int(converted.sum()) for _, converted in archive_prices)
+    print(
+        f"FX: {len(with_rates)} of {len(archives)} archive(s) carry rates, {n_converted} offer(s) converted"
+        + (f"; latest {with_rates[-1]!r}" if with_rates else "")
+    )
+
+    print(
+        f"\n{'connecting':>10} {'ceiling':>8} {'success':>8} {'fill %':>7} "
+        f"{'direct':>7} {'pareto':>7} {'lcc':>6} {'fx':>6} {'median £':>9} {'changed':>8} {'ms':>7}"
+    )
+    baseline: Optional[Any] = None
+    outcomes: List[Tuple[int, int, Any]] = []
+    for connecting_max in connecting_ceilings:
+        for ceiling in price_ceilings:
+            policy_started = time.perf_counter()
+            statuses, prices, directs, lccs, fxs = [], [], [], [], []
+            for columns, lcc, (gbp, converted) in zip(archives, lcc_flags, archive_prices):
+                status, selected, has_direct = select_reference_fares(columns, connecting_max, ceiling, gbp)
+                statuses.append(status)
+                prices.append(np.append(gbp, np.nan)[selected])
+                directs.append(has_direct & (selected >= 0))
+                lccs.append(np.append(lcc, False)[selected])
+                fxs.append(np.append(converted, False)[selected])
+            status = np.concatenate(statuses)
+            price = np.concatenate(prices)
+            policy_ms = (time.perf_counter() - policy_started) * 1000
+
+            priced = ~np.isnan(price)
+            if baseline is None:
+                baseline = price
+            changed = int(np.sum(~((baseline == price) | (np.isnan(baseline) & np.isnan(price)))))
+            n_direct = int(np.concatenate(directs).sum())
+            median = round(float(np.median(price[priced])), 2) if priced.any() else "-"
+            fill_pct = round(float(priced.mean()) * 100.0, 1) if len(price) else 0.0
+            print(
+                f"{connecting_max:>10} {ceiling:>8} {int(priced.sum()):>8} {fill_pct:>7} "
+                f"{n_direct:>7} {int(priced.sum()) - n_direct:>7} {int(np.concatenate(lccs).sum()):>6} "
+                f"{int(np.concatenate(fxs).sum()):>6} {median:>9} {changed:>8} {policy_ms:>7.0f}"
+            )
+            outcomes.append((connecting_max, ceiling, np.bincount(status, minlength=len(STATUSES))))
+
+    print("\nStatus counts:")
+    for connecting_max, ceiling, counts in outcomes:
+        detail = ", ".join(f"{name}={int(n)}" for name, n in zip(STATUSES[1:], counts[1:]))
+        print(f"  {connecting_max}/{ceiling}: {detail}")
+
+    mismatches = 0
+    if verify_searches > 0:
+        for connecting_max in connecting_ceilings:
+            for ceiling in price_ceilings:
+                mismatches += verify_against_capture(paths[-1], verify_searches, connecting_max, ceiling)
+        print(
+            f"\nVerified {min(verify_searches, len(archives[-1]['search_offer_count']))} search(es) "
+            f"of {paths[-1]} per policy against the capture: {mismatches} mismatch(es)"
+        )
+
+    print("=" * 70)
+    print(f"Replay complete in {time.perf_counter() - started:.2f}s")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -19,6 +19,8 @@ from typing import Any
 
 from supabase import create_client
 
+from fx_rates import FxRates, load_fx_rates
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -48,6 +50,7 @@ DUFFEL_HEADERS = {
 RISE_THRESHOLD_PCT = 10.0
 HIGH_RISK_THRESHOLD = 0.70
 REQUEST_DELAY_S = 1.2
+FX_MAX_AGE_DAYS = 7
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -106,8 +109,15 @@ def cheapest_gbp_price(
     cabin_class: str = "economy",
     trip_type: str = "return",
     return_date: date | None = None,
-) -> tuple[float | None, str | None]:
-    """Search Duffel for the cheapest GBP offer on the given route/date."""
+    fx: FxRates | None = None,
+) -> tuple[float | None, str | None, str | None]:
+    """
+    Search Duffel for the cheapest GBP offer on the given route/date.
+
+    With fx, offers quoted in a currency it has a rate for compete at their
+    GBP conversion. Returns (price, duffel_search_id, fx_currency) where
+    fx_currency is the quoted currency when the cheapest offer was converted.
+    """
 
     cabin_map = {
         "economy": "economy",
@@ -151,28 +161,36 @@ def cheapest_gbp_price(
         duffel_search_id = response.get("data", {}).get("id")
 
     if response is None:
-        return None, duffel_search_id
+        return None, duffel_search_id, None
 
     offers = response.get("data", {}).get("offers", [])
 
     if not offers:
-        return None, duffel_search_id
+        return None, duffel_search_id, None
 
-    gbp_prices: list[float] = []
+    gbp_prices: list[tuple[float, str | None]] = []
 
     for offer in offers:
-        if offer.get("total_currency") != "GBP":
+        currency = offer.get("total_currency")
+
+        if currency != "GBP" and (fx is None or not fx.supports(currency)):
             continue
 
         try:
-            gbp_prices.append(float(offer["total_amount"]))
+            amount = float(offer["total_amount"])
         except (KeyError, TypeError, ValueError):
             continue
 
+        if currency == "GBP":
+            gbp_prices.append((amount, None))
+        else:
+            gbp_prices.append((fx.to_gbp(amount, currency), currency))
+
     if not gbp_prices:
-        return None, duffel_search_id
+        return None, duffel_search_id, None
 
-    return min(gbp_prices), duffel_search_id
+    price, fx_currency = min(gbp_prices, key=lambda item: item[0])
+    return price, duffel_search_id, fx_currency
 
 
 # ------------------------------------------------------------
@@ -308,6 +326,7 @@ def write_verification(
     regret_risk_score: float | None,
     failure_reason: str | None,
     duffel_search_id: str | None = None,
+    verification_method: str = "duffel_api",
 ) -> None:
     now_iso = datetime.now(timezone.utc).isoformat()
     status = "failed"
@@ -353,7 +372,7 @@ def write_verification(
             "price_change_pct": round(change_pct, 2),
             "ground_truth_rose": ground_truth_rose,
             "prediction_outcome": outcome,
-            "verification_method": "duffel_api",
+            "verification_method": verification_method,
             "failure_reason": None,
             "duffel_search_id": duffel_search_id,
         }
@@ -385,10 +404,19 @@ def run() -> None:
         log.info("No eligible decisions. Exiting.")
         return
 
+    fx: FxRates | None = None
+
+    try:
+        fx = load_fx_rates(supabase, datetime.now(timezone.utc).date(), FX_MAX_AGE_DAYS)
+        log.info("FX rates: %s", fx)
+    except Exception as exc:
+        log.warning("FX rates unavailable, only GBP offers will be used: %s", exc)
+
     success = 0
     failed = 0
     unavailable = 0
     skipped = 0
+    converted = 0
 
     for decision in decisions:
         decision_id = decision["decision_id"]
@@ -469,13 +497,14 @@ def run() -> None:
             f"£{price_shown:.2f}" if price_shown is not None else "NULL",
         )
 
-        price_t7, duffel_search_id = cheapest_gbp_price(
+        price_t7, duffel_search_id, fx_currency = cheapest_gbp_price(
             origin=origin,
             destination=destination,
             outbound_date=outbound_dt,
             cabin_class=cabin_class,
             trip_type=trip_type,
             return_date=return_dt,
+            fx=fx,
         )
 
         if price_t7 is not None and price_shown is not None and price_shown > 0:
@@ -483,15 +512,25 @@ def run() -> None:
             outcome = classify_outcome(score, change_pct >= RISE_THRESHOLD_PCT)
 
             log.info(
-                "Result %s | t+7=£%.2f | change=%.1f%% | outcome=%s",
+                "Result %s | t+7=£%.2f%s | change=%.1f%% | outcome=%s",
                 decision_id,
                 price_t7,
+                f" (from {fx_currency})" if fx_currency else "",
                 change_pct,
                 outcome,
             )
 
             success += 1
-            write_verification(decision_id, price_t7, price_shown, score, None, duffel_search_id)
+            converted += int(fx_currency is not None)
+            write_verification(
+                decision_id,
+                price_t7,
+                price_shown,
+                score,
+                None,
+                duffel_search_id,
+                "duffel_api_fx" if fx_currency else "duffel_api",
+            )
 
         else:
             log.warning("No valid GBP price returned for %s.", decision_id)
@@ -501,8 +540,9 @@ def run() -> None:
         time.sleep(REQUEST_DELAY_S)
 
     log.info(
-        "Done. Success=%d Failed=%d Unavailable=%d Skipped=%d Total=%d",
+        "Done. Success=%d (FX-converted %d) Failed=%d Unavailable=%d Skipped=%d Total=%d",
         success,
+        converted,
         failed,
         unavailable,
         skipped,
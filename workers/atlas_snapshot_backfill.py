@@ -39,6 +39,8 @@ WHAT IT DOES:
 - Only updates rows where price_t7 is NULL (idempotent)
 - Processes newest-first in batches of 500 rows
 - Skips crisis-contaminated rows and permanently excluded rows
+- Never matches against reconstructed DTD-curve rows (notes =
+  'reconstructed_dtd_curve'); labels come from real searches only
 
 NOTE ON training_action = 'exclude':
 - Set via direct SQL for routes where no t+7 snapshot ever existed
@@ -59,6 +61,8 @@ from dataclasses import dataclass
 
 from supabase import create_client, Client
 
+RECONSTRUCTED_NOTE = "reconstructed_dtd_curve"
+
 
 def env_str(name: str, default: str = "") -> str:
     v = os.getenv(name)
@@ -157,6 +161,7 @@ def build_route_price_index(
                     .select("origin_iata, destination_iata, price_gbp")
                     .eq("snapshot_date", target_str)
                     .gt("price_gbp", 0)
+                    .or_(f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}")
                     .limit(PAGE_SIZE)
                     .offset(offset)
                     .execute()
@@ -17,25 +17,48 @@ Improvements in v2.3:
 - Per-slice short-haul duration ceiling
 - European-route absolute price ceiling
 - Flagged NULL snapshot when no valid offer remains
+- Optional cheapest-first paged offer fetch (ATLAS_DUFFEL_FETCH_MODE=paged)
+- Optional concurrent capture with AIMD rate control (ATLAS_MAX_CONCURRENCY>1)
+- Chunked upserts on snapshot_key with a resumable same-day checkpoint
+  (snapshot_key_unique.sql adds the unique index they conflict on)
+- Deadline-aware: stops dispatching before ATLAS_DEADLINE_SECONDS
+- Stratified deterministic scheduling over a rolling origin × destination × DTD cycle
+- Optional per-route revisit intervals from price volatility (ATLAS_ADAPTIVE_REVISIT=true)
+- Compact per-run .npz archive of every offer for offline policy replay
+- Optional hash sharding across runners (ATLAS_SHARD_INDEX / ATLAS_SHARD_COUNT)
+- Optional sparse DTD sampling with reconstructed curve points (ATLAS_DTD_SAMPLE_SIZE)
+- EUR/USD offers converted to GBP at the stored daily rates instead of discarded
+  (quoted currency kept in fx_source_currency; snapshot_fx_source.sql adds it)
 """
 
 from __future__ import annotations
 
 import os
 import json
+import zlib
 import time
 import math
-import random
 import datetime as dt
-import statistics
-import re
-from uuid import uuid4
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from uuid import NAMESPACE_URL, uuid5
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from supabase import create_client, Client
 
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from fx_rates import FxRates, load_fx_rates
+from dtd_curve import METHODS, RECONSTRUCTED_NOTE, reconstruct_curve, sparse_dtd_targets
+from offer_archive import OfferArchive
+from offer_summary import OfferSummary, summarise_offers, supplier_codes
+
 
 # -------------------------------------------------
 # ENV HELPERS
@@ -264,43 +287,86 @@ def check_crisis_flags(snapshot_date: dt.date, destination_iata: str, crisis_eve
 # SHI CALCULATION
 # -------------------------------------------------
 
-def shi_variance_calculation(
+SHI_MIN_HISTORY = 5
+SHI_Z_THRESHOLD = 2.5
+
+PriceKey = Tuple[str, str, str, str]
+
+
+@dataclass
+class PriceStats:
+    """Running count / mean / M2 (Welford) of past snapshot prices for one trip."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, price: float) -> None:
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def load_shi_stats(
     supabase: Client,
-    origin: str,
-    dest: str,
-    outbound_date: dt.date,
-    return_date: dt.date,
-    current_price: float,
-) -> Tuple[str, Optional[float]]:
-    """Calculate SHI z-score. Returns (flag, z_score)."""
-    try:
-        result = (
+    origins: List[str],
+    destinations: List[str],
+    outbound_dates: List[dt.date],
+    page_size: int = 1000,
+) -> Dict[PriceKey, PriceStats]:
+    """
+    Price statistics for every trip the run may capture, built from one
+    paginated pass over snapshots instead of one select per search.
+    """
+    stats: Dict[PriceKey, PriceStats] = {}
+    start = 0
+    while True:
+        page = (
             supabase.table("snapshots")
-            .select("price_gbp")
-            .eq("origin_iata", origin)
-            .eq("destination_iata", dest)
-            .eq("outbound_date", str(outbound_date))
-            .eq("return_date", str(return_date))
+            .select("origin_iata,destination_iata,outbound_date,return_date,price_gbp,notes")
+            .in_("origin_iata", origins)
+            .in_("destination_iata", destinations)
+            .in_("outbound_date", [str(d) for d in outbound_dates])
             .not_.is_("price_gbp", "null")
+            .order("snapshot_id")
+            .range(start, start + page_size - 1)
             .execute()
-        )
-
-        prices = [float(row["price_gbp"]) for row in result.data if row.get("price_gbp")]
-
-        if len(prices) < 5:
-            return ("INSUFFICIENT_DATA", None)
+        ).data or []
+        for row in page:
+            if not row.get("price_gbp") or row.get("notes") == RECONSTRUCTED_NOTE:
+                continue
+            key = (
+                row["origin_iata"],
+                row["destination_iata"],
+                str(row["outbound_date"])[:10],
+                str(row["return_date"])[:10],
+            )
+            stats.setdefault(key, PriceStats()).add(float(row["price_gbp"]))
+        if len(page) < page_size:
+            break
+        start += page_size
+    return stats
 
-        mean_price = statistics.mean(prices)
-        stdev_price = statistics.stdev(prices)
 
-        if stdev_price == 0:
-            return ("OK", 0.0)
+def shi_variance_calculation(
+    price_stats: Optional[PriceStats],
+    current_price: float,
+) -> Tuple[str, Optional[float]]:
+    """Calculate SHI z-score from prefetched price statistics. Returns (flag, z_score)."""
+    if price_stats is None or price_stats.count < SHI_MIN_HISTORY:
+        return ("INSUFFICIENT_DATA", None)
 
-        z_score = abs((current_price - mean_price) / stdev_price)
-        return ("HIGH_VARIANCE" if z_score > 2.5 else "OK", z_score)
+    stdev_price = price_stats.stdev
+    if stdev_price == 0:
+        return ("OK", 0.0)
 
-    except Exception:
-        return ("INSUFFICIENT_DATA", None)
+    z_score = abs((current_price - price_stats.mean) / stdev_price)
+    return ("HIGH_VARIANCE" if z_score > SHI_Z_THRESHOLD else "OK", z_score)
 
 
 # -------------------------------------------------
@@ -348,21 +414,6 @@ def _is_rate_limited(response: Optional[requests.Response], exc: Exception) -> b
     return False
 
 
-def parse_iso8601_duration_minutes(value: Any) -> Optional[int]:
-    """Convert Duffel ISO-8601 duration strings such as PT2H35M into minutes."""
-    if not value or not isinstance(value, str):
-        return None
-
-    match = re.fullmatch(r"P(?:(?P<days>\d+)D)?T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?", value)
-    if not match:
-        return None
-
-    days = int(match.group("days") or 0)
-    hours = int(match.group("hours") or 0)
-    minutes = int(match.group("minutes") or 0)
-    return days * 1440 + hours * 60 + minutes
-
-
 # TEMPORARY GOVERNANCE BOUNDARY:
 # 500 minutes is an interim safety ceiling for connecting-market fallback.
 # It is NOT a calibrated or validated model parameter. Review after 7 days
@@ -371,84 +422,515 @@ CONNECTING_MAX_SLICE_MINUTES = 500
 EUROPEAN_PRICE_CEILING_GBP = 800
 
 
-def _offer_metrics(
-    offer: Dict[str, Any],
+def _in_calibration_population(
+    offer: OfferSummary,
     distance_km: Optional[int],
-) -> Optional[Dict[str, Any]]:
+    price_ceiling_gbp: float = EUROPEAN_PRICE_CEILING_GBP,
+) -> bool:
     """
-    Return comparable metrics for a plausible GBP return offer.
+    True for a plausible GBP return offer.
 
     This deliberately does NOT impose the legacy directness or 240-minute
     duration rules. It establishes the calibration population from which
     direct or connecting reference fares are selected.
     """
-    try:
-        if offer.get("total_currency", "GBP") != "GBP":
-            return None
+    if not offer.is_gbp:
+        return False
+    if len(offer.slice_minutes) != 2 or offer.max_slice_minutes is None:
+        return False
+    if distance_km is not None and distance_km < 3000:
+        if offer.price > price_ceiling_gbp:
+            return False
+    return True
 
-        price_gbp = float(offer["total_amount"])
-        slices = offer.get("slices") or []
-        if len(slices) != 2:
-            return None
-
-        slice_durations = []
-        for slice_ in slices:
-            duration_minutes = parse_iso8601_duration_minutes(slice_.get("duration"))
-            if duration_minutes is None:
-                return None
-            slice_durations.append(duration_minutes)
-
-        if distance_km is not None and distance_km < 3000:
-            if price_gbp > EUROPEAN_PRICE_CEILING_GBP:
-                return None
 
-        direct = all(len(slice_.get("segments") or []) == 1 for slice_ in slices)
+def _pareto_mask(prices: List[float], durations: List[int]) -> List[bool]:
+    """
+    Sort-and-sweep non-domination test, O(n log n).
 
-        return {
-            "offer": offer,
-            "price_gbp": price_gbp,
-            "direct": direct,
-            "max_slice_duration": max(slice_durations),
-        }
-    except Exception:
-        return None
+    After sorting by (price, duration), an offer survives when it is the
+    fastest at its price and strictly faster than every cheaper offer.
+    """
+    n = len(prices)
+    if np is not None:
+        p = np.asarray(prices, dtype=float)
+        d = np.asarray(durations, dtype=float)
+        order = np.lexsort((d, p))
+        p_sorted = p[order]
+        d_sorted = d[order]
+        group_start = np.searchsorted(p_sorted, p_sorted, side="left")
+        fastest_at_price = d_sorted[group_start]
+        running_fastest = np.minimum.accumulate(d_sorted)
+        fastest_cheaper = np.where(
+            group_start > 0, running_fastest[np.maximum(group_start - 1, 0)], np.inf
+        )
+        keep = np.empty(n, dtype=bool)
+        keep[order] = (d_sorted == fastest_at_price) & (d_sorted < fastest_cheaper)
+        return keep.tolist()
+
+    order = sorted(range(n), key=lambda i: (prices[i], durations[i]))
+    keep = [False] * n
+    fastest_cheaper = math.inf
+    i = 0
+    while i < n:
+        j = i
+        while j < n and prices[order[j]] == prices[order[i]]:
+            j += 1
+        fastest_at_price = durations[order[i]]
+        for k in order[i:j]:
+            keep[k] = durations[k] == fastest_at_price and durations[k] < fastest_cheaper
+        fastest_cheaper = min(fastest_cheaper, fastest_at_price)
+        i = j
+    return keep
 
 
 def _pareto_frontier(
-    candidates: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
+    candidates: List[OfferSummary],
+) -> List[OfferSummary]:
     """
-    Return non-dominated connecting offers on price and max-slice duration.
+    Return non-dominated connecting offers on price and max-slice duration,
+    in their original order.
 
     Offer A dominates B when A is no more expensive and no slower than B,
     with at least one strict improvement.
     """
-    frontier = []
+    mask = _pareto_mask(
+        [candidate.price for candidate in candidates],
+        [candidate.max_slice_minutes for candidate in candidates],
+    )
+    return [candidate for candidate, keep in zip(candidates, mask) if keep]
 
-    for candidate in candidates:
-        dominated = False
 
-        for other in candidates:
-            if other is candidate:
-                continue
+def select_reference_fare(
+    offers: List[OfferSummary],
+    distance_km: Optional[int],
+    cabin_class: str,
+    complete: bool,
+    connecting_max_minutes: int = CONNECTING_MAX_SLICE_MINUTES,
+    price_ceiling_gbp: float = EUROPEAN_PRICE_CEILING_GBP,
+    warn_label: Optional[str] = None,
+) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Apply the reference-fare policy to one search's offers.
 
-            no_worse_price = other["price_gbp"] <= candidate["price_gbp"]
-            no_worse_duration = (
-                other["max_slice_duration"] <= candidate["max_slice_duration"]
-            )
-            strictly_better = (
-                other["price_gbp"] < candidate["price_gbp"]
-                or other["max_slice_duration"] < candidate["max_slice_duration"]
+    Shared by search_duffel and the offline archive replay, which varies
+    the ceilings. Warnings are printed only when warn_label is given.
+    """
+    if not offers:
+        return None, "no_offers"
+
+    offer_count = len(offers) if complete else None
+
+    offer_prices = [offer.price for offer in offers if offer.is_gbp]
+
+    cheapest_offer_gbp = min(offer_prices) if offer_prices else None
+    most_expensive_offer_gbp = max(offer_prices) if offer_prices and complete else None
+
+    calibration_population = [
+        offer
+        for offer in offers
+        if _in_calibration_population(offer, distance_km, price_ceiling_gbp)
+    ]
+
+    base_null_result = {
+        "price_gbp": None,
+        "currency": "GBP",
+        "fx_source_currency": None,
+        "offer_count": offer_count,
+        "cheapest_offer_gbp": cheapest_offer_gbp,
+        "most_expensive_offer_gbp": most_expensive_offer_gbp,
+        "carrier_count": None,
+        "lcc_present": None,
+        "direct": None,
+        "stops": None,
+        "cabin_class": cabin_class,
+        "carrier_primary_iata": None,
+        "reference_fare_type": None,
+        "connecting_pareto_frontier_size": 0,
+        "connecting_max_slice_minutes": None,
+    }
+
+    if not calibration_population:
+        if warn_label:
+            print(
+                f"Warning: no calibration population for {warn_label}; "
+                f"raw_offers={len(offers)} distance_km={distance_km}"
             )
+        return base_null_result, "no_calibration_population"
 
-            if no_worse_price and no_worse_duration and strictly_better:
-                dominated = True
-                break
+    direct_candidates = [
+        candidate
+        for candidate in calibration_population
+        if candidate.direct
+    ]
 
-        if not dominated:
-            frontier.append(candidate)
+    if direct_candidates:
+        selected = min(
+            direct_candidates,
+            key=lambda candidate: candidate.price,
+        )
+        reference_fare_type = "direct"
+        frontier_size = None
+        connecting_max_slice_minutes = None
+    else:
+        connecting_candidates = [
+            candidate
+            for candidate in calibration_population
+            if not candidate.direct
+        ]
 
-    return frontier
+        frontier = _pareto_frontier(connecting_candidates)
+
+        if not frontier:
+            if warn_label:
+                print(
+                    f"Warning: no Pareto frontier for {warn_label}; "
+                    f"calibration_offers={len(calibration_population)}"
+                )
+            return base_null_result, "no_pareto_frontier"
+
+        selected = min(
+            frontier,
+            key=lambda candidate: (
+                candidate.max_slice_minutes,
+                candidate.price,
+            ),
+        )
+
+        fastest_minutes = selected.max_slice_minutes
+
+        if fastest_minutes > connecting_max_minutes:
+            if warn_label:
+                print(
+                    f"Warning: no credible connecting fare for {warn_label}; "
+                    f"fastest_pareto_max_slice={fastest_minutes} "
+                    f"temporary_ceiling={connecting_max_minutes} "
+                    f"frontier_size={len(frontier)}"
+                )
+
+            result = dict(base_null_result)
+            result["connecting_pareto_frontier_size"] = len(frontier)
+            result["connecting_max_slice_minutes"] = fastest_minutes
+            return result, "no_credible_connecting_fare"
+
+        reference_fare_type = "connecting_pareto"
+        frontier_size = len(frontier)
+        connecting_max_slice_minutes = fastest_minutes
+
+    return {
+        "price_gbp": selected.price,
+        "currency": "GBP",
+        "fx_source_currency": selected.fx_currency,
+        "offer_count": offer_count,
+        "cheapest_offer_gbp": cheapest_offer_gbp,
+        "most_expensive_offer_gbp": most_expensive_offer_gbp,
+        "carrier_count": len(selected.carriers),
+        "lcc_present": selected.lcc_present,
+        "direct": selected.direct,
+        "stops": selected.max_slice_stops,
+        "cabin_class": cabin_class,
+        "carrier_primary_iata": selected.primary_carrier,
+        "reference_fare_type": reference_fare_type,
+        "connecting_pareto_frontier_size": frontier_size,
+        "connecting_max_slice_minutes": connecting_max_slice_minutes,
+    }, "success"
+
+
+DUFFEL_OFFER_REQUESTS_URL = "https://api.duffel.com/air/offer_requests"
+DUFFEL_OFFERS_URL = "https://api.duffel.com/air/offers"
+
+FETCH_MODES = {"inline", "paged"}
+
+
+@dataclass
+class FetchStats:
+    """Response size, parse time and search latency, for comparing fetch modes."""
+
+    mode: str = "inline"
+    searches: int = 0
+    responses: int = 0
+    response_bytes: int = 0
+    parse_seconds: float = 0.0
+    truncated_searches: int = 0
+    latencies: List[float] = field(default_factory=list)
+    suppliers: List[int] = field(default_factory=list)
+    gbp_retries: int = 0
+    gbp_rescued: int = 0
+    fx_offers: int = 0
+    fx_searches: int = 0
+    fx_rescued: int = 0
+    fx_selected: int = 0
+    # Searches left for supplier-timeout retries; None leaves them uncapped.
+    retry_room: Optional[int] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def read_json(self, response: requests.Response) -> Dict[str, Any]:
+        started = time.perf_counter()
+        body = response.json()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.parse_seconds += elapsed
+            self.responses += 1
+            self.response_bytes += len(response.content or b"")
+        return body
+
+    def record_search(self, latency_s: float, suppliers: int, complete: bool) -> None:
+        with self.lock:
+            self.latencies.append(latency_s)
+            self.suppliers.append(suppliers)
+            self.searches += 1
+            if not complete:
+                self.truncated_searches += 1
+
+    def take_retry(self) -> bool:
+        """Claim one search of retry_room for a retry; False once it is spent."""
+        with self.lock:
+            if self.retry_room is None:
+                return True
+            if self.retry_room <= 0:
+                return False
+            self.retry_room -= 1
+            return True
+
+    def record_gbp_retry(self, rescued: bool) -> None:
+        with self.lock:
+            if rescued:
+                self.gbp_rescued += 1
+            else:
+                self.gbp_retries += 1
+
+    def record_fx(self, converted: int, rescued: bool, selected: bool) -> None:
+        with self.lock:
+            self.fx_offers += converted
+            self.fx_searches += 1
+            self.fx_rescued += int(rescued)
+            self.fx_selected += int(selected)
+
+
+def _retry_delay_seconds(response: Optional[requests.Response]) -> Optional[float]:
+    """Seconds Duffel asked us to wait, from Retry-After or ratelimit-reset."""
+    if response is None:
+        return None
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    reset = response.headers.get("ratelimit-reset")
+    if reset:
+        try:
+            return max(0.0, (parsedate_to_datetime(reset) - dt.datetime.now(dt.timezone.utc)).total_seconds())
+        except Exception:
+            return None
+    return None
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent searches.
+
+    Each clean search adds increase/limit, so the limit grows by about
+    `increase` per full window of searches. A 429, or a response showing
+    ratelimit-remaining of 0, multiplies it by `decrease` (at most once per
+    cooldown) and holds new searches until Duffel's reset time.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        default_backoff_s: float = 2.0,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.default_backoff_s = default_backoff_s
+        self.peak = self.limit
+        self.in_flight = 0
+        self.requests = 0
+        self.throttles = 0
+        self.paused_until = 0.0
+        self._no_decrease_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def wait_clear(self) -> None:
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    return
+                self._cond.wait(timeout=wait)
+
+    def observe(self, response: requests.Response) -> None:
+        with self._cond:
+            self.requests += 1
+        if response.status_code == 429:
+            self.on_throttle(_retry_delay_seconds(response))
+        elif str(response.headers.get("ratelimit-remaining", "")).strip() == "0":
+            self._pause(_retry_delay_seconds(response) or 0.0)
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self.peak = max(self.peak, self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self, delay_s: Optional[float]) -> None:
+        delay_s = self.default_backoff_s if delay_s is None else delay_s
+        with self._cond:
+            self.throttles += 1
+            now = time.monotonic()
+            if now >= self._no_decrease_until:
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+                self._no_decrease_until = now + max(1.0, delay_s)
+        self._pause(delay_s)
+
+    def _pause(self, delay_s: float) -> None:
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay_s)
+            self._cond.notify_all()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _supplier_count(offers: List[OfferSummary]) -> int:
+    return len(supplier_codes(offers))
+
+
+def _http_timeout(supplier_timeout_ms: int) -> float:
+    return supplier_timeout_ms / 1000.0 + 15.0
+
+
+def _selection_settled(
+    page_offers: List[OfferSummary],
+    distance_km: Optional[int],
+) -> bool:
+    """
+    True once later (more expensive) pages cannot change the reference fare.
+
+    Pages arrive sorted by total_amount, so the first plausible direct offer
+    is the cheapest direct, and once prices pass the European ceiling no
+    further offer can join the calibration population.
+    """
+    for offer in page_offers:
+        if offer.direct and _in_calibration_population(offer, distance_km):
+            return True
+
+    if distance_km is not None and distance_km < 3000:
+        gbp_prices = [offer.price for offer in page_offers if offer.is_gbp]
+        if gbp_prices and max(gbp_prices) > EUROPEAN_PRICE_CEILING_GBP:
+            return True
+
+    return False
+
+
+def _observe(rate_control: Optional[AimdController], response: requests.Response) -> None:
+    if rate_control is not None:
+        rate_control.observe(response)
+    response.raise_for_status()
+
+
+def _fetch_offers_inline(
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    stats: FetchStats,
+    supplier_timeout_ms: int,
+    rate_control: Optional[AimdController] = None,
+) -> Tuple[List[OfferSummary], bool]:
+    response = requests.post(
+        DUFFEL_OFFER_REQUESTS_URL,
+        params={"supplier_timeout": supplier_timeout_ms},
+        headers=headers,
+        json=payload,
+        timeout=_http_timeout(supplier_timeout_ms),
+    )
+    _observe(rate_control, response)
+    data = stats.read_json(response)
+    return summarise_offers(data.get("data", {}).get("offers", [])), True
+
+
+def _fetch_offers_paged(
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    stats: FetchStats,
+    distance_km: Optional[int],
+    page_size: int,
+    max_pages: int,
+    supplier_timeout_ms: int,
+    rate_control: Optional[AimdController] = None,
+) -> Tuple[List[OfferSummary], bool]:
+    """
+    Create the offer request without inline offers, then page /air/offers
+    cheapest first until the direct/Pareto selection is settled.
+
+    Returns (offers, complete); complete is False when paging stopped early.
+    """
+    response = requests.post(
+        DUFFEL_OFFER_REQUESTS_URL,
+        params={"return_offers": "false", "supplier_timeout": supplier_timeout_ms},
+        headers=headers,
+        json=payload,
+        timeout=_http_timeout(supplier_timeout_ms),
+    )
+    _observe(rate_control, response)
+    offer_request_id = stats.read_json(response)["data"]["id"]
+
+    offers: List[OfferSummary] = []
+    after = None
+    for _ in range(max(1, max_pages)):
+        params: Dict[str, Any] = {
+            "offer_request_id": offer_request_id,
+            "sort": "total_amount",
+            "limit": page_size,
+        }
+        if after:
+            params["after"] = after
+
+        response = requests.get(
+            DUFFEL_OFFERS_URL,
+            headers=headers,
+            params=params,
+            timeout=_http_timeout(supplier_timeout_ms),
+        )
+        _observe(rate_control, response)
+        body = stats.read_json(response)
+
+        page_offers = summarise_offers(body.pop("data", None) or [])
+        offers.extend(page_offers)
+        after = (body.get("meta") or {}).get("after")
+
+        if not after or not page_offers:
+            return offers, True
+        if _selection_settled(page_offers, distance_km):
+            return offers, False
+
+    return offers, False
 
 
 def search_duffel(
@@ -459,6 +941,14 @@ def search_duffel(
     cabin_class: str,
     duffel_token: str,
     max_attempts: int = 3,
+    fetch_stats: Optional[FetchStats] = None,
+    page_size: int = 50,
+    max_pages: int = 10,
+    supplier_timeout_ms: int = 20000,
+    retry_supplier_timeout_ms: int = 0,
+    rate_control: Optional[AimdController] = None,
+    archive: Optional[OfferArchive] = None,
+    fx: Optional[FxRates] = None,
 ) -> Tuple[Optional[Dict[str, Any]], str]:
     """
     Search Duffel and select a route-representative reference fare.
@@ -472,6 +962,24 @@ def search_duffel(
     - Reject the connecting reference when its max slice exceeds the
       temporary 500-minute safety boundary.
 
+    In paged fetch mode only as many cheapest-first pages are pulled as the
+    selection needs. offer_count and most_expensive_offer_gbp are then
+    unknown and stored as NULL rather than as partial values.
+
+    supplier_timeout_ms bounds how long Duffel waits for slow airlines. When
+    offers come back but none is in GBP or a currency fx converts, the search
+    is repeated once with retry_supplier_timeout_ms (if longer) before being
+    classified, provided stats.retry_room has a search left for it. An empty
+    answer is final.
+
+    With fx, offers in a currency it has a rate for are converted to GBP
+    before selection. The result's currency stays GBP and fx_source_currency
+    records the selected offer's quoted currency. The archive keeps the
+    offers as quoted, alongside the run's rates.
+
+    With rate_control, 429s wait for the controller's shared pause instead
+    of the fixed backoff ladder, and every response feeds its AIMD limit.
+
     Returns:
         (result, status)
 
@@ -485,7 +993,7 @@ def search_duffel(
             "failed",
         }
     """
-    url = "https://api.duffel.com/air/offer_requests"
+    stats = fetch_stats or FetchStats()
     headers = {
         "Duffel-Version": "v2",
         "Authorization": f"Bearer {duffel_token}",
@@ -507,158 +1015,68 @@ def search_duffel(
     distance_km = route_distance_km(origin, dest)
 
     for attempt in range(1, max_attempts + 1):
-        response = None
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            offers = data.get("data", {}).get("offers", [])
-            if not offers:
-                return None, "no_offers"
-
-            offer_prices = []
-            for offer in offers:
-                total = offer.get("total_amount")
-                currency = offer.get("total_currency", "GBP")
-                if total and currency == "GBP":
-                    try:
-                        offer_prices.append(float(total))
-                    except Exception:
-                        pass
-
-            cheapest_offer_gbp = min(offer_prices) if offer_prices else None
-            most_expensive_offer_gbp = max(offer_prices) if offer_prices else None
-
-            calibration_population = []
-            for offer in offers:
-                metrics = _offer_metrics(offer, distance_km)
-                if metrics is not None:
-                    calibration_population.append(metrics)
-
-            base_null_result = {
-                "price_gbp": None,
-                "currency": "GBP",
-                "offer_count": len(offers),
-                "cheapest_offer_gbp": cheapest_offer_gbp,
-                "most_expensive_offer_gbp": most_expensive_offer_gbp,
-                "carrier_count": None,
-                "lcc_present": None,
-                "direct": None,
-                "stops": None,
-                "cabin_class": cabin_class,
-                "carrier_primary_iata": None,
-                "reference_fare_type": None,
-                "connecting_pareto_frontier_size": 0,
-                "connecting_max_slice_minutes": None,
-            }
-
-            if not calibration_population:
-                print(
-                    f"Warning: no calibration population for {origin}->{dest} "
-                    f"{outbound}; raw_offers={len(offers)} distance_km={distance_km}"
-                )
-                return base_null_result, "no_calibration_population"
-
-            direct_candidates = [
-                candidate
-                for candidate in calibration_population
-                if candidate["direct"]
-            ]
-
-            if direct_candidates:
-                selected_metrics = min(
-                    direct_candidates,
-                    key=lambda candidate: candidate["price_gbp"],
-                )
-                reference_fare_type = "direct"
-                frontier_size = None
-                connecting_max_slice_minutes = None
-            else:
-                connecting_candidates = [
-                    candidate
-                    for candidate in calibration_population
-                    if not candidate["direct"]
-                ]
-
-                frontier = _pareto_frontier(connecting_candidates)
-
-                if not frontier:
-                    print(
-                        f"Warning: no Pareto frontier for {origin}->{dest} "
-                        f"{outbound}; calibration_offers={len(calibration_population)}"
+            started = time.monotonic()
+            timeouts = [supplier_timeout_ms]
+            if retry_supplier_timeout_ms > supplier_timeout_ms:
+                timeouts.append(retry_supplier_timeout_ms)
+
+            for timeout_ms in timeouts:
+                if stats.mode == "paged":
+                    offers, complete = _fetch_offers_paged(
+                        headers, payload, stats, distance_km, page_size, max_pages, timeout_ms,
+                        rate_control,
                     )
-                    return base_null_result, "no_pareto_frontier"
-
-                selected_metrics = min(
-                    frontier,
-                    key=lambda candidate: (
-                        candidate["max_slice_duration"],
-                        candidate["price_gbp"],
-                    ),
+                else:
+                    offers, complete = _fetch_offers_inline(headers, payload, stats, timeout_ms, rate_control)
+                if any(offer.currency == "GBP" or (fx and fx.supports(offer.currency)) for offer in offers):
+                    if timeout_ms != supplier_timeout_ms:
+                        stats.record_gbp_retry(rescued=True)
+                    break
+                # Only offers nobody can price call for a longer wait; the
+                # retry is a search of its own and needs room in the budget.
+                if not offers or timeout_ms == timeouts[-1] or not stats.take_retry():
+                    break
+                stats.record_gbp_retry(rescued=False)
+
+            stats.record_search(time.monotonic() - started, _supplier_count(offers), complete)
+            if rate_control is not None:
+                rate_control.on_success()
+
+            if archive is not None:
+                archive.add(origin, dest, outbound, return_date, distance_km, offers, complete)
+
+            native_gbp = any(offer.is_gbp for offer in offers)
+            converted = 0
+            if fx:
+                offers, converted = fx.normalise(offers)
+
+            result, status = select_reference_fare(
+                offers,
+                distance_km,
+                cabin_class,
+                complete,
+                warn_label=f"{origin}->{dest} {outbound}",
+            )
+            if converted:
+                stats.record_fx(
+                    converted,
+                    rescued=status == "success" and not native_gbp,
+                    selected=status == "success" and result["fx_source_currency"] is not None,
                 )
-
-                fastest_minutes = selected_metrics["max_slice_duration"]
-
-                if fastest_minutes > CONNECTING_MAX_SLICE_MINUTES:
-                    print(
-                        f"Warning: no credible connecting fare for {origin}->{dest} "
-                        f"{outbound}; fastest_pareto_max_slice={fastest_minutes} "
-                        f"temporary_ceiling={CONNECTING_MAX_SLICE_MINUTES} "
-                        f"frontier_size={len(frontier)}"
-                    )
-
-                    result = dict(base_null_result)
-                    result["connecting_pareto_frontier_size"] = len(frontier)
-                    result["connecting_max_slice_minutes"] = fastest_minutes
-                    return result, "no_credible_connecting_fare"
-
-                reference_fare_type = "connecting_pareto"
-                frontier_size = len(frontier)
-                connecting_max_slice_minutes = fastest_minutes
-
-            selected = selected_metrics["offer"]
-
-            return {
-                "price_gbp": float(selected["total_amount"]),
-                "currency": selected["total_currency"],
-                "offer_count": len(offers),
-                "cheapest_offer_gbp": cheapest_offer_gbp,
-                "most_expensive_offer_gbp": most_expensive_offer_gbp,
-                "carrier_count": len(
-                    set(
-                        seg["marketing_carrier"]["iata_code"]
-                        for slice_ in selected["slices"]
-                        for seg in slice_["segments"]
-                    )
-                ),
-                "lcc_present": any(
-                    seg["marketing_carrier"].get("name", "").lower()
-                    in ["ryanair", "easyjet", "wizz air", "norwegian"]
-                    for slice_ in selected["slices"]
-                    for seg in slice_["segments"]
-                ),
-                "direct": all(
-                    len(slice_.get("segments") or []) == 1
-                    for slice_ in selected["slices"]
-                ),
-                "stops": max(
-                    len(slice_.get("segments") or []) - 1
-                    for slice_ in selected["slices"]
-                ),
-                "cabin_class": cabin_class,
-                "carrier_primary_iata": (
-                    selected["slices"][0]["segments"][0]["marketing_carrier"]["iata_code"]
-                ),
-                "reference_fare_type": reference_fare_type,
-                "connecting_pareto_frontier_size": frontier_size,
-                "connecting_max_slice_minutes": connecting_max_slice_minutes,
-            }, "success"
+            return result, status
 
         except Exception as ex:
-            is_429 = _is_rate_limited(response, ex)
+            is_429 = _is_rate_limited(getattr(ex, "response", None), ex)
 
             if is_429 and attempt < max_attempts:
+                if rate_control is not None:
+                    print(
+                        f"Warning: Duffel 429 for {origin}->{dest} {outbound} "
+                        f"(attempt {attempt}/{max_attempts}). Concurrency now {int(rate_control.limit)}"
+                    )
+                    rate_control.wait_clear()
+                    continue
                 sleep_for = backoffs[min(attempt - 1, len(backoffs) - 1)]
                 print(
                     f"Warning: Duffel 429 for {origin}->{dest} {outbound} "
@@ -680,11 +1098,736 @@ def search_duffel(
     return None, "failed"
 
 
+# -------------------------------------------------
+# CHECKPOINT + CHUNKED WRITES
+# -------------------------------------------------
+
+def route_key(origin: str, dest: str, outbound: dt.date, return_date: dt.date) -> str:
+    return f"{origin}_{dest}_{outbound}_{return_date}"
+
+
+# snapshot_id is derived from snapshot_key, so re-upserting a row on
+# snapshot_key (checkpoint resume, merge rerun) never rewrites its primary key.
+SNAPSHOT_ID_NAMESPACE = uuid5(NAMESPACE_URL, "atlas/snapshots")
+
+
+def snapshot_id_for(snapshot_key: str) -> str:
+    return str(uuid5(SNAPSHOT_ID_NAMESPACE, snapshot_key))
+
+
+def checkpoint_default_path(shard_index: int = 0, shard_count: int = 1) -> str:
+    if shard_count > 1:
+        return f".cache/atlas_capture_checkpoint_shard{shard_index}of{shard_count}.json"
+    return ".cache/atlas_capture_checkpoint.json"
+
+
+class CaptureCheckpoint:
+    """
+    Route keys already written for today's capture, kept in a local JSON file.
+
+    A rerun on the same snapshot date picks up the original capture_time, so
+    its snapshot_keys match the first attempt's and upserts stay idempotent.
+    A checkpoint from an earlier day, or from a different shard layout, is
+    ignored. The file also records this shard's planned keys and the size
+    of the whole run's plan, which the merge step checks coverage against.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        snapshot_date: dt.date,
+        capture_time: str,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ) -> None:
+        self.path = path
+        self.snapshot_date = str(snapshot_date)
+        self.capture_time = capture_time
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.completed: set = set()
+        self.planned: List[str] = []
+        self.plan_total = 0
+        self.resumed = False
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if (
+                    saved.get("snapshot_date") == self.snapshot_date
+                    and saved.get("shard_index", 0) == shard_index
+                    and saved.get("shard_count", 1) == shard_count
+                ):
+                    self.capture_time = saved.get("capture_time_utc") or capture_time
+                    self.completed = set(saved.get("completed") or [])
+                    self.resumed = True
+            except Exception as ex:
+                print(f"Warning: ignoring unreadable checkpoint {path}: {ex}")
+
+    def set_plan(self, keys: List[str], plan_total: int) -> None:
+        self.planned = list(keys)
+        self.plan_total = plan_total
+        self._save()
+
+    def mark(self, keys: List[str]) -> None:
+        self.completed.update(keys)
+        self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "snapshot_date": self.snapshot_date,
+                    "capture_time_utc": self.capture_time,
+                    "shard_index": self.shard_index,
+                    "shard_count": self.shard_count,
+                    "plan_total": self.plan_total,
+                    "planned": self.planned,
+                    "completed": sorted(self.completed),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+
+class SnapshotWriter:
+    """
+    Buffers snapshot rows and upserts them on snapshot_key in chunks.
+
+    Route keys are checkpointed only after their chunk is written, so a
+    crash can at worst repeat the searches of one unwritten chunk.
+    """
+
+    def __init__(
+        self,
+        supabase: Client,
+        checkpoint: CaptureCheckpoint,
+        chunk_size: int = 25,
+        max_attempts: int = 3,
+    ) -> None:
+        self.supabase = supabase
+        self.checkpoint = checkpoint
+        self.chunk_size = max(1, chunk_size)
+        self.max_attempts = max(1, max_attempts)
+        self.rows: List[Dict[str, Any]] = []
+        self.keys: List[str] = []
+        self.written = 0
+        self.priced = 0
+        self.chunks = 0
+
+    def add(self, row: Dict[str, Any], key: str) -> None:
+        self.rows.append(row)
+        self.keys.append(key)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        backoffs = [2.0, 5.0, 10.0]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.supabase.table("snapshots").upsert(self.rows, on_conflict="snapshot_key").execute()
+                break
+            except Exception as ex:
+                if attempt == self.max_attempts:
+                    print(f"Upsert failed after {attempt} attempt(s): {ex}")
+                    raise
+                sleep_for = backoffs[min(attempt - 1, len(backoffs) - 1)]
+                print(f"Warning: upsert failed ({ex}); retrying in {sleep_for:.1f}s")
+                time.sleep(sleep_for)
+
+        self.written += len(self.rows)
+        self.priced += sum(1 for row in self.rows if row.get("price_gbp") is not None)
+        self.chunks += 1
+        self.checkpoint.mark(self.keys)
+        self.rows = []
+        self.keys = []
+
+
+# Route-level columns a reconstructed row copies from a real row of the same route and run.
+ROUTE_TEMPLATE_COLUMNS = [
+    "snapshot_date",
+    "capture_time_utc",
+    "origin_iata",
+    "destination_iata",
+    "day_of_week_snapshot",
+    "is_school_holiday_window",
+    "is_bank_holiday_adjacent",
+    "cabin_class",
+    "origin_type",
+    "crisis_flag",
+    "crisis_id",
+    "crisis_severity",
+    "crisis_route_affected",
+    "crisis_global_impact",
+    "crisis_contamination_pct_t14",
+    "crisis_contamination_pct_t7",
+    "crisis_label_contaminated",
+    "jet_fuel_usd_gal",
+    "route_distance_km",
+    "route_type",
+    "model_version",
+]
+
+RUN_ROW_COLUMNS = ROUTE_TEMPLATE_COLUMNS + ["dtd", "outbound_date", "return_date", "price_gbp", "notes"]
+
+
+def fetch_run_rows(
+    supabase: Client,
+    snapshot_date: dt.date,
+    capture_time: str,
+    page_size: int = 1000,
+) -> List[Dict[str, Any]]:
+    """Every snapshot row written by one capture run (all shards), reconstructed rows included."""
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        page = (
+            supabase.table("snapshots")
+            .select(",".join(RUN_ROW_COLUMNS))
+            .eq("snapshot_date", str(snapshot_date))
+            .eq("capture_time_utc", capture_time)
+            .order("snapshot_id")
+            .range(start, start + page_size - 1)
+            .execute()
+        ).data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+        start += page_size
+    return rows
+
+
+# -------------------------------------------------
+# CAPTURE SCHEDULER
+# -------------------------------------------------
+
+Route = Tuple[str, str, dt.date, dt.date, str]
+
+ATLAS_ORIGINS = ["MAN", "LGW", "LHR", "EDI", "BRS", "LPL", "BHX", "NCL", "GLA"]
+ATLAS_DESTINATIONS = [
+    "AMS", "CDG", "BCN", "DUB", "FCO", "MAD", "ATH", "LIS", "AGP", "PMI",
+    "FAO", "NCE", "VCE", "MXP", "PRG", "CPH", "ARN", "OSL", "VIE", "ZRH",
+]
+
+
+Cell = Tuple[str, str, int]
+
+
+RouteId = Tuple[str, str]
+
+
+@dataclass
+class CellHistory:
+    last_captured: Optional[dt.date] = None
+    no_offer_streak: int = 0
+    last_price: Optional[float] = None
+    prices: List[Tuple[dt.date, float]] = field(default_factory=list)
+    abs_change_sum: float = 0.0
+    changes: int = 0
+    labelled: int = 0
+    moves: int = 0
+
+
+def cell_route(cell: Cell, snapshot_date: dt.date) -> Route:
+    origin, dest, dtd = cell
+    outbound = snapshot_date + dt.timedelta(days=dtd)
+    return (origin, dest, outbound, outbound + dt.timedelta(days=7), "economy")
+
+
+def shard_of(cell: Cell, shard_count: int) -> int:
+    """Stable shard for an origin/destination/DTD cell: CRC32 of its key, the same on every run and day."""
+    origin, dest, dtd = cell
+    return zlib.crc32(f"{origin}_{dest}_{dtd}".encode()) % max(1, shard_count)
+
+
+def load_capture_history(
+    supabase: Client,
+    origins: List[str],
+    destinations: List[str],
+    since: dt.date,
+    until: dt.date,
+    page_size: int = 1000,
+) -> Dict[Cell, CellHistory]:
+    """
+    When each origin/destination/DTD cell was last captured in [since, until),
+    how many of its most recent captures in a row returned no offers, how
+    much its price moved between consecutive captures, and how many of its
+    labelled rows rose or fell 10%. Reconstructed rows are not captures and
+    are skipped.
+    """
+    history: Dict[Cell, CellHistory] = {}
+    start = 0
+    while True:
+        page = (
+            supabase.table("snapshots")
+            .select("origin_iata,destination_iata,dtd,snapshot_date,notes,price_gbp,rose_10pct,fell_10pct")
+            .in_("origin_iata", origins)
+            .in_("destination_iata", destinations)
+            .gte("snapshot_date", str(since))
+            .lt("snapshot_date", str(until))
+            .order("snapshot_date")
+            .order("capture_time_utc")
+            .order("snapshot_id")
+            .range(start, start + page_size - 1)
+            .execute()
+        ).data or []
+        for row in page:
+            if row.get("dtd") is None or row.get("notes") == RECONSTRUCTED_NOTE:
+                continue
+            cell = (row["origin_iata"], row["destination_iata"], int(row["dtd"]))
+            entry = history.setdefault(cell, CellHistory())
+            entry.last_captured = dt.date.fromisoformat(str(row["snapshot_date"])[:10])
+            if row.get("notes") == "no_duffel_offers":
+                entry.no_offer_streak += 1
+            else:
+                entry.no_offer_streak = 0
+            if row.get("price_gbp"):
+                price = float(row["price_gbp"])
+                if entry.last_price:
+                    entry.abs_change_sum += abs(price - entry.last_price) / entry.last_price
+                    entry.changes += 1
+                entry.last_price = price
+                entry.prices.append((entry.last_captured, price))
+            if row.get("rose_10pct") is not None:
+                entry.labelled += 1
+                entry.moves += int(bool(row.get("rose_10pct")) or bool(row.get("fell_10pct")))
+        if len(page) < page_size:
+            break
+        start += page_size
+    return history
+
+
+def revisit_intervals(
+    history: Dict[Cell, CellHistory],
+    base_days: float,
+    min_days: float,
+    max_days: float,
+    prior_weight: float = 5.0,
+) -> Tuple[Dict[RouteId, float], Dict[RouteId, float], float]:
+    """
+    Revisit interval in days per origin/destination route.
+
+    Each route's label rate (share of labelled rows that rose or fell 10%)
+    and mean absolute price move between captures are shrunk towards the
+    fleet averages by prior_weight pseudo-observations, then expressed
+    relative to those averages. A route scoring twice the fleet is revisited
+    twice as often as base_days, within [min_days, max_days].
+    Returns (intervals, smoothed label rates, fleet label rate).
+    """
+    routes: Dict[RouteId, List[float]] = {}
+    for (origin, dest, _), entry in history.items():
+        agg = routes.setdefault((origin, dest), [0.0, 0.0, 0.0, 0.0])
+        agg[0] += entry.labelled
+        agg[1] += entry.moves
+        agg[2] += entry.changes
+        agg[3] += entry.abs_change_sum
+
+    labelled = sum(agg[0] for agg in routes.values())
+    changes = sum(agg[2] for agg in routes.values())
+    fleet_label = sum(agg[1] for agg in routes.values()) / labelled if labelled else 0.0
+    fleet_move = sum(agg[3] for agg in routes.values()) / changes if changes else 0.0
+
+    intervals: Dict[RouteId, float] = {}
+    label_rates: Dict[RouteId, float] = {}
+    for route, (n_labelled, n_moves, n_changes, move_sum) in routes.items():
+        label_rate = (n_moves + prior_weight * fleet_label) / (n_labelled + prior_weight)
+        mean_move = (move_sum + prior_weight * fleet_move) / (n_changes + prior_weight)
+        label_rates[route] = label_rate
+
+        parts = []
+        if fleet_label > 0:
+            parts.append(label_rate / fleet_label)
+        if fleet_move > 0:
+            parts.append(mean_move / fleet_move)
+        score = sum(parts) / len(parts) if parts else 1.0
+        interval = base_days / score if score > 0 else max_days
+        intervals[route] = min(max_days, max(min_days, interval))
+    return intervals, label_rates, fleet_label
+
+
+def t7_match_rates(
+    cells: List[Cell],
+    max_searches: int,
+    intervals: Optional[Dict[RouteId, float]] = None,
+) -> Dict[RouteId, float]:
+    """
+    Chance per route that a capture today is matched by one of the same
+    route exactly 7 days later, which the outcome backfill needs to label it.
+
+    Each cell comes due every `period` days: its interval (uniform when
+    intervals is None) scaled so a day's captures fill max_searches. A cell
+    whose period divides 7 matches itself; otherwise the match needs one of
+    the route's other cells to fall due that day, 1 in period each.
+    """
+    counts: Dict[RouteId, int] = {}
+    for origin, dest, _ in cells:
+        counts[(origin, dest)] = counts.get((origin, dest), 0) + 1
+    relative = {route: (intervals.get(route, 1.0) if intervals else 1.0) for route in counts}
+    per_day = sum(n / relative[route] for route, n in counts.items())
+    scale = per_day / max(1, max_searches)
+
+    rates: Dict[RouteId, float] = {}
+    for route, n in counts.items():
+        period = max(1, round(relative[route] * scale))
+        if 7 % period == 0:
+            rates[route] = 1.0
+        else:
+            rates[route] = 1.0 - (1.0 - 1.0 / period) ** (n - 1)
+    return rates
+
+
+def expected_label_yield(
+    planned: List[Route],
+    label_rates: Dict[RouteId, float],
+    fleet_label: float,
+    match_rates: Dict[RouteId, float],
+) -> Tuple[float, float]:
+    """
+    Expected labelled rows, and labelled 10% moves per search, of the planned
+    searches: each search is labelled only if its route is matched at t+7,
+    and a labelled row is a move at the route's label rate.
+    """
+    if not planned:
+        return 0.0, 0.0
+    labelled = moves = 0.0
+    for route in planned:
+        match = match_rates.get((route[0], route[1]), 1.0)
+        labelled += match
+        moves += match * label_rates.get((route[0], route[1]), fleet_label)
+    return labelled, moves / len(planned)
+
+
+def stratified_cells(
+    origins: List[str],
+    destinations: List[str],
+    dtd_targets: List[int],
+    rotation: int = 0,
+) -> List[Cell]:
+    """
+    Every origin × destination × DTD cell in a deterministic balanced order.
+
+    Each next cell is the one whose origin, destination, DTD and origin/DTD
+    pair have been used least so far (ties keep the natural order), so every
+    prefix, and hence every contiguous window, is spread evenly across all
+    three axes. rotation picks where the window starts.
+    """
+    remaining = [(o, d, t) for t in dtd_targets for d in destinations for o in origins]
+    used: Dict[Any, int] = {}
+    cells: List[Cell] = []
+    while remaining:
+        best = min(
+            range(len(remaining)),
+            key=lambda idx: (
+                used.get(("o", remaining[idx][0]), 0)
+                + used.get(("d", remaining[idx][1]), 0)
+                + used.get(("t", remaining[idx][2]), 0)
+                + used.get((remaining[idx][0], remaining[idx][2]), 0),
+                idx,
+            ),
+        )
+        cell = remaining.pop(best)
+        cells.append(cell)
+        for axis in (("o", cell[0]), ("d", cell[1]), ("t", cell[2]), (cell[0], cell[2])):
+            used[axis] = used.get(axis, 0) + 1
+    if not cells:
+        return cells
+    start = rotation % len(cells)
+    return cells[start:] + cells[:start]
+
+
+def plan_routes(
+    cells: List[Cell],
+    history: Dict[Cell, CellHistory],
+    snapshot_date: dt.date,
+    max_searches: int,
+    searches_per_origin: Dict[str, int],
+    no_offers_streak: int = 2,
+    intervals: Optional[Dict[RouteId, float]] = None,
+) -> Tuple[List[Route], int]:
+    """
+    Routes the capture will search, in order, within the run budget.
+
+    Cells are ranked most overdue first: days since the last capture,
+    divided by the route's revisit interval when intervals are given
+    (never-seen cells lead). Ties keep the stratified order. Cells whose
+    last no_offers_streak captures all returned no offers go to the back
+    until they age out of the history window. Each origin first gets an
+    even share of the budget; whatever an origin cannot use is then handed
+    to the others in rank order.
+    Returns the planned routes and how many cells were deprioritised.
+    """
+
+    def _overdue(cell: Cell) -> float:
+        entry = history.get(cell)
+        if entry is None or entry.last_captured is None:
+            return math.inf
+        days = float((snapshot_date - entry.last_captured).days)
+        if intervals:
+            days /= intervals.get((cell[0], cell[1]), 1.0)
+        return days
+
+    demoted = {
+        cell
+        for cell in cells
+        if no_offers_streak > 0
+        and cell in history
+        and history[cell].no_offer_streak >= no_offers_streak
+    }
+    ranked = sorted(cells, key=lambda cell: (cell in demoted, -_overdue(cell)))
+
+    budget = max(0, max_searches - sum(searches_per_origin.values()))
+    fair_share = max_searches // max(1, len(searches_per_origin))
+    planned: List[Route] = []
+    taken = set()
+    for capped in (True, False):
+        for idx, cell in enumerate(ranked):
+            if len(planned) >= budget:
+                break
+            if idx in taken:
+                continue
+            origin = cell[0]
+            if capped and (cell in demoted or searches_per_origin[origin] >= fair_share):
+                continue
+            taken.add(idx)
+            searches_per_origin[origin] += 1
+            planned.append(cell_route(cell, snapshot_date))
+    return planned, len(demoted)
+
+
+def print_coverage_matrix(
+    origins: List[str],
+    destinations: List[str],
+    dtd_targets: List[int],
+    coverage: Dict[Cell, bool],
+    history: Optional[Dict[Cell, CellHistory]] = None,
+    snapshot_date: Optional[dt.date] = None,
+    cycle_days: int = 1,
+) -> None:
+    """Searched/priced counts by origin × DTD, plus rolling-cycle coverage when history is given."""
+    print("\nCoverage matrix (searched/priced, origin × DTD):")
+    print("  " + f"{'':<5}" + "".join(f"{dtd:>8}" for dtd in dtd_targets) + f"{'total':>9}")
+    for origin in origins:
+        line = f"  {origin:<5}"
+        row_searched = row_priced = 0
+        for dtd in dtd_targets:
+            searched = priced = 0
+            for dest in destinations:
+                if (origin, dest, dtd) in coverage:
+                    searched += 1
+                    priced += int(coverage[(origin, dest, dtd)])
+            row_searched += searched
+            row_priced += priced
+            line += f"{f'{searched}/{priced}':>8}"
+        print(line + f"{f'{row_searched}/{row_priced}':>9}")
+
+    per_dest = [sum(1 for cell in coverage if cell[1] == dest) for dest in destinations]
+    print(
+        f"  destinations covered : {sum(1 for n in per_dest if n)}/{len(destinations)} "
+        f"(min {min(per_dest, default=0)}, max {max(per_dest, default=0)} searches each)"
+    )
+
+    if history is None or snapshot_date is None:
+        return
+    cycle_start = snapshot_date - dt.timedelta(days=max(0, cycle_days - 1))
+    all_cells = len(origins) * len(destinations) * len(dtd_targets)
+    covered = set(coverage)
+    covered.update(
+        cell
+        for cell, entry in history.items()
+        if entry.last_captured is not None and entry.last_captured >= cycle_start
+    )
+    print(
+        f"  cycle coverage       : {len(covered)}/{all_cells} cells in the last {cycle_days} day(s)"
+    )
+
+
+def run_capture_searches(
+    planned: List[Route],
+    search: Any,
+    max_concurrency: int,
+    rate_control: Optional[AimdController],
+    inter_request_sleep: float,
+    on_result: Any,
+    should_stop: Any,
+) -> int:
+    """
+    Run the planned searches, handing each (route, result, status) to
+    on_result on the calling thread as soon as it is available.
+
+    With one worker this is the original serial loop with a fixed sleep.
+    Otherwise a pool of max_concurrency threads runs searches, but only as
+    many at once as the AIMD controller currently allows. Once should_stop()
+    is true no new search starts. If on_result raises, queued searches are
+    cancelled and only those already running finish before the error
+    propagates. Returns how many planned routes were not searched.
+    """
+    if max_concurrency <= 1 or rate_control is None:
+        for done, route in enumerate(planned):
+            if should_stop():
+                return len(planned) - done
+            on_result(route, *search(route, None))
+            time.sleep(inter_request_sleep)
+        return 0
+
+    failed = threading.Event()
+
+    def _gated(route: Route) -> Optional[Tuple[Optional[Dict[str, Any]], str]]:
+        rate_control.acquire()
+        try:
+            if failed.is_set() or should_stop():
+                return None
+            return search(route, rate_control)
+        finally:
+            rate_control.release()
+
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = {pool.submit(_gated, route): route for route in planned}
+        for future in as_completed(futures):
+            outcome = future.result()
+            if outcome is None:
+                skipped += 1
+                continue
+            try:
+                on_result(futures[future], *outcome)
+            except BaseException:
+                # Searches still queued would be paid for and then discarded.
+                failed.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    return skipped
+
+
+# -------------------------------------------------
+# SPARSE DTD RECONSTRUCTION
+# -------------------------------------------------
+
+def reconstruct_sparse_dtds(
+    run_rows: List[Dict[str, Any]],
+    history: Dict[Cell, CellHistory],
+    dtd_targets: List[int],
+    snapshot_date: dt.date,
+    capture_time: str,
+    skip_keys: set,
+    max_age_days: int,
+) -> Tuple[List[Tuple[Dict[str, Any], str]], Dict[str, float]]:
+    """
+    Reconstructed snapshot rows for the DTD targets a sparse run did not search.
+
+    Only routes with at least one priced search in the run are rebuilt. DTDs
+    searched in the run (priced or not) and route keys in skip_keys (the
+    run's plan, so a deferred search is never pre-empted) are left alone.
+    Each row copies the route-level columns of the route's real row nearest
+    in DTD and is excluded from training and labels.
+    Returns (row, route key) pairs and a summary: row counts per
+    reconstruction method, routes rebuilt and the median route residual.
+    """
+    routes: Dict[RouteId, List[Dict[str, Any]]] = {}
+    for row in run_rows:
+        if row.get("notes") == RECONSTRUCTED_NOTE or row.get("dtd") is None:
+            continue
+        routes.setdefault((row["origin_iata"], row["destination_iata"]), []).append(row)
+
+    rows: List[Tuple[Dict[str, Any], str]] = []
+    counts: Dict[str, float] = {method: 0 for method in METHODS}
+    counts["routes"] = 0
+    residuals: List[float] = []
+    for (origin, dest), real in sorted(routes.items()):
+        fresh = {int(r["dtd"]): float(r["price_gbp"]) for r in real if r.get("price_gbp")}
+        if not fresh:
+            continue
+        searched = {int(r["dtd"]) for r in real}
+        samples = [
+            (dtd, (snapshot_date - day).days, price)
+            for dtd in dtd_targets
+            if (origin, dest, dtd) in history
+            for day, price in history[(origin, dest, dtd)].prices
+        ]
+        estimates, residual = reconstruct_curve(dtd_targets, fresh, samples, max_age_days)
+        if not math.isnan(residual):
+            residuals.append(residual)
+        rebuilt = 0
+        for dtd, (price, method) in sorted(estimates.items()):
+            if dtd in searched:
+                continue
+            _, _, outbound, return_date, _ = cell_route((origin, dest, dtd), snapshot_date)
+            key = route_key(origin, dest, outbound, return_date)
+            if key in skip_keys:
+                continue
+            template = min(real, key=lambda r: abs(int(r["dtd"]) - dtd))
+            snapshot_key = (
+                f"{origin}_{dest}_{outbound}_{return_date}_{snapshot_date}_{capture_time.replace(':', '')}"
+            )
+            row = {column: template.get(column) for column in ROUTE_TEMPLATE_COLUMNS}
+            row.update(
+                {
+                    "snapshot_id": snapshot_id_for(snapshot_key),
+                    "snapshot_date": str(snapshot_date),
+                    "capture_time_utc": capture_time,
+                    "outbound_date": str(outbound),
+                    "return_date": str(return_date),
+                    "dtd": dtd,
+                    "day_of_week_departure": outbound.strftime("%A"),
+                    "price_gbp": price,
+                    "currency": "GBP",
+                    "fx_source_currency": None,
+                    "offer_count": None,
+                    "cheapest_offer_gbp": None,
+                    "most_expensive_offer_gbp": None,
+                    "carrier_count": None,
+                    "lcc_present": None,
+                    "direct": None,
+                    "stops": None,
+                    "seats_remaining": None,
+                    "price_t7": None,
+                    "price_t14": None,
+                    "rose_10pct": None,
+                    "fell_10pct": None,
+                    "snapshot_key": snapshot_key,
+                    "notes": RECONSTRUCTED_NOTE,
+                    "shi_variance_flag": "INSUFFICIENT_DATA",
+                    "shi_score": None,
+                    "carrier_primary_iata": None,
+                    "reference_fare_type": f"reconstructed_{method}",
+                    "connecting_pareto_frontier_size": None,
+                    "connecting_max_slice_minutes": None,
+                    "training_action": "exclude",
+                }
+            )
+            rows.append((row, key))
+            counts[method] += 1
+            rebuilt += 1
+        counts["routes"] += int(rebuilt > 0)
+    counts["median_residual_pct"] = (
+        round(_percentile([math.expm1(r) * 100 for r in residuals], 50), 1) if residuals else math.nan
+    )
+    return rows, counts
+
+
+def describe_reconstruction(written: int, counts: Dict[str, float]) -> str:
+    line = f"Reconstructed {written} DTD point(s) on {counts['routes']} route(s): " + ", ".join(
+        f"{method} {counts[method]}" for method in METHODS
+    )
+    if not math.isnan(counts["median_residual_pct"]):
+        line += f"; median residual {counts['median_residual_pct']}%"
+    return line
+
+
 # -------------------------------------------------
 # MAIN
 # -------------------------------------------------
 
 def main():
+    run_started = time.monotonic()
     print("=" * 70)
     print("ATLAS SNAPSHOT CAPTURE v2.3 (Offer Quality Guard)")
     print("=" * 70)
@@ -696,39 +1839,121 @@ def main():
     jet_fuel_price = fetch_jet_fuel_price()
 
     snapshot_date = dt.date.today()
-    capture_time = dt.datetime.utcnow().strftime("%H:%M")
+    capture_time = env_str("ATLAS_CAPTURE_TIME") or dt.datetime.utcnow().strftime("%H:%M")
     duffel_token = env_str("DUFFEL_ACCESS_TOKEN")
     max_searches = env_int("ATLAS_MAX_SEARCHES", 157)
     dtd_targets = env_int_list("ATLAS_DTD_TARGETS", [14, 21, 30, 45, 60, 84])
     inter_request_sleep = env_float("ATLAS_REQUEST_SLEEP_SECONDS", 1.2)
+    fetch_mode = env_str("ATLAS_DUFFEL_FETCH_MODE", "inline").lower()
+    offer_page_size = env_int("ATLAS_OFFER_PAGE_SIZE", 50)
+    offer_max_pages = env_int("ATLAS_OFFER_MAX_PAGES", 10)
+    supplier_timeout_ms = env_int("ATLAS_SUPPLIER_TIMEOUT_MS", 15000)
+    retry_supplier_timeout_ms = env_int("ATLAS_RETRY_SUPPLIER_TIMEOUT_MS", 30000)
+    max_concurrency = max(1, env_int("ATLAS_MAX_CONCURRENCY", 1))
+    shard_index = env_int("ATLAS_SHARD_INDEX", 0)
+    shard_count = max(1, env_int("ATLAS_SHARD_COUNT", 1))
+    checkpoint_path = env_str("ATLAS_CHECKPOINT_PATH", checkpoint_default_path(shard_index, shard_count))
+    write_chunk_size = env_int("ATLAS_WRITE_CHUNK_SIZE", 25)
+    deadline_s = env_float("ATLAS_DEADLINE_SECONDS", 0.0)
+    deadline_margin_s = env_float("ATLAS_DEADLINE_MARGIN_SECONDS", 90.0)
+    history_days = env_int("ATLAS_SCHEDULE_LOOKBACK_DAYS", 28)
+    no_offers_streak = env_int("ATLAS_NO_OFFERS_STREAK", 2)
+    adaptive_revisit = env_str("ATLAS_ADAPTIVE_REVISIT", "false").lower() in ("1", "true", "yes")
+    revisit_min_days = env_float("ATLAS_REVISIT_MIN_DAYS", 1.0)
+    revisit_max_days = env_float("ATLAS_REVISIT_MAX_DAYS", 14.0)
+    archive_dir = env_str("ATLAS_OFFER_ARCHIVE_DIR", ".cache/atlas_offer_archive")
+    dtd_sample_size = env_int("ATLAS_DTD_SAMPLE_SIZE", 0)
+    reconstruct_max_age = env_int("ATLAS_RECONSTRUCT_MAX_AGE_DAYS", 14)
+    fx_conversion = env_str("ATLAS_FX_CONVERSION", "true").lower() in ("1", "true", "yes")
+    fx_max_age = env_int("ATLAS_FX_MAX_AGE_DAYS", 7)
+    rate_control = None
+    if max_concurrency > 1:
+        rate_control = AimdController(
+            initial=env_int("ATLAS_INITIAL_CONCURRENCY", 2),
+            minimum=env_int("ATLAS_MIN_CONCURRENCY", 1),
+            maximum=max_concurrency,
+        )
+
+    if fetch_mode not in FETCH_MODES:
+        print(f"Warning: unknown ATLAS_DUFFEL_FETCH_MODE={fetch_mode!r}; using inline")
+        fetch_mode = "inline"
+    fetch_stats = FetchStats(mode=fetch_mode)
 
     if not duffel_token:
         raise ValueError("Missing DUFFEL_ACCESS_TOKEN")
 
-    origins = ["MAN", "LGW", "LHR", "EDI", "BRS", "LPL", "BHX", "NCL", "GLA"]
-    destinations = [
-        "AMS", "CDG", "BCN", "DUB", "FCO", "MAD", "ATH", "LIS", "AGP", "PMI",
-        "FAO", "NCE", "VCE", "MXP", "PRG", "CPH", "ARN", "OSL", "VIE", "ZRH",
-    ]
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"ATLAS_SHARD_INDEX={shard_index} outside 0..{shard_count - 1}")
+
+    origins = ATLAS_ORIGINS
+    destinations = ATLAS_DESTINATIONS
+
+    checkpoint = CaptureCheckpoint(checkpoint_path, snapshot_date, capture_time, shard_index, shard_count)
+    capture_time = checkpoint.capture_time
+    if checkpoint.resumed:
+        print(
+            f"Resuming today's capture from {checkpoint_path}: "
+            f"{len(checkpoint.completed)} route(s) already written (capture_time {capture_time})"
+        )
 
     print(f"Snapshot date: {snapshot_date}")
+    if shard_count > 1:
+        print(f"Shard: {shard_index + 1} of {shard_count}")
     print(f"Max searches: {max_searches}")
     print(f"DTD targets: {dtd_targets}")
-    print(f"Inter-request sleep: {inter_request_sleep}s")
-
-    routes = []
-    for origin in origins:
-        for dest in destinations:
-            for dtd in dtd_targets:
-                outbound = snapshot_date + dt.timedelta(days=dtd)
-                return_date = outbound + dt.timedelta(days=7)
-                routes.append((origin, dest, outbound, return_date, "economy"))
+    if 0 < dtd_sample_size < len(dtd_targets):
+        print(
+            f"DTD sampling: {dtd_sample_size} of {len(dtd_targets)} per route per day, "
+            f"rest reconstructed from prices up to {reconstruct_max_age} day(s) old"
+        )
+    if rate_control is not None:
+        print(
+            f"Concurrency: AIMD {rate_control.minimum}..{rate_control.maximum} "
+            f"(start {int(rate_control.limit)})"
+        )
+    else:
+        print(f"Inter-request sleep: {inter_request_sleep}s")
+    print(f"Duffel fetch mode: {fetch_mode}")
+    print(f"Supplier timeout: {supplier_timeout_ms}ms (GBP retry {retry_supplier_timeout_ms}ms)")
 
-    random.shuffle(routes)
+    fx: Optional[FxRates] = None
+    if fx_conversion:
+        try:
+            fx = load_fx_rates(supabase, snapshot_date, fx_max_age)
+        except Exception as ex:
+            print(f"Warning: FX rates unavailable, non-GBP offers will be dropped: {ex}")
+        if fx is not None and not fx:
+            print(f"Warning: no FX rates in the last {fx_max_age} day(s), non-GBP offers will be dropped")
+    print(f"FX conversion: {fx if fx else 'off'}")
+    print(f"Write chunk size: {write_chunk_size}")
+    if deadline_s > 0:
+        print(f"Deadline: {deadline_s:.0f}s (stop dispatching {deadline_margin_s:.0f}s before)")
+
+    cells = stratified_cells(
+        origins, destinations, dtd_targets, rotation=snapshot_date.toordinal() * max_searches
+    )
+    if dtd_sample_size > 0:
+        sampled = {
+            (o, d): set(sparse_dtd_targets(o, d, dtd_targets, dtd_sample_size, snapshot_date))
+            for o in origins
+            for d in destinations
+        }
+        cells = [cell for cell in cells if cell[2] in sampled[(cell[0], cell[1])]]
+    cycle_days = max(1, math.ceil(len(cells) / max(1, max_searches)))
+    try:
+        history = load_capture_history(
+            supabase,
+            origins,
+            destinations,
+            since=snapshot_date - dt.timedelta(days=history_days),
+            until=snapshot_date,
+        )
+        print(f"Capture history loaded for {len(history)} cell(s) over {history_days} day(s)")
+    except Exception as ex:
+        print(f"Warning: capture history unavailable, scheduling by rotation only: {ex}")
+        history = {}
 
-    snapshots = []
     searches_per_origin = {o: 0 for o in origins}
-    max_per_origin = max_searches // len(origins)
 
     status_counts = {
         "success": 0,
@@ -740,24 +1965,132 @@ def main():
         "failed": 0,
     }
 
-    for origin, dest, outbound, return_date, cabin in routes:
-        if len(snapshots) >= max_searches:
-            break
+    intervals, label_rates, fleet_label = revisit_intervals(
+        history, cycle_days, revisit_min_days, revisit_max_days
+    )
+    uniform_plan, _ = plan_routes(
+        cells, history, snapshot_date, max_searches, dict(searches_per_origin), no_offers_streak
+    )
+    if adaptive_revisit and intervals:
+        planned, demoted_cells = plan_routes(
+            cells,
+            history,
+            snapshot_date,
+            max_searches,
+            searches_per_origin,
+            no_offers_streak,
+            intervals=intervals,
+        )
+    else:
+        planned, demoted_cells = plan_routes(
+            cells, history, snapshot_date, max_searches, searches_per_origin, no_offers_streak
+        )
+    print(
+        f"Planned {len(planned)} search(es) over a {cycle_days}-day cycle of {len(cells)} cells "
+        f"({demoted_cells} deprioritised after {no_offers_streak} no-offer captures)"
+    )
+    if intervals:
+        ordered = sorted(intervals.values())
+        print(
+            f"Revisit intervals ({'adaptive' if adaptive_revisit else 'reported only'}): "
+            f"{len(ordered)} routes, {ordered[0]:.1f}-{ordered[-1]:.1f} days "
+            f"(median {ordered[len(ordered) // 2]:.1f}, base {cycle_days}); "
+            f"{sum(1 for v in ordered if v < cycle_days)} volatile, "
+            f"{sum(1 for v in ordered if v > cycle_days)} stable"
+        )
+        uniform_rows, uniform_moves = expected_label_yield(
+            uniform_plan, label_rates, fleet_label, t7_match_rates(cells, max_searches)
+        )
+        plan_rows, plan_moves = expected_label_yield(
+            planned,
+            label_rates,
+            fleet_label,
+            t7_match_rates(cells, max_searches, intervals if adaptive_revisit else None),
+        )
+        realised_rows = sum(entry.labelled for entry in history.values())
+        print(
+            f"Labels: realised {realised_rows} labelled row(s), {fleet_label:.3f} moves each, "
+            f"over {history_days} day(s); expected labelled rows uniform {uniform_rows:.0f} "
+            f"-> this plan {plan_rows:.0f}; labelled moves per search uniform "
+            f"{uniform_moves:.3f} -> this plan {plan_moves:.3f}"
+        )
 
-        if searches_per_origin[origin] >= max_per_origin:
-            continue
+    plan_total = len(planned)
+    if shard_count > 1:
+        planned = [
+            route
+            for route in planned
+            if shard_of((route[0], route[1], (route[2] - snapshot_date).days), shard_count) == shard_index
+        ]
+    checkpoint.set_plan([route_key(*route[:4]) for route in planned], plan_total)
+    # Supplier-timeout retries come out of whatever ATLAS_MAX_SEARCHES the
+    # plan left, split evenly across shards.
+    spare = max(0, max_searches - plan_total)
+    fetch_stats.retry_room = spare // shard_count + int(shard_index < spare % shard_count)
+    already_written = sum(1 for route in planned if route_key(*route[:4]) in checkpoint.completed)
+    planned = [route for route in planned if route_key(*route[:4]) not in checkpoint.completed]
+    if shard_count > 1 or already_written:
+        scope = " for this shard" if shard_count > 1 else ""
+        print(
+            f"This run: {len(planned)} search(es) "
+            f"({len(planned) + already_written} of {plan_total} planned{scope}, "
+            f"{already_written} already written)"
+        )
+
+    archive: Optional[OfferArchive] = None
+    if archive_dir and np is not None:
+        archive = OfferArchive(snapshot_date, capture_time, fx)
+    elif archive_dir:
+        print("Warning: numpy unavailable, offer archive disabled")
+
+    def _search(route: Route, control: Optional[AimdController]) -> Tuple[Optional[Dict[str, Any]], str]:
+        origin, dest, outbound, return_date, cabin = route
+        return search_duffel(
+            origin,
+            dest,
+            outbound,
+            return_date,
+            cabin,
+            duffel_token,
+            fetch_stats=fetch_stats,
+            page_size=offer_page_size,
+            max_pages=offer_max_pages,
+            supplier_timeout_ms=supplier_timeout_ms,
+            retry_supplier_timeout_ms=retry_supplier_timeout_ms,
+            rate_control=control,
+            archive=archive,
+            fx=fx,
+        )
+
+    shi_stats: Dict[PriceKey, PriceStats] = {}
+    try:
+        shi_stats = load_shi_stats(
+            supabase,
+            origins,
+            destinations,
+            sorted({route[2] for route in planned}),
+        )
+        print(f"SHI price history loaded for {len(shi_stats)} trip(s)")
+    except Exception as ex:
+        print(f"Warning: SHI price history unavailable, flags will be INSUFFICIENT_DATA: {ex}")
+
+    writer = SnapshotWriter(supabase, checkpoint, write_chunk_size)
+    coverage: Dict[Cell, bool] = {}
 
-        result, status = search_duffel(origin, dest, outbound, return_date, cabin, duffel_token)
+    def _past_deadline() -> bool:
+        return deadline_s > 0 and time.monotonic() - run_started >= deadline_s - deadline_margin_s
+
+    def _record(route: Route, result: Optional[Dict[str, Any]], status: str) -> None:
+        origin, dest, outbound, return_date, cabin = route
         status_counts[status] += 1
-        searches_per_origin[origin] += 1
 
         distance_km = route_distance_km(origin, dest)
         route_type = classify_route_type(distance_km) if distance_km is not None else None
 
-        snapshot_id = str(uuid4())
         snapshot_key = (
             f"{origin}_{dest}_{outbound}_{return_date}_{snapshot_date}_{capture_time.replace(':', '')}"
         )
+        snapshot_id = snapshot_id_for(snapshot_key)
         crisis_flags = check_crisis_flags(snapshot_date, dest, crisis_events)
 
         excluded_capture_status = status in {
@@ -772,7 +2105,8 @@ def main():
             shi_flag = "FLAG"
         elif result and result.get("price_gbp"):
             shi_flag, shi_score = shi_variance_calculation(
-                supabase, origin, dest, outbound, return_date, result["price_gbp"]
+                shi_stats.get((origin, dest, str(outbound), str(return_date))),
+                result["price_gbp"],
             )
 
         row = {
@@ -789,7 +2123,8 @@ def main():
             "is_school_holiday_window": False,
             "is_bank_holiday_adjacent": False,
             "price_gbp": result["price_gbp"] if result else None,
-            "currency": result["currency"] if result else "GBP",
+            "currency": "GBP",
+            "fx_source_currency": result["fx_source_currency"] if result else None,
             "offer_count": result["offer_count"] if result else None,
             "cheapest_offer_gbp": result["cheapest_offer_gbp"] if result else None,
             "most_expensive_offer_gbp": result["most_expensive_offer_gbp"] if result else None,
@@ -835,25 +2170,54 @@ def main():
         if excluded_capture_status:
             row["training_action"] = "exclude"
 
-        snapshots.append(row)
-        time.sleep(inter_request_sleep)
+        writer.add(row, route_key(origin, dest, outbound, return_date))
+        coverage[(origin, dest, row["dtd"])] = row["price_gbp"] is not None
+
+    search_started = time.monotonic()
+    deferred = run_capture_searches(
+        planned, _search, max_concurrency, rate_control, inter_request_sleep, _record, _past_deadline
+    )
+    search_wall_s = time.monotonic() - search_started
+    writer.flush()
+    print(f"\nWrote {writer.written} snapshots in {writer.chunks} chunk(s) (upsert on snapshot_key)")
+    if deferred:
+        print(f"Deadline reached: {deferred} planned route(s) left for a same-day rerun")
+    if archive is not None and len(archive):
+        try:
+            archive_path = archive.save(archive_dir)
+            print(
+                f"Archived offers from {len(archive)} search(es) to {archive_path} "
+                f"({round(os.path.getsize(archive_path) / 1024, 1)} kb)"
+            )
+        except Exception as ex:
+            print(f"Warning: offer archive not written: {ex}")
 
-    if snapshots:
-        print(f"\nWriting {len(snapshots)} snapshots...")
+    if dtd_sample_size > 0 and shard_count == 1:
         try:
-            supabase.table("snapshots").insert(snapshots).execute()
-            print(f"Successfully wrote {len(snapshots)} rows")
+            reconstructed, counts = reconstruct_sparse_dtds(
+                fetch_run_rows(supabase, snapshot_date, capture_time),
+                history,
+                dtd_targets,
+                snapshot_date,
+                capture_time,
+                set(checkpoint.planned),
+                reconstruct_max_age,
+            )
+            reconstruct_writer = SnapshotWriter(supabase, checkpoint, write_chunk_size)
+            for row, key in reconstructed:
+                reconstruct_writer.add(row, key)
+            reconstruct_writer.flush()
+            print(describe_reconstruction(reconstruct_writer.written, counts))
         except Exception as ex:
-            print(f"Insert failed: {ex}")
-            raise
+            print(f"Warning: sparse DTD reconstruction skipped: {ex}")
 
-    priced_rows = sum(1 for row in snapshots if row.get("price_gbp") is not None)
-    null_rows = len(snapshots) - priced_rows
-    fill_pct = round((priced_rows * 100.0 / len(snapshots)), 1) if snapshots else 0.0
+    priced_rows = writer.priced
+    null_rows = writer.written - priced_rows
+    fill_pct = round((priced_rows * 100.0 / writer.written), 1) if writer.written else 0.0
 
-    print("\nSearches per origin:")
-    for origin in origins:
-        print(f"  {origin}: {searches_per_origin[origin]}")
+    print_coverage_matrix(
+        origins, destinations, dtd_targets, coverage, history, snapshot_date, cycle_days
+    )
 
     print("\nDuffel status summary:")
     for key in [
@@ -867,14 +2231,42 @@ def main():
     ]:
         print(f"  {key}: {status_counts[key]}")
 
+    fetched = max(1, fetch_stats.searches)
+    print("\nDuffel fetch summary:")
+    print(f"  mode              : {fetch_stats.mode}")
+    print(f"  searches          : {fetch_stats.searches} (+{fetch_stats.gbp_retries} timeout retries)")
+    print(f"  responses         : {fetch_stats.responses}")
+    print(f"  kb per search     : {round(fetch_stats.response_bytes / fetched / 1024, 1)}")
+    print(f"  parse ms / search : {round(fetch_stats.parse_seconds / fetched * 1000, 1)}")
+    print(f"  stopped early     : {fetch_stats.truncated_searches}")
+    print(f"  latency p50 (s)   : {round(_percentile(fetch_stats.latencies, 50), 2)}")
+    print(f"  latency p95 (s)   : {round(_percentile(fetch_stats.latencies, 95), 2)}")
+    print(f"  avg suppliers     : {round(sum(fetch_stats.suppliers) / fetched, 1)}")
+    print(f"  GBP retries       : {fetch_stats.gbp_retries} (rescued {fetch_stats.gbp_rescued})")
+    print(
+        f"  FX converted      : {fetch_stats.fx_offers} offer(s) in {fetch_stats.fx_searches} search(es); "
+        f"rescued {fetch_stats.fx_rescued}, reference fare converted {fetch_stats.fx_selected}"
+    )
+
+    print("\nCapture throughput:")
+    print(f"  search wall (s)   : {round(search_wall_s, 1)}")
+    print(f"  searches / min    : {round((len(planned) - deferred) / max(search_wall_s, 1e-9) * 60, 1)}")
+    if rate_control is not None:
+        print(f"  HTTP requests     : {rate_control.requests}")
+        print(f"  429 responses     : {rate_control.throttles}")
+        print(f"  429 rate          : {round(rate_control.throttles * 100.0 / max(1, rate_control.requests), 2)}%")
+        print(f"  concurrency end   : {round(rate_control.limit, 1)} (peak {round(rate_control.peak, 1)})")
+    else:
+        print(f"  429 rate          : n/a (serial, rate_limited={status_counts['rate_limited']})")
+
     print("\nSnapshot fill summary:")
-    print(f"  total rows : {len(snapshots)}")
+    print(f"  total rows : {writer.written}")
     print(f"  priced     : {priced_rows}")
     print(f"  null price : {null_rows}")
     print(f"  fill pct   : {fill_pct}%")
 
     print(f"\n{'=' * 70}")
-    print(f"Capture complete: {len(snapshots)} snapshots")
+    print(f"Capture complete: {writer.written} snapshots")
     print(f"{'=' * 70}")
 
 
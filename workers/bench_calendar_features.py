@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+workers/bench_calendar_features.py
+ATLAS — CALENDAR FEATURE BENCHMARK
+
+Checks that holiday_calendar.calendar_features() returns exactly what the
+original row-by-row DataFrame.apply path returned, and times both on a
+synthetic snapshot frame.
+
+The reference is the per-row code the feature workers used to carry,
+scanning holiday_calendar.UK_BANK_HOLIDAYS so both sides see the same
+holidays. Outbound dates are ISO strings spread over BENCH_YEARS years
+from 2025, as they come back from Supabase; return dates follow 1-21 days
+later, with about one in ten missing.
+
+Env:
+- BENCH_ROWS          rows in the vectorised run (default 1000000)
+- BENCH_APPLY_ROWS    rows in the apply run (default BENCH_ROWS)
+- BENCH_YEARS         span of outbound dates in years (default 4)
+- BENCH_MIN_SPEEDUP   required per-row speedup (default 20)
+
+Exits non-zero on any mismatch or when the speedup falls below the floor.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import datetime as dt
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import holiday_calendar as calendar
+
+
+def _as_date(d: Any) -> Optional[dt.date]:
+    if d is None or (isinstance(d, float) and np.isnan(d)):
+        return None
+    if isinstance(d, str):
+        return dt.date.fromisoformat(d[:10])
+    if hasattr(d, "date"):
+        return d.date()
+    return d
+
+
+def assign_season_bucket(d: Any) -> str:
+    d = _as_date(d)
+    m, day = d.month, d.day
+    if (m == 12 and day >= 20) or (m == 1 and day <= 5):
+        return "christmas"
+    if (m == 4 and 1 <= day <= 15) or (m == 3 and 24 <= day <= 31):
+        return "easter"
+    if (m == 7 and day >= 15) or m == 8 or (m == 9 and day <= 1):
+        return "summer_peak"
+    if (m == 1 and day >= 15) or m == 2 or (m == 3 and day <= 15):
+        return "ski"
+    if m == 10 and 19 <= day <= 30:
+        return "half_term"
+    if m in [4, 5, 6, 9, 10]:
+        return "shoulder"
+    return "off_peak"
+
+
+def days_to_next_bank_holiday(d: Any) -> int:
+    d = _as_date(d)
+    future = [h for h in calendar.UK_BANK_HOLIDAYS if h >= d]
+    return (min(future) - d).days if future else 365
+
+
+def trip_overlaps_holiday(outbound: Any, return_date: Any) -> bool:
+    outbound, return_date = _as_date(outbound), _as_date(return_date)
+    if return_date is None:
+        return False
+    return any(outbound <= h <= return_date for h in calendar.UK_BANK_HOLIDAYS)
+
+
+def holiday_intensity_score(outbound: Any) -> float:
+    base = calendar.SEASON_INTENSITY.get(assign_season_bucket(outbound), 0.30)
+    if days_to_next_bank_holiday(outbound) <= 3:
+        base = min(1.0, base + 0.15)
+    return round(base, 3)
+
+
+def apply_path(df: pd.DataFrame) -> pd.DataFrame:
+    """The original per-row feature code."""
+    df = df.copy()
+    df["season_bucket"] = df["outbound_date"].apply(assign_season_bucket)
+    df["days_to_next_bank_holiday"] = df["outbound_date"].apply(days_to_next_bank_holiday)
+    df["trip_overlaps_holiday"] = df.apply(
+        lambda r: trip_overlaps_holiday(r["outbound_date"], r["return_date"]), axis=1
+    )
+    df["holiday_intensity_score"] = df["outbound_date"].apply(holiday_intensity_score)
+    return df
+
+
+def lookup_path(df: pd.DataFrame) -> pd.DataFrame:
+    """What the feature workers do now."""
+    df = df.copy()
+    for col, values in calendar.calendar_features(df["outbound_date"], df["return_date"]).items():
+        df[col] = values
+    return df
+
+
+def synthetic_frame(rows: int, years: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    outbound = np.datetime64("2025-01-01") + rng.integers(0, 365 * years, rows).astype("timedelta64[D]")
+    ret = outbound + rng.integers(1, 22, rows).astype("timedelta64[D]")
+    return_date = ret.astype(str).astype(object)
+    return_date[rng.random(rows) < 0.1] = None
+    return pd.DataFrame({"outbound_date": outbound.astype(str).astype(object), "return_date": return_date})
+
+
+def main() -> int:
+    rows = int(os.environ.get("BENCH_ROWS", 1_000_000))
+    apply_rows = min(rows, int(os.environ.get("BENCH_APPLY_ROWS", rows)))
+    years = int(os.environ.get("BENCH_YEARS", 4))
+    min_speedup = float(os.environ.get("BENCH_MIN_SPEEDUP", 20.0))
+    cols = ["season_bucket", "days_to_next_bank_holiday", "trip_overlaps_holiday", "holiday_intensity_score"]
+
+    df = synthetic_frame(rows, years)
+
+    print("=" * 70)
+    print(
+        f"CALENDAR FEATURE BENCHMARK ({len(calendar.UK_BANK_HOLIDAYS)} bank holidays, "
+        f"{calendar.CALENDAR_START}..{calendar.CALENDAR_END})"
+    )
+    print("=" * 70)
+
+    started = time.perf_counter()
+    lookup = lookup_path(df)
+    t_lookup = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = apply_path(df.head(apply_rows))
+    t_apply = time.perf_counter() - started
+
+    actual = lookup.head(apply_rows)
+    mismatches: Dict[str, int] = {}
+    for col in cols:
+        same = expected[col].to_numpy() == actual[col].to_numpy()
+        if not same.all():
+            mismatches[col] = int((~same).sum())
+
+    per_row_apply = t_apply / max(apply_rows, 1)
+    per_row_lookup = t_lookup / max(rows, 1)
+    speedup = per_row_apply / max(per_row_lookup, 1e-12)
+    print(f"{'path':<10} {'rows':>10} {'seconds':>9} {'us/row':>8}")
+    print(f"{'apply':<10} {apply_rows:>10} {t_apply:>9.2f} {per_row_apply * 1e6:>8.2f}")
+    print(f"{'lookup':<10} {rows:>10} {t_lookup:>9.2f} {per_row_lookup * 1e6:>8.2f}")
+    print(f"seasons: {lookup['season_bucket'].value_counts().to_dict()}")
+
+    print("=" * 70)
+    if mismatches:
+        print(f"FAIL: lookup differs from the apply path in {mismatches}")
+        return 1
+    if speedup < min_speedup:
+        print(f"FAIL: speedup {speedup:.1f}x is below {min_speedup:.1f}x")
+        return 1
+    print(f"OK: identical features on {apply_rows} rows; {speedup:.1f}x faster per row")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
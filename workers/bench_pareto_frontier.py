@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+workers/bench_pareto_frontier.py
+ATLAS — PARETO FRONTIER MICRO-BENCHMARK
+
+Checks that the capture's sort-and-sweep _pareto_frontier() returns exactly
+what the original pairwise O(n²) scan returned, and times both on large
+offer sets.
+
+Offer sets come from recorded Duffel responses when BENCH_PAYLOAD_DIR
+points at a folder of *.json files (offer_request bodies with
+data.offers, or /air/offers pages with data as a list). Otherwise seeded
+synthetic hub-route payloads of BENCH_SIZES offers are generated.
+
+Env:
+- BENCH_PAYLOAD_DIR   folder of recorded Duffel JSON responses (optional)
+- BENCH_SIZES         synthetic offer counts (default 50,200,500,1000)
+- BENCH_REPEATS       timing repeats per payload (default 5)
+- BENCH_MIN_SPEEDUP   required speedup on the largest payload (default 5)
+
+Exits non-zero on any mismatch or when the speedup falls below the floor.
+"""
+
+from __future__ import annotations
+
+import os
+import glob
+import json
+import time
+import random
+from typing import Any, Dict, List, Tuple
+
+import atlas_snapshot_capture as capture
+from offer_summary import OfferSummary, summarise_offers
+
+
+def pareto_frontier_pairwise(candidates: List[OfferSummary]) -> List[OfferSummary]:
+    """The original O(n²) frontier, kept as the reference."""
+    frontier = []
+    for candidate in candidates:
+        dominated = False
+        for other in candidates:
+            if other is candidate:
+                continue
+            no_worse_price = other.price <= candidate.price
+            no_worse_duration = other.max_slice_minutes <= candidate.max_slice_minutes
+            strictly_better = (
+                other.price < candidate.price
+                or other.max_slice_minutes < candidate.max_slice_minutes
+            )
+            if no_worse_price and no_worse_duration and strictly_better:
+                dominated = True
+                break
+        if not dominated:
+            frontier.append(candidate)
+    return frontier
+
+
+def synthetic_offers(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Hub-route shaped offers: mostly connecting, clustered prices and durations."""
+    rnd = random.Random(seed)
+    offers = []
+    for i in range(n):
+        def _slice() -> Dict[str, Any]:
+            segments = rnd.choice([2, 2, 2, 3])
+            minutes = rnd.randint(150, 1200)
+            return {
+                "duration": f"PT{minutes // 60}H{minutes % 60}M",
+                "segments": [
+                    {"marketing_carrier": {"iata_code": rnd.choice(["BA", "KL", "AF", "LH", "TK"]), "name": "x"}}
+                    for _ in range(segments)
+                ],
+            }
+
+        offers.append(
+            {
+                "id": f"off_{i}",
+                "total_amount": f"{rnd.choice([rnd.uniform(90, 900), rnd.randint(9, 90) * 10]):.2f}",
+                "total_currency": "GBP",
+                "slices": [_slice(), _slice()],
+            }
+        )
+    return offers
+
+
+def load_payloads() -> List[Tuple[str, List[Dict[str, Any]]]]:
+    payload_dir = capture.env_str("BENCH_PAYLOAD_DIR")
+    if payload_dir:
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(payload_dir, "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                body = json.load(f)
+            data = body.get("data")
+            offers = data.get("offers", []) if isinstance(data, dict) else (data or [])
+            payloads.append((os.path.basename(path), offers))
+        return payloads
+
+    sizes = capture.env_int_list("BENCH_SIZES", [50, 200, 500, 1000])
+    return [(f"synthetic_{n}", synthetic_offers(n, seed=n)) for n in sizes]
+
+
+def best_time(fn: Any, arg: Any, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> int:
+    repeats = capture.env_int("BENCH_REPEATS", 5)
+    min_speedup = capture.env_float("BENCH_MIN_SPEEDUP", 5.0)
+    payloads = load_payloads()
+    if not payloads:
+        print("No payloads found.")
+        return 1
+
+    print("=" * 70)
+    print(f"PARETO FRONTIER BENCHMARK (numpy={'yes' if capture.np is not None else 'no'})")
+    print("=" * 70)
+    print(f"{'payload':<24} {'connecting':>10} {'frontier':>8} {'pairwise ms':>12} {'sweep ms':>9} {'speedup':>8}")
+
+    mismatches = 0
+    largest: Tuple[int, float] = (-1, 0.0)
+    for name, offers in payloads:
+        candidates = [
+            offer
+            for offer in summarise_offers(offers)
+            if capture._in_calibration_population(offer, None) and not offer.direct
+        ]
+        expected = pareto_frontier_pairwise(candidates)
+        actual = capture._pareto_frontier(candidates)
+        if [id(c) for c in expected] != [id(c) for c in actual]:
+            mismatches += 1
+            print(f"MISMATCH {name}: pairwise={len(expected)} sweep={len(actual)}")
+
+        t_pairwise = best_time(pareto_frontier_pairwise, candidates, repeats)
+        t_sweep = best_time(capture._pareto_frontier, candidates, repeats)
+        speedup = t_pairwise / max(t_sweep, 1e-9)
+        if len(candidates) > largest[0]:
+            largest = (len(candidates), speedup)
+        print(
+            f"{name:<24} {len(candidates):>10} {len(actual):>8} "
+            f"{t_pairwise * 1000:>12.2f} {t_sweep * 1000:>9.2f} {speedup:>7.1f}x"
+        )
+
+    print("=" * 70)
+    if mismatches:
+        print(f"FAIL: {mismatches} payload(s) differ from the pairwise reference")
+        return 1
+    if largest[1] < min_speedup:
+        print(f"FAIL: speedup {largest[1]:.1f}x on {largest[0]} offers is below {min_speedup:.1f}x")
+        return 1
+    print(f"OK: identical frontiers; {largest[1]:.1f}x faster on {largest[0]} offers")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
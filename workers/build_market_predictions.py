@@ -11,6 +11,11 @@ import numpy as np
 import pandas as pd
 from supabase import Client, create_client
 
+import route_baseline
+from dtd_curve import RECONSTRUCTED_NOTE
+from holiday_calendar import calendar_features
+from route_momentum import capped_pct_change, direction_consistency, group_ids, rolling_std
+
 try:
     import joblib
 except Exception:
@@ -133,94 +138,9 @@ def check_system_health(supabase: Client) -> bool:
 # Calendar features
 # ============================================================
 
-UK_BANK_HOLIDAYS = [
-    date(2025, 1, 1), date(2025, 4, 18), date(2025, 4, 21),
-    date(2025, 5, 5), date(2025, 5, 26), date(2025, 8, 25),
-    date(2025, 12, 25), date(2025, 12, 26),
-    date(2026, 1, 1), date(2026, 4, 3), date(2026, 4, 6),
-    date(2026, 5, 4), date(2026, 5, 25), date(2026, 8, 31),
-    date(2026, 12, 25), date(2026, 12, 28),
-    date(2027, 1, 1), date(2027, 3, 26), date(2027, 3, 29),
-    date(2027, 5, 3), date(2027, 5, 31), date(2027, 8, 30),
-    date(2027, 12, 27), date(2027, 12, 28),
-]
-
-
-def assign_season_bucket(d: Any) -> str:
-    d = parse_date(d)
-    if not d:
-        return "off_peak"
-
-    m, day = d.month, d.day
-
-    if (m == 12 and day >= 20) or (m == 1 and day <= 5):
-        return "christmas"
-
-    if (m == 3 and day >= 24) or (m == 4 and day <= 15):
-        return "easter"
-
-    if (m == 2 and 14 <= day <= 21) or (m == 10 and 19 <= day <= 30):
-        return "half_term"
-
-    if (m == 1 and day >= 15) or m == 2 or (m == 3 and day <= 15):
-        return "ski"
-
-    if (m == 7 and day >= 15) or m == 8 or (m == 9 and day <= 1):
-        return "summer_peak"
-
-    if m in [4, 5, 6, 9, 10]:
-        return "shoulder"
-
-    return "off_peak"
-
-
-def days_to_next_bank_holiday(d: Any) -> int:
-    d = parse_date(d)
-    if not d:
-        return 365
-    future = [h for h in UK_BANK_HOLIDAYS if h >= d]
-    return (min(future) - d).days if future else 365
-
-
-def trip_overlaps_holiday(outbound: Any, return_date: Any) -> bool:
-    outbound = parse_date(outbound)
-    return_date = parse_date(return_date)
-    if not outbound or not return_date:
-        return False
-    return any(outbound <= h <= return_date for h in UK_BANK_HOLIDAYS)
-
-
-def holiday_intensity_score(outbound: Any) -> float:
-    outbound = parse_date(outbound)
-    if not outbound:
-        return 0.20
-
-    season = assign_season_bucket(outbound)
-    base = {
-        "christmas": 0.95,
-        "easter": 0.85,
-        "summer_peak": 0.90,
-        "half_term": 0.75,
-        "ski": 0.70,
-        "shoulder": 0.45,
-        "off_peak": 0.20,
-    }.get(season, 0.30)
-
-    if days_to_next_bank_holiday(outbound) <= 3:
-        base = min(1.0, base + 0.15)
-
-    return round(base, 3)
-
-
 def add_calendar_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df["season_bucket"] = df["outbound_date"].apply(assign_season_bucket)
-    df["days_to_next_bank_holiday"] = df["outbound_date"].apply(days_to_next_bank_holiday)
-    df["trip_overlaps_holiday"] = df.apply(
-        lambda r: trip_overlaps_holiday(r["outbound_date"], r["return_date"]),
-        axis=1,
-    )
-    df["holiday_intensity_score"] = df["outbound_date"].apply(holiday_intensity_score)
+    for col, values in calendar_features(df["outbound_date"], df["return_date"]).items():
+        df[col] = values
     return df
 
 
@@ -228,14 +148,17 @@ def add_calendar_features(df: pd.DataFrame) -> pd.DataFrame:
 # Feature engineering
 # ============================================================
 
-def compute_baseline(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+def compute_baseline(
+    df: pd.DataFrame,
+    baselines: Optional[route_baseline.BaselineHistory] = None,
+) -> pd.DataFrame:
+    """
+    Price position against each (route, dtd_bucket, season_bucket) group.
 
-    df["dtd_bucket"] = pd.cut(
-        df["dtd"].astype(float),
-        bins=[-1, 7, 21, 60, 120, 9999],
-        labels=["0-7", "8-21", "22-60", "61-120", "120+"],
-    )
+    Groups in the stored baselines use their latest state; the rest fall
+    back to the candidate frame itself.
+    """
+    df["dtd_bucket"] = route_baseline.dtd_buckets(df["dtd"])
 
     df["route"] = (
         df["origin_iata"].astype(str)
@@ -243,34 +166,14 @@ def compute_baseline(df: pd.DataFrame) -> pd.DataFrame:
         + df["destination_iata"].astype(str)
     )
 
-    baseline = (
-        df.groupby(
-            ["route", "dtd_bucket", "season_bucket"],
-            dropna=False,
-            observed=False,
-        )["price_gbp"]
-        .agg(["mean", "std"])
-        .reset_index()
-        .rename(columns={"mean": "baseline_mu", "std": "baseline_sigma"})
-    )
-
-    df = df.merge(
-        baseline,
-        on=["route", "dtd_bucket", "season_bucket"],
-        how="left",
-    )
-
-    if "baseline_mu" not in df.columns:
-        df["baseline_mu"] = df["price_gbp"]
-
-    if "baseline_sigma" not in df.columns:
-        df["baseline_sigma"] = 10.0
-
-    df["baseline_mu"] = pd.to_numeric(df["baseline_mu"], errors="coerce")
-    df["baseline_sigma"] = pd.to_numeric(df["baseline_sigma"], errors="coerce")
+    grouped = df.groupby(
+        ["route", "dtd_bucket", "season_bucket"],
+        dropna=False,
+        observed=False,
+    )["price_gbp"]
 
-    df["baseline_mu"] = df["baseline_mu"].fillna(df["price_gbp"])
-    df["baseline_sigma"] = df["baseline_sigma"].fillna(10.0).clip(lower=5.0)
+    df["baseline_mu"] = grouped.transform("mean").fillna(df["price_gbp"])
+    df["baseline_sigma"] = grouped.transform("std").fillna(10.0).clip(lower=5.0)
 
     df["price_z_score"] = (
         (df["price_gbp"] - df["baseline_mu"]) / df["baseline_sigma"]
@@ -280,55 +183,40 @@ def compute_baseline(df: pd.DataFrame) -> pd.DataFrame:
         df["price_gbp"] / df["baseline_mu"]
     ).replace([np.inf, -np.inf], np.nan).round(3)
 
-    def pct_rank(group: pd.DataFrame) -> pd.DataFrame:
-        group = group.copy()
-        group["price_percentile"] = (
-            group["price_gbp"].rank(pct=True).mul(100).round(1)
-        )
-        return group
+    df["price_percentile"] = grouped.rank(pct=True).mul(100).round(1)
 
-    df = df.groupby(
-        ["route", "dtd_bucket", "season_bucket"],
-        group_keys=False,
-        dropna=False,
-        observed=False,
-    ).apply(pct_rank)
+    if baselines is not None and len(baselines):
+        stored = route_baseline.lookup(
+            baselines, df["route"], df["dtd_bucket"], df["season_bucket"], df["price_gbp"]
+        )
+        known = stored["baseline_n"] > 0
+        df.loc[known, "baseline_mu"] = stored["baseline_mu"][known]
+        df.loc[known, "baseline_sigma"] = stored["baseline_sigma"][known]
+        df.loc[known, "price_z_score"] = np.round(stored["price_z_score"][known], 3)
+        df.loc[known, "price_ratio"] = np.round(stored["price_ratio"][known], 3)
+        df.loc[known, "price_percentile"] = np.round(stored["price_percentile"][known], 1)
 
     return df
 
 
 def compute_momentum(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy().sort_values(
+    df = df.sort_values(
         ["origin_iata", "destination_iata", "outbound_date", "snapshot_date"]
     )
-    key = ["origin_iata", "destination_iata", "outbound_date"]
+    groups = group_ids(df, ["origin_iata", "destination_iata", "outbound_date"])
+    prices = df["price_gbp"].to_numpy(dtype=float)
 
     for n, col in [(3, "trend_3d"), (7, "trend_7d")]:
-        df[col] = df.groupby(key)["price_gbp"].transform(
-            lambda x: x.pct_change(periods=min(n, max(1, len(x) - 1)))
-        ).round(4)
-
-    df["volatility_7d"] = df.groupby(key)["price_gbp"].transform(
-        lambda x: x.rolling(7, min_periods=2).std()
-    ).round(4)
-
-    def dir_consistency(x: pd.Series) -> float:
-        if len(x) < 2:
-            return np.nan
-        diffs = x.diff().dropna()
-        if len(diffs) == 0:
-            return np.nan
-        return round(float((diffs > 0).sum()) / len(diffs), 3)
-
-    df["direction_consistency_7d"] = df.groupby(key)["price_gbp"].transform(
-        lambda x: x.rolling(7, min_periods=2).apply(dir_consistency, raw=False)
-    )
+        df[col] = np.round(capped_pct_change(prices, groups, n), 4)
+
+    df["volatility_7d"] = np.round(rolling_std(prices, groups, 7), 4)
+    df["direction_consistency_7d"] = direction_consistency(prices, groups, 7)
 
     return df
 
 
 def compute_fuel_velocity(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy().sort_values("snapshot_date")
+    df = df.sort_values("snapshot_date")
     fuel_by_date = (
         df.groupby("snapshot_date")["jet_fuel_usd_gal"]
         .first()
@@ -361,6 +249,14 @@ def get_latest_macro_signals(supabase: Client) -> Dict[str, Any]:
     return rows[0] if rows else {}
 
 
+def get_route_baselines(supabase: Client) -> Optional[route_baseline.BaselineHistory]:
+    try:
+        return route_baseline.load_current(supabase)
+    except Exception as ex:
+        print(f"Could not load route baselines, using candidate-frame baselines: {ex}")
+        return None
+
+
 def get_candidate_snapshots(
     supabase: Client,
     limit: int = MAX_SNAPSHOTS,
@@ -368,6 +264,7 @@ def get_candidate_snapshots(
     result = (
         supabase.table("snapshots")
         .select("*")
+        .or_(f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}")
         .order("snapshot_date", desc=True)
         .limit(limit * 3)
         .execute()
@@ -529,6 +426,7 @@ def score_feature_row(feature_row: Dict[str, Any]) -> Tuple[float, str]:
 def build_feature_frame(
     snapshots: List[Dict[str, Any]],
     macro: Dict[str, Any],
+    baselines: Optional[route_baseline.BaselineHistory] = None,
 ) -> pd.DataFrame:
     if not snapshots:
         return pd.DataFrame()
@@ -557,7 +455,7 @@ def build_feature_frame(
     df["gbp_eur_rate"] = float(macro.get("gbp_eur_rate") or 0.0)
 
     df = add_calendar_features(df)
-    df = compute_baseline(df)
+    df = compute_baseline(df, baselines)
     df = compute_momentum(df)
     df = compute_fuel_velocity(df)
 
@@ -656,7 +554,10 @@ def main() -> int:
         print("No candidate snapshots found. Exiting.")
         return 0
 
-    df = build_feature_frame(snapshots, macro)
+    baselines = get_route_baselines(supabase)
+    print(f"Stored route baselines: {len(baselines) if baselines is not None else 0}")
+
+    df = build_feature_frame(snapshots, macro, baselines)
 
     if df.empty:
         print("Feature frame is empty. Exiting.")
@@ -28,6 +28,8 @@ import requests
 from dotenv import load_dotenv
 from supabase import create_client
 
+from dtd_curve import RECONSTRUCTED_NOTE
+
 
 load_dotenv()
 
@@ -117,6 +119,7 @@ def fetch_snapshot_rows(snapshot_date):
         .eq("snapshot_date", scoring_date.isoformat())
         .not_.is_("price_gbp", "null")
         .not_.is_("outbound_date", "null")
+        .or_(f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}")
         .limit(max(MAX_ROWS * 4, 1000))
     )
 
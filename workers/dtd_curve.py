@@ -0,0 +1,174 @@
+# workers/dtd_curve.py
+"""
+Price-versus-DTD curve reconstruction for sparse DTD sampling.
+
+With ATLAS_DTD_SAMPLE_SIZE set, capture only searches a rotating subset of
+each route's DTD targets per day. The rest of the route's curve is rebuilt
+from the day's fresh prices and the route's captures over the last couple
+of weeks:
+
+- log price is modelled as a day level plus a DTD shape, fitted to the
+  route's recent samples, so a DTD last seen three days ago is carried to
+  today through the moves of the DTDs seen since;
+- today's level comes from today's fresh prices only;
+- DTDs never sampled take their shape from monotone cubic (Fritsch-Carlson
+  / PCHIP) interpolation between sampled DTDs, which never overshoots the
+  neighbouring prices, held flat beyond the outermost ones;
+- the fit's residual gives a per-route standard error for the rebuilt points.
+
+Reconstructed snapshots carry notes = RECONSTRUCTED_NOTE so label, SHI and
+scheduling code can skip them.
+"""
+
+from __future__ import annotations
+
+import math
+import zlib
+import datetime as dt
+from typing import Dict, List, Tuple
+
+RECONSTRUCTED_NOTE = "reconstructed_dtd_curve"
+
+METHODS = ["fitted", "interpolated", "extrapolated"]
+
+
+def sparse_dtd_targets(
+    origin: str,
+    dest: str,
+    dtd_targets: List[int],
+    sample_size: int,
+    snapshot_date: dt.date,
+) -> List[int]:
+    """
+    The sample_size DTD targets a route may be searched at on snapshot_date.
+
+    Picks are evenly spaced along the sorted targets so each day's samples
+    span the curve, and rotate by one position a day so every DTD is sampled
+    sample_size times per len(dtd_targets) days. A per-route phase keeps
+    routes from all sampling the same DTDs on the same day.
+    """
+    targets = sorted(dtd_targets)
+    n = len(targets)
+    if sample_size <= 0 or sample_size >= n:
+        return targets
+    phase = (snapshot_date.toordinal() + zlib.crc32(f"{origin}_{dest}".encode())) % n
+    picks = sorted({(phase + (i * n) // sample_size) % n for i in range(sample_size)})
+    return [targets[i] for i in picks]
+
+
+def monotone_interpolate(xs: List[float], ys: List[float], x: float) -> float:
+    """
+    Monotone piecewise-cubic Hermite interpolation of (xs, ys) at x.
+
+    xs must be strictly increasing. Interior slopes are the weighted harmonic
+    mean of the neighbouring secants (zero at a local extremum), so the curve
+    is monotone wherever the data are. Outside [xs[0], xs[-1]] the end value
+    is returned.
+    """
+    n = len(xs)
+    if n == 1 or x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+
+    h = [xs[i + 1] - xs[i] for i in range(n - 1)]
+    delta = [(ys[i + 1] - ys[i]) / h[i] for i in range(n - 1)]
+    slopes = [0.0] * n
+    slopes[0] = delta[0]
+    slopes[-1] = delta[-1]
+    for i in range(1, n - 1):
+        if delta[i - 1] * delta[i] <= 0:
+            continue
+        w1 = 2 * h[i] + h[i - 1]
+        w2 = h[i] + 2 * h[i - 1]
+        slopes[i] = (w1 + w2) / (w1 / delta[i - 1] + w2 / delta[i])
+
+    k = max(i for i in range(n - 1) if xs[i] <= x)
+    t = (x - xs[k]) / h[k]
+    h00 = (1 + 2 * t) * (1 - t) ** 2
+    h10 = t * (1 - t) ** 2
+    h01 = t * t * (3 - 2 * t)
+    h11 = t * t * (t - 1)
+    return h00 * ys[k] + h10 * h[k] * slopes[k] + h01 * ys[k + 1] + h11 * h[k] * slopes[k + 1]
+
+
+def reconstruct_curve(
+    dtd_targets: List[int],
+    fresh: Dict[int, float],
+    samples: List[Tuple[int, int, float]],
+    max_age_days: int,
+    iterations: int = 20,
+) -> Tuple[Dict[int, Tuple[float, str]], float]:
+    """
+    Estimated price for every target DTD without a fresh price.
+
+    fresh maps DTD to today's price; samples are earlier (dtd, age in days,
+    price) captures of the route, ignored beyond max_age_days. Log prices are
+    fitted as day level + DTD shape by alternating means, past levels
+    smoothed over neighbouring days so DTDs sampled on different days still
+    share a scale. Today's level comes from the fresh prices alone. Shape at
+    DTDs never sampled is monotone-interpolated between sampled DTDs.
+
+    Returns ({dtd: (price, method)}, residual) where method is one of
+    METHODS and residual is the route's estimated standard error of a
+    reconstructed log price (nan when there are too few samples to tell).
+    Empty without a fresh price to anchor today's level, or when fewer than
+    two DTDs have been sampled to give the curve a shape.
+    """
+    obs = [(dtd, 0, math.log(price)) for dtd, price in fresh.items() if price and price > 0]
+    if not obs:
+        return {}, math.nan
+    obs += [
+        (dtd, age, math.log(price))
+        for dtd, age, price in samples
+        if price and price > 0 and 0 < age <= max_age_days
+    ]
+
+    by_dtd: Dict[int, List[float]] = {}
+    for dtd, _, y in obs:
+        by_dtd.setdefault(dtd, []).append(y)
+    shape = {dtd: sum(ys) / len(ys) for dtd, ys in by_dtd.items()}
+    level: Dict[int, float] = {}
+    for _ in range(iterations):
+        raw: Dict[int, List[float]] = {}
+        for dtd, age, y in obs:
+            raw.setdefault(age, []).append(y - shape[dtd])
+        level = {}
+        for age, values in raw.items():
+            if age == 0:
+                level[age] = sum(values) / len(values)
+                continue
+            total = weight = 0.0
+            for near, w in ((age - 1, 0.5), (age, 1.0), (age + 1, 0.5)):
+                if near > 0 and near in raw:
+                    total += w * sum(raw[near])
+                    weight += w * len(raw[near])
+            level[age] = total / weight
+        residuals: Dict[int, List[float]] = {}
+        for dtd, age, y in obs:
+            residuals.setdefault(dtd, []).append(y - level[age])
+        shape = {dtd: sum(values) / len(values) for dtd, values in residuals.items()}
+
+    # Fit error per degree of freedom, widened for the uncertainty in today's level.
+    dof = len(obs) - len(level) - len(shape) + 1
+    residual = math.nan
+    if dof >= 2:
+        sigma = math.sqrt(sum((y - level[age] - shape[dtd]) ** 2 for dtd, age, y in obs) / dof)
+        residual = sigma * math.sqrt(1 + 1 / sum(1 for _, age, _ in obs if age == 0))
+    if len(shape) < 2:
+        return {}, residual
+    xs = sorted(shape)
+    ys = [shape[x] for x in xs]
+    estimates: Dict[int, Tuple[float, str]] = {}
+    for dtd in dtd_targets:
+        if dtd in fresh:
+            continue
+        if dtd in shape:
+            method = "fitted"
+        elif xs[0] < dtd < xs[-1]:
+            method = "interpolated"
+        else:
+            method = "extrapolated"
+        estimate = level[0] + monotone_interpolate(xs, ys, dtd)
+        estimates[dtd] = (round(math.exp(estimate), 2), method)
+    return estimates, residual
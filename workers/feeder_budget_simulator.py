@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+workers/feeder_budget_simulator.py
+TRAVELTXTTER V5 — OFFLINE FEEDER BUDGET SIMULATOR
+
+Replays past AM/PM feeder runs through the feeder's own selection logic
+(select_buckets, build_search_candidates, select_origin, _pick_dates and
+the dedupe check) without calling Duffel. Whether a simulated search finds
+an offer is decided from history: the route's priced share of real
+searches (Atlas snapshots and the feeder's search_outcomes), hashed
+deterministically per trip date. RAW_DEALS only holds searches that found
+an offer, so it is not used for the rate.
+
+Answers "how many inserts, and what bucket coverage, would N searches,
+candidate multiplier M and dedupe lookback L have produced?" for a grid of
+(N, M, L), one grid point per process.
+
+Inputs are read once from Sheets and Supabase and cached as JSON at
+SIM_INPUT_PATH, so later sweeps run fully offline.
+
+Env:
+- SIM_SEARCHES         comma list of DUFFEL_MAX_SEARCHES_PER_RUN values
+- SIM_MULTIPLIERS      comma list of DUFFEL_CANDIDATE_MULTIPLIER values
+- SIM_LOOKBACKS        comma list of DEDUPE_LOOKBACK_ROWS values
+- SIM_DAYS             days replayed, ending yesterday (default 28)
+- SIM_WORKERS          processes (default: all cores)
+- SIM_UNKNOWN_OFFER_RATE  offer rate for routes with no history (default 0.5)
+
+Read-only: never writes to Sheets, Supabase or Duffel.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import datetime as dt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import pipeline_worker as pw
+
+
+# ─────────────────────────────────────────────
+# ENV HELPERS
+# ─────────────────────────────────────────────
+
+def env_int_list(name: str, default: List[int]) -> List[int]:
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        values = [int(part.strip()) for part in raw.split(",") if part.strip()]
+        return values or default
+    except Exception:
+        return default
+
+
+# ─────────────────────────────────────────────
+# INPUTS
+# ─────────────────────────────────────────────
+
+class RecordsSheet:
+    """Stands in for a worksheet so the feeder's own loaders parse cached records."""
+
+    def __init__(self, title: str, records: List[Dict[str, Any]]) -> None:
+        self.title = title
+        self.records = records
+
+    def get_all_records(self) -> List[Dict[str, Any]]:
+        return self.records
+
+
+def _raw_history(values: List[List[str]]) -> List[Dict[str, str]]:
+    if len(values) < 2:
+        return []
+    hm = {str(h).strip(): i for i, h in enumerate(values[0])}
+    rows: List[Dict[str, str]] = []
+    for r in values[1:]:
+        key = pw._row_trip_key(hm, r)
+        if not key:
+            continue
+        rows.append(
+            {
+                "origin": key[0],
+                "dest": key[1],
+                "outbound": key[2],
+                "return": key[3],
+                "theme": pw._row_col(hm, "theme", r),
+                "ingested_at": pw._row_col(hm, "ingested_at_utc", r),
+            }
+        )
+    return rows
+
+
+def _snapshot_route_counts(page_size: int = 1000) -> Dict[str, List[int]]:
+    url = pw.env_str("MIZAR_SUPABASE_URL")
+    key = pw.env_str("MIZAR_SUPABASE_SERVICE_ROLE_KEY")
+    if pw.create_client is None or not url or not key:
+        print("⚠️  No Mizar Supabase credentials; offer model uses feeder search history only.")
+        return {}
+
+    client = pw.create_client(url, key)
+    counts: Dict[str, List[int]] = {}
+    start = 0
+    while True:
+        page = (
+            client.table("snapshots")
+            .select("origin_iata,destination_iata,price_gbp")
+            .or_(f"notes.is.null,notes.neq.{pw.RECONSTRUCTED_NOTE}")
+            .range(start, start + page_size - 1)
+            .execute()
+        ).data or []
+        for r in page:
+            route = f"{r.get('origin_iata')}|{r.get('destination_iata')}"
+            c = counts.setdefault(route, [0, 0])
+            c[0] += int(r.get("price_gbp") is not None)
+            c[1] += 1
+        if len(page) < page_size:
+            break
+        start += page_size
+    return counts
+
+
+def _search_outcome_counts() -> Dict[str, List[float]]:
+    """Offers and attempts per route from the feeder's search_outcomes cache, if present."""
+    path = pw.env_str("FEEDER_DEDUPE_INDEX_PATH", ".cache/feeder_dedupe.sqlite")
+    if not os.path.exists(path):
+        print(f"⚠️  No feeder search history at {path}; offer model uses snapshots only.")
+        return {}
+
+    history = pw.SearchHistory(path)
+    try:
+        outcomes = history.load()
+    finally:
+        history.close()
+    counts: Dict[str, List[float]] = {}
+    for (origin, dest, _), st in outcomes.items():
+        c = counts.setdefault(f"{origin}|{dest}", [0.0, 0.0])
+        c[0] += st.offers
+        c[1] += st.attempts
+    return counts
+
+
+def fetch_inputs() -> Dict[str, Any]:
+    gc = pw.retry_call(pw.gspread_client, label="authorise gspread client")
+    spreadsheet_key = pw.env_str("SPREADSHEET_ID") or pw.env_str("SHEET_ID")
+    if not spreadsheet_key:
+        raise RuntimeError("Missing SPREADSHEET_ID / SHEET_ID.")
+    sh = pw.retry_call(lambda: gc.open_by_key(spreadsheet_key), label="open spreadsheet")
+
+    def records(tab: str) -> List[Dict[str, Any]]:
+        ws = pw.retry_call(lambda: sh.worksheet(tab), label=f"open worksheet {tab}")
+        return pw.retry_call(lambda: ws.get_all_records(), label=f"read records from {tab}")
+
+    ws_raw = pw.retry_call(
+        lambda: sh.worksheet(pw.env_str("RAW_DEALS_TAB", "RAW_DEALS")),
+        label="open worksheet RAW_DEALS",
+    )
+    raw_values = pw.retry_call(lambda: ws_raw.get_all_values(), label="read RAW_DEALS")
+
+    return {
+        "fetched_at": pw._utc_iso(),
+        "raw_rows": _raw_history(raw_values),
+        "buckets": records(pw.env_str("FEEDER_BUCKETS_TAB", "CONFIG_BUCKETS")),
+        "origins": records(pw.env_str("FEEDER_ORIGINS_TAB", "CONFIG_ORIGINS")),
+        "route_offers": _snapshot_route_counts(),
+        "search_outcomes": _search_outcome_counts(),
+    }
+
+
+def load_inputs(path: str, refresh: bool) -> Dict[str, Any]:
+    if path and os.path.exists(path) and not refresh:
+        with open(path, "r", encoding="utf-8") as f:
+            inputs = json.load(f)
+        print(f"📂 Loaded cached simulator inputs from {path} (fetched {inputs.get('fetched_at')})")
+        return inputs
+
+    inputs = fetch_inputs()
+    if path:
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(inputs, f)
+        print(f"💾 Cached simulator inputs at {path}")
+    return inputs
+
+
+# ─────────────────────────────────────────────
+# OFFER MODEL
+# ─────────────────────────────────────────────
+
+def route_offer_rates(inputs: Dict[str, Any]) -> Dict[str, float]:
+    """Priced share of each route's searches, from Atlas snapshots and feeder search outcomes."""
+    counts: Dict[str, List[float]] = {k: list(v) for k, v in (inputs.get("route_offers") or {}).items()}
+    for route, (offers, attempts) in (inputs.get("search_outcomes") or {}).items():
+        c = counts.setdefault(route, [0, 0])
+        c[0] += offers
+        c[1] += attempts
+    return {route: priced / total for route, (priced, total) in counts.items() if total}
+
+
+def simulated_offer(trip_key: pw.TripKey, rates: Dict[str, float], unknown_rate: float) -> bool:
+    origin, dest, out_date, _ = trip_key
+    rate = rates.get(f"{origin}|{dest}", unknown_rate)
+    h = int(hashlib.sha1(f"{origin}|{dest}|{out_date}".encode()).hexdigest()[:8], 16)
+    return h / 0xFFFFFFFF < rate
+
+
+# ─────────────────────────────────────────────
+# SIMULATION
+# ─────────────────────────────────────────────
+
+@dataclass
+class SimParams:
+    max_searches: int
+    multiplier: int
+    lookback_rows: int
+    dests_per_bucket: int = 2
+    max_inserts: int = 20
+
+
+@dataclass
+class SimResult:
+    params: SimParams
+    runs: int = 0
+    searches: int = 0
+    inserts: int = 0
+    no_offer: int = 0
+    dedupe_skips: int = 0
+    inserts_by_bucket: Dict[int, int] = field(default_factory=dict)
+    unique_dests: int = 0
+
+    def bucket_balance(self) -> float:
+        counts = list(self.inserts_by_bucket.values())
+        if not counts or max(counts) == 0:
+            return 0.0
+        return round(min(counts) / max(counts), 2)
+
+
+SLOT_TIMES_UTC = {"AM": dt.time(6, 30), "PM": dt.time(16, 30)}
+
+_INPUTS: Dict[str, Any] = {}
+
+
+def _init_worker(inputs: Dict[str, Any]) -> None:
+    global _INPUTS
+    _INPUTS = inputs
+
+
+def simulate(params: SimParams, inputs: Dict[str, Any], start: dt.date, days: int, unknown_rate: float) -> SimResult:
+    """Serial rotation-mode feeder loop, run once per AM/PM slot in the window."""
+    all_buckets = pw.load_buckets(RecordsSheet("CONFIG_BUCKETS", inputs["buckets"]))
+    tier_airports = pw.load_origins(RecordsSheet("CONFIG_ORIGINS", inputs["origins"]))
+    blocked_iatas = pw.load_blocked_destination_iatas()
+    blocked_countries = pw.load_blocked_country_aliases()
+    rates = route_offer_rates(inputs)
+
+    raw_rows = sorted(inputs.get("raw_rows") or [], key=lambda r: r.get("ingested_at") or "")
+    start_iso = start.isoformat()
+    themes: Dict[str, str] = {}
+    recent: Deque[pw.TripKey] = deque(maxlen=max(1, params.lookback_rows))
+    for r in raw_rows:
+        day = (r.get("ingested_at") or "")[:10]
+        if day < start_iso:
+            recent.append((r["origin"], r["dest"], r["outbound"], r["return"]))
+        elif r.get("theme"):
+            themes.setdefault(day, r["theme"])
+
+    result = SimResult(params=params, inserts_by_bucket={b: 0 for b in sorted(all_buckets)})
+    dests_seen = set()
+    candidates_per_bucket = max(params.dests_per_bucket, params.dests_per_bucket * params.multiplier)
+
+    for d in range(days):
+        day = start + dt.timedelta(days=d)
+        travel_p = pw.params_for_theme(themes.get(day.isoformat(), "DEFAULT"))
+        trip_len = (travel_p.trip_min + travel_p.trip_max) // 2
+
+        for slot, slot_time in SLOT_TIMES_UTC.items():
+            now = dt.datetime.combine(day, slot_time, tzinfo=dt.timezone.utc)
+            now_epoch = int(now.timestamp())
+            dix = pw.day_index(slot, now)
+            dedupe = set(recent)
+            result.runs += 1
+
+            queues = []
+            for bucket_id, seed in zip(pw.select_buckets(dix), (dix, dix + 100)):
+                dests = all_buckets.get(bucket_id, [])
+                candidates = pw.build_search_candidates(
+                    bucket_id=bucket_id,
+                    bucket_name=dests[0].bucket_name if dests else "",
+                    bucket_dests=dests,
+                    dix=seed,
+                    desired_count=candidates_per_bucket,
+                    allow_c_tier=bucket_id == 6,
+                )
+                queues.append(
+                    [
+                        c for c in candidates
+                        if not pw.is_blocked_destination(c.destination_iata, c.country, blocked_iatas, blocked_countries)
+                    ]
+                )
+
+            searches = 0
+            inserts = 0
+            for slot_offset, dest in enumerate(pw.interleave_queues(queues[0], queues[1])):
+                if searches >= params.max_searches or inserts >= params.max_inserts:
+                    break
+                origin = pw.select_origin(tier_airports, dest.bucket_id, dix, slot_offset)
+                if not origin:
+                    continue
+                out_date, ret_date = pw._pick_dates(
+                    dix + slot_offset, travel_p.win_min, travel_p.win_max, trip_len, now_epoch
+                )
+                trip_key = (origin, dest.destination_iata, out_date, ret_date)
+                if trip_key in dedupe:
+                    result.dedupe_skips += 1
+                    continue
+                searches += 1
+                if not simulated_offer(trip_key, rates, unknown_rate):
+                    result.no_offer += 1
+                    continue
+                inserts += 1
+                dedupe.add(trip_key)
+                recent.append(trip_key)
+                dests_seen.add(dest.destination_iata)
+                result.inserts_by_bucket[dest.bucket_id] = result.inserts_by_bucket.get(dest.bucket_id, 0) + 1
+
+            result.searches += searches
+            result.inserts += inserts
+
+    result.unique_dests = len(dests_seen)
+    return result
+
+
+def _simulate_task(args: Tuple[SimParams, dt.date, int, float]) -> SimResult:
+    params, start, days, unknown_rate = args
+    return simulate(params, _INPUTS, start, days, unknown_rate)
+
+
+def sweep(
+    grid: List[SimParams],
+    inputs: Dict[str, Any],
+    start: dt.date,
+    days: int,
+    unknown_rate: float,
+    workers: Optional[int] = None,
+) -> List[SimResult]:
+    tasks = [(p, start, days, unknown_rate) for p in grid]
+    if (workers or 0) == 1 or len(grid) == 1:
+        _init_worker(inputs)
+        return [_simulate_task(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(inputs,)) as pool:
+        return list(pool.map(_simulate_task, tasks))
+
+
+# ─────────────────────────────────────────────
+# MAIN
+# ─────────────────────────────────────────────
+
+def main() -> int:
+    print("=" * 70)
+    print("TRAVELTXTTER V5 — FEEDER BUDGET SIMULATOR (offline)")
+    print("=" * 70)
+
+    searches = env_int_list("SIM_SEARCHES", [pw.env_int("DUFFEL_MAX_SEARCHES_PER_RUN", 4)])
+    multipliers = env_int_list("SIM_MULTIPLIERS", [pw.env_int("DUFFEL_CANDIDATE_MULTIPLIER", 2)])
+    lookbacks = env_int_list("SIM_LOOKBACKS", [pw.env_int("DEDUPE_LOOKBACK_ROWS", 2000)])
+    dests_per_bucket = pw.env_int("DUFFEL_ROUTES_PER_RUN", 2)
+    max_inserts = pw.env_int("DUFFEL_MAX_INSERTS", 20)
+    days = pw.env_int("SIM_DAYS", 28)
+    workers = pw.env_int("SIM_WORKERS", 0) or None
+    unknown_rate = pw.env_float("SIM_UNKNOWN_OFFER_RATE", 0.5)
+    input_path = pw.env_str("SIM_INPUT_PATH", ".cache/feeder_sim_inputs.json")
+    refresh = pw.env_str("SIM_REFRESH_INPUTS", "false").lower() in ("1", "true", "yes")
+
+    inputs = load_inputs(input_path, refresh)
+    start = dt.datetime.now(dt.timezone.utc).date() - dt.timedelta(days=days)
+
+    grid = [
+        SimParams(n, m, lb, dests_per_bucket, max_inserts)
+        for n in searches
+        for m in multipliers
+        for lb in lookbacks
+    ]
+    print(f"📅 Replaying {days} day(s) from {start} | {len(grid)} grid point(s) | workers={workers or os.cpu_count()}")
+    print(f"📚 History: {len(inputs.get('raw_rows') or [])} RAW_DEALS row(s) | {len(inputs.get('route_offers') or {})} snapshot route(s) | "
+          f"{len(inputs.get('search_outcomes') or {})} searched route(s)")
+
+    started = dt.datetime.now()
+    results = sweep(grid, inputs, start, days, unknown_rate, workers)
+    elapsed = (dt.datetime.now() - started).total_seconds()
+
+    print("=" * 70)
+    print(f"{'N':>4} {'M':>3} {'L':>6} | {'searches':>8} {'inserts':>7} {'ins/srch':>8} {'dedupe':>6} {'no_off':>6} {'dests':>5} {'balance':>7} | per-bucket")
+    for r in sorted(results, key=lambda x: (-x.inserts, x.params.max_searches)):
+        p = r.params
+        per_search = round(r.inserts / max(1, r.searches), 2)
+        buckets = " ".join(f"{b}:{n}" for b, n in sorted(r.inserts_by_bucket.items()))
+        print(
+            f"{p.max_searches:>4} {p.multiplier:>3} {p.lookback_rows:>6} | "
+            f"{r.searches:>8} {r.inserts:>7} {per_search:>8} {r.dedupe_skips:>6} {r.no_offer:>6} "
+            f"{r.unique_dests:>5} {r.bucket_balance():>7} | {buckets}"
+        )
+
+    out_path = pw.env_str("SIM_OUTPUT_PATH")
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+        print(f"💾 Wrote results to {out_path}")
+
+    print(f"\n⏱️  Sweep finished in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
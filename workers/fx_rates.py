@@ -0,0 +1,115 @@
+# workers/fx_rates.py
+"""
+GBP conversion for Duffel offers quoted in other currencies.
+
+Some suppliers only answer in EUR or USD, and a search whose offers are all
+non-GBP used to be thrown away. Offers in a currency with a known rate are
+now converted to GBP and enter selection like any other offer, keeping
+their quoted currency in OfferSummary.fx_currency.
+
+Rates are the daily GBP crosses atlas_market_signals.py stores in
+daily_market_signals (gbp_usd_rate = USD per GBP, gbp_eur_rate = EUR per
+GBP). They are read once per run, the latest non-null value per currency on
+or before the run date, and held in memory for every conversion after that.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from offer_summary import OfferSummary
+
+RATE_COLUMNS = {"USD": "gbp_usd_rate", "EUR": "gbp_eur_rate"}
+
+
+class FxRates:
+    """Units of each currency per GBP, as of signal_dates[currency]."""
+
+    def __init__(
+        self,
+        rates: Dict[str, float],
+        signal_dates: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.rates = {currency: rate for currency, rate in rates.items() if rate and rate > 0}
+        self.rates["GBP"] = 1.0
+        self.signal_dates = signal_dates or {}
+
+    def __bool__(self) -> bool:
+        return len(self.rates) > 1
+
+    def __repr__(self) -> str:
+        return ", ".join(
+            f"GBP/{currency} {rate} ({self.signal_dates.get(currency, '?')})"
+            for currency, rate in sorted(self.rates.items())
+            if currency != "GBP"
+        ) or "GBP only"
+
+    def supports(self, currency: str) -> bool:
+        return currency in self.rates
+
+    def to_gbp(self, amount: Optional[float], currency: str) -> Optional[float]:
+        rate = self.rates.get(currency)
+        if amount is None or rate is None:
+            return None
+        return round(amount / rate, 2)
+
+    def normalise(self, offers: Iterable[OfferSummary]) -> Tuple[List[OfferSummary], int]:
+        """
+        The offers with every convertible non-GBP price turned into GBP.
+
+        Converted offers are copies with currency GBP and fx_currency set;
+        GBP offers and offers in unknown currencies are passed through
+        untouched. Returns (offers, number converted).
+        """
+        normalised: List[OfferSummary] = []
+        converted = 0
+        for offer in offers:
+            if offer.currency == "GBP" or offer.price is None or not self.supports(offer.currency):
+                normalised.append(offer)
+                continue
+            normalised.append(
+                OfferSummary(
+                    offer_id=offer.offer_id,
+                    price=self.to_gbp(offer.price, offer.currency),
+                    currency="GBP",
+                    owner_iata=offer.owner_iata,
+                    cabin_class=offer.cabin_class,
+                    slice_minutes=offer.slice_minutes,
+                    segment_counts=offer.segment_counts,
+                    carriers=offer.carriers,
+                    lcc_present=offer.lcc_present,
+                    bags=offer.bags,
+                    stops=offer.stops,
+                    source=offer.source,
+                    fx_currency=offer.currency,
+                )
+            )
+            converted += 1
+        return normalised, converted
+
+
+def load_fx_rates(
+    supabase: Any,
+    on_or_before: dt.date,
+    max_age_days: int = 7,
+) -> FxRates:
+    """Latest rate per currency from daily_market_signals within max_age_days of on_or_before."""
+    rows = (
+        supabase.table("daily_market_signals")
+        .select("signal_date," + ",".join(RATE_COLUMNS.values()))
+        .lte("signal_date", str(on_or_before))
+        .gte("signal_date", str(on_or_before - dt.timedelta(days=max_age_days)))
+        .order("signal_date", desc=True)
+        .execute()
+    ).data or []
+
+    rates: Dict[str, float] = {}
+    signal_dates: Dict[str, str] = {}
+    for row in rows:
+        for currency, column in RATE_COLUMNS.items():
+            if currency in rates or row.get(column) is None:
+                continue
+            rates[currency] = float(row[column])
+            signal_dates[currency] = str(row.get("signal_date"))[:10]
+    return FxRates(rates, signal_dates)
@@ -0,0 +1,270 @@
+# workers/holiday_calendar.py
+"""
+Season and UK bank holiday features as precomputed day-indexed tables.
+
+assign_season_bucket, days_to_next_bank_holiday, trip_overlaps_holiday and
+holiday_intensity_score used to be copied into every worker that needed
+them and applied row by row, each scanning a hand-written holiday list that
+stopped at 2027. Here they are computed once per process, for every day
+from CALENDAR_START to CALENDAR_END, into numpy arrays:
+
+- season code per day (index into SEASON_BUCKETS);
+- days to the next bank holiday on or after the day;
+- holiday intensity score;
+- a cumulative bank holiday count, so whether [outbound, return] contains a
+  holiday is one subtraction.
+
+calendar_features() looks whole date columns up in those arrays. The scalar
+functions are single lookups for code that works row by row.
+
+Bank holidays are England and Wales, generated from the statutory rules
+with weekend substitution, plus the one-off changes listed in
+ONE_OFF_CHANGES. Dates that are missing, unparseable or outside the span
+get the defaults the workers already used for unparseable dates.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SEASON_BUCKETS = ["christmas", "easter", "summer_peak", "ski", "half_term", "shoulder", "off_peak"]
+
+SEASON_INTENSITY = {
+    "christmas": 0.95,
+    "easter": 0.85,
+    "summer_peak": 0.90,
+    "half_term": 0.75,
+    "ski": 0.70,
+    "shoulder": 0.45,
+    "off_peak": 0.20,
+}
+
+# Bonus for departing within this many days of a bank holiday.
+NEAR_HOLIDAY_DAYS = 3
+NEAR_HOLIDAY_BONUS = 0.15
+
+# Returned when no bank holiday is known on or after the day.
+NO_HOLIDAY_DAYS = 365
+
+DEFAULT_SEASON = "off_peak"
+DEFAULT_INTENSITY = SEASON_INTENSITY[DEFAULT_SEASON]
+
+CALENDAR_START = dt.date(2015, 1, 1)
+CALENDAR_END = dt.date(2045, 12, 31)
+
+# (removed, added) per year, from the gov.uk announcements.
+ONE_OFF_CHANGES: Dict[int, Tuple[List[dt.date], List[dt.date]]] = {
+    2020: ([dt.date(2020, 5, 4)], [dt.date(2020, 5, 8)]),
+    2022: ([dt.date(2022, 5, 30)], [dt.date(2022, 6, 2), dt.date(2022, 6, 3), dt.date(2022, 9, 19)]),
+    2023: ([], [dt.date(2023, 5, 8)]),
+}
+
+
+def easter_sunday(year: int) -> dt.date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(year, month, day + 1)
+
+
+def _substituted(days: List[dt.date]) -> List[dt.date]:
+    """Consecutive fixed-date holidays, each moved to the next free weekday."""
+    placed: List[dt.date] = []
+    for day in days:
+        while day.weekday() >= 5 or day in placed:
+            day += dt.timedelta(days=1)
+        placed.append(day)
+    return placed
+
+
+def _first_monday(year: int, month: int) -> dt.date:
+    first = dt.date(year, month, 1)
+    return first + dt.timedelta(days=(7 - first.weekday()) % 7)
+
+
+def _last_monday(year: int, month: int) -> dt.date:
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=last.weekday())
+
+
+def uk_bank_holidays(year: int) -> List[dt.date]:
+    """England and Wales bank holidays in year, sorted."""
+    easter = easter_sunday(year)
+    days = set(_substituted([dt.date(year, 1, 1)]))
+    days.update(_substituted([dt.date(year, 12, 25), dt.date(year, 12, 26)]))
+    days.update(
+        [
+            easter - dt.timedelta(days=2),
+            easter + dt.timedelta(days=1),
+            _first_monday(year, 5),
+            _last_monday(year, 5),
+            _last_monday(year, 8),
+        ]
+    )
+    removed, added = ONE_OFF_CHANGES.get(year, ([], []))
+    days.difference_update(removed)
+    days.update(added)
+    return sorted(days)
+
+
+def _season_rule(month: int, day: int) -> str:
+    if (month == 12 and day >= 20) or (month == 1 and day <= 5):
+        return "christmas"
+    if (month == 4 and 1 <= day <= 15) or (month == 3 and 24 <= day <= 31):
+        return "easter"
+    if (month == 7 and day >= 15) or month == 8 or (month == 9 and day <= 1):
+        return "summer_peak"
+    if (month == 1 and day >= 15) or month == 2 or (month == 3 and day <= 15):
+        return "ski"
+    if month == 10 and 19 <= day <= 30:
+        return "half_term"
+    if month in (4, 5, 6, 9, 10):
+        return "shoulder"
+    return "off_peak"
+
+
+# ------------------------------------------------------------
+# Day-indexed tables
+# ------------------------------------------------------------
+
+UK_BANK_HOLIDAYS = [
+    day
+    for year in range(CALENDAR_START.year, CALENDAR_END.year + 1)
+    for day in uk_bank_holidays(year)
+    if CALENDAR_START <= day <= CALENDAR_END
+]
+
+_EPOCH = np.datetime64(CALENDAR_START, "D")
+_DAYS = (CALENDAR_END - CALENDAR_START).days + 1
+
+
+def _build_tables() -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    days = [CALENDAR_START + dt.timedelta(days=i) for i in range(_DAYS)]
+    season = np.array([SEASON_BUCKETS.index(_season_rule(d.month, d.day)) for d in days], dtype=np.int8)
+
+    is_holiday = np.zeros(_DAYS, dtype=bool)
+    is_holiday[[(h - CALENDAR_START).days for h in UK_BANK_HOLIDAYS]] = True
+
+    # Walk backwards carrying the index of the next holiday on or after each day.
+    days_to_next = np.full(_DAYS, NO_HOLIDAY_DAYS, dtype=np.int32)
+    next_holiday = None
+    for i in range(_DAYS - 1, -1, -1):
+        if is_holiday[i]:
+            next_holiday = i
+        if next_holiday is not None:
+            days_to_next[i] = next_holiday - i
+
+    intensity = np.array([SEASON_INTENSITY[name] for name in SEASON_BUCKETS])[season]
+    near = days_to_next <= NEAR_HOLIDAY_DAYS
+    intensity[near] = np.minimum(1.0, intensity[near] + NEAR_HOLIDAY_BONUS)
+    intensity = np.round(intensity, 3)
+
+    # holidays_before[i] = bank holidays strictly before day i, so [a, b] holds
+    # holidays_before[b + 1] - holidays_before[a] of them.
+    holidays_before = np.zeros(_DAYS + 1, dtype=np.int32)
+    np.cumsum(is_holiday, out=holidays_before[1:])
+    return season, days_to_next, intensity, holidays_before
+
+
+_SEASON, _DAYS_TO_NEXT, _INTENSITY, _HOLIDAYS_BEFORE = _build_tables()
+_SEASON_NAMES = np.array(SEASON_BUCKETS + [DEFAULT_SEASON], dtype=object)
+
+
+def _parse_day(value: Any) -> np.datetime64:
+    try:
+        return np.datetime64(str(value)[:10], "D")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT")
+
+
+def day_index(values: Any) -> np.ndarray:
+    """
+    Day offsets from CALENDAR_START for a column of dates, -1 where unknown.
+
+    Accepts datetime64 arrays/Series, or sequences of date, datetime or ISO
+    strings (anything after the first 10 characters is ignored); None, NaN
+    and unparseable values count as unknown, as do days outside the span.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == "M":
+        days = arr.astype("datetime64[D]")
+    else:
+        try:
+            days = arr.astype("datetime64[D]")
+        except (TypeError, ValueError):
+            days = np.array([_parse_day(v) for v in arr.ravel()], dtype="datetime64[D]")
+    index = (days - _EPOCH).astype(np.int64)
+    index[np.isnat(days) | (index < 0) | (index >= _DAYS)] = -1
+    return index
+
+
+def calendar_features(outbound: Any, return_dates: Optional[Any] = None) -> Dict[str, np.ndarray]:
+    """
+    season_bucket, days_to_next_bank_holiday, trip_overlaps_holiday and
+    holiday_intensity_score for a column of outbound dates.
+
+    Without return_dates (or where a return date is unknown) trips are taken
+    not to overlap a holiday.
+    """
+    out_index = day_index(outbound)
+    known = out_index >= 0
+    safe = np.where(known, out_index, 0)
+
+    season_code = np.where(known, _SEASON[safe], len(SEASON_BUCKETS))
+    days_to_next = np.where(known, _DAYS_TO_NEXT[safe], NO_HOLIDAY_DAYS)
+    intensity = np.where(known, _INTENSITY[safe], DEFAULT_INTENSITY)
+
+    overlaps = np.zeros(len(out_index), dtype=bool)
+    if return_dates is not None:
+        ret_index = day_index(return_dates)
+        both = known & (ret_index >= 0)
+        ret_safe = np.where(both, ret_index, 0)
+        overlaps = both & (_HOLIDAYS_BEFORE[ret_safe + 1] > _HOLIDAYS_BEFORE[safe])
+
+    return {
+        "season_bucket": _SEASON_NAMES[season_code],
+        "days_to_next_bank_holiday": days_to_next,
+        "trip_overlaps_holiday": overlaps,
+        "holiday_intensity_score": intensity,
+    }
+
+
+# ------------------------------------------------------------
+# Single-date lookups
+# ------------------------------------------------------------
+
+def _index(d: Any) -> int:
+    return int(day_index([d])[0])
+
+
+def assign_season_bucket(d: Any) -> str:
+    i = _index(d)
+    return SEASON_BUCKETS[_SEASON[i]] if i >= 0 else DEFAULT_SEASON
+
+
+def days_to_next_bank_holiday(d: Any) -> int:
+    i = _index(d)
+    return int(_DAYS_TO_NEXT[i]) if i >= 0 else NO_HOLIDAY_DAYS
+
+
+def trip_overlaps_holiday(outbound: Any, return_date: Any) -> bool:
+    i, j = _index(outbound), _index(return_date)
+    if i < 0 or j < 0:
+        return False
+    return bool(_HOLIDAYS_BEFORE[j + 1] > _HOLIDAYS_BEFORE[i])
+
+
+def holiday_intensity_score(d: Any) -> float:
+    i = _index(d)
+    return float(_INTENSITY[i]) if i >= 0 else DEFAULT_INTENSITY
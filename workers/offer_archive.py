@@ -0,0 +1,290 @@
+# workers/offer_archive.py
+"""
+Compact columnar archive of every offer a capture run saw.
+
+Capture keeps one reference fare per search, so testing a new reference
+fare policy used to mean paying for new Duffel searches. Each run now also
+writes one compressed .npz holding, for every search, every offer's price,
+currency, slice durations, segment counts and carriers, so policies can be
+replayed offline (see atlas_offer_replay.py).
+
+Layout (all plain arrays, no pickles):
+- search_*  one entry per search; search_offer_start/count index the offers
+- offer_*   one entry per offer, priced as quoted; offer_slice_start/count index the slices
+- slice_*   one entry per slice (minutes -1 when Duffel's duration was unparseable)
+- fx_*      one entry per currency the run converted to GBP (units per GBP and
+            signal date); empty when FX conversion was off. Version 1
+            archives predate them and read back as empty.
+"""
+
+from __future__ import annotations
+
+import os
+import glob
+import threading
+import datetime as dt
+from uuid import uuid4
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from fx_rates import FxRates
+from offer_summary import OfferSummary
+
+ARCHIVE_VERSION = 2
+READABLE_VERSIONS = {1, 2}
+ARCHIVE_PREFIX = "atlas_offers_"
+
+
+class OfferArchive:
+    """Collects a run's offers in memory; thread-safe so concurrent searches can add."""
+
+    def __init__(self, snapshot_date: dt.date, capture_time: str, fx: Optional[FxRates] = None) -> None:
+        self.snapshot_date = str(snapshot_date)
+        self.capture_time = capture_time
+        self.fx = fx
+        self._lock = threading.Lock()
+        self._search: Dict[str, List[Any]] = {
+            "origin": [],
+            "destination": [],
+            "outbound_date": [],
+            "return_date": [],
+            "distance_km": [],
+            "complete": [],
+            "offer_start": [],
+            "offer_count": [],
+        }
+        self._offer: Dict[str, List[Any]] = {
+            "price": [],
+            "currency": [],
+            "owner_iata": [],
+            "cabin_class": [],
+            "carriers": [],
+            "lcc_present": [],
+            "bags": [],
+            "stops": [],
+            "slice_start": [],
+            "slice_count": [],
+        }
+        self._slice: Dict[str, List[Any]] = {"minutes": [], "segments": []}
+
+    def __len__(self) -> int:
+        return len(self._search["origin"])
+
+    def add(
+        self,
+        origin: str,
+        dest: str,
+        outbound: dt.date,
+        return_date: dt.date,
+        distance_km: Optional[int],
+        offers: List[OfferSummary],
+        complete: bool,
+    ) -> None:
+        with self._lock:
+            search, offer_cols, slice_cols = self._search, self._offer, self._slice
+            search["origin"].append(origin)
+            search["destination"].append(dest)
+            search["outbound_date"].append(str(outbound))
+            search["return_date"].append(str(return_date))
+            search["distance_km"].append(-1 if distance_km is None else distance_km)
+            search["complete"].append(bool(complete))
+            search["offer_start"].append(len(offer_cols["price"]))
+            search["offer_count"].append(len(offers))
+            for offer in offers:
+                offer_cols["price"].append(float("nan") if offer.price is None else offer.price)
+                offer_cols["currency"].append(offer.currency)
+                offer_cols["owner_iata"].append(offer.owner_iata)
+                offer_cols["cabin_class"].append(offer.cabin_class)
+                offer_cols["carriers"].append("|".join(offer.carriers))
+                offer_cols["lcc_present"].append(offer.lcc_present)
+                offer_cols["bags"].append(offer.bags)
+                offer_cols["stops"].append(-1 if offer.stops is None else offer.stops)
+                offer_cols["slice_start"].append(len(slice_cols["minutes"]))
+                offer_cols["slice_count"].append(len(offer.slice_minutes))
+                for minutes, segments in zip(offer.slice_minutes, offer.segment_counts):
+                    slice_cols["minutes"].append(-1 if minutes is None else minutes)
+                    slice_cols["segments"].append(segments)
+
+    def save(self, directory: str) -> str:
+        """Write the run to <directory>/atlas_offers_<date>_<HHMM>_<id>.npz and return the path."""
+        if np is None:
+            raise RuntimeError("numpy is required to write the offer archive")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory,
+            f"{ARCHIVE_PREFIX}{self.snapshot_date}_{self.capture_time.replace(':', '')}_{uuid4().hex[:8]}.npz",
+        )
+        fx_currencies = sorted(c for c in (self.fx.rates if self.fx else {}) if c != "GBP")
+        with self._lock:
+            arrays = {
+                "version": np.array(ARCHIVE_VERSION, dtype=np.int16),
+                "snapshot_date": np.array(self.snapshot_date),
+                "capture_time": np.array(self.capture_time),
+                "search_origin": np.array(self._search["origin"], dtype=str),
+                "search_destination": np.array(self._search["destination"], dtype=str),
+                "search_outbound_date": np.array(self._search["outbound_date"], dtype=str),
+                "search_return_date": np.array(self._search["return_date"], dtype=str),
+                "search_distance_km": np.array(self._search["distance_km"], dtype=np.int32),
+                "search_complete": np.array(self._search["complete"], dtype=bool),
+                "search_offer_start": np.array(self._search["offer_start"], dtype=np.int32),
+                "search_offer_count": np.array(self._search["offer_count"], dtype=np.int32),
+                "offer_price": np.array(self._offer["price"], dtype=np.float64),
+                "offer_currency": np.array(self._offer["currency"], dtype=str),
+                "offer_owner_iata": np.array(self._offer["owner_iata"], dtype=str),
+                "offer_cabin_class": np.array(self._offer["cabin_class"], dtype=str),
+                "offer_carriers": np.array(self._offer["carriers"], dtype=str),
+                "offer_lcc_present": np.array(self._offer["lcc_present"], dtype=bool),
+                "offer_bags": np.array(self._offer["bags"], dtype=np.int16),
+                "offer_stops": np.array(self._offer["stops"], dtype=np.int16),
+                "offer_slice_start": np.array(self._offer["slice_start"], dtype=np.int32),
+                "offer_slice_count": np.array(self._offer["slice_count"], dtype=np.int8),
+                "slice_minutes": np.array(self._slice["minutes"], dtype=np.int32),
+                "slice_segments": np.array(self._slice["segments"], dtype=np.int16),
+                "fx_currency": np.array(fx_currencies, dtype=str),
+                "fx_rate": np.array([self.fx.rates[c] for c in fx_currencies], dtype=np.float64),
+                "fx_signal_date": np.array([self.fx.signal_dates.get(c, "") for c in fx_currencies], dtype=str),
+            }
+        np.savez_compressed(path, **arrays)
+        return path
+
+
+class ArchivedSearch:
+    """One archived search: its route, distance and the offers Duffel returned."""
+
+    __slots__ = (
+        "snapshot_date",
+        "capture_time",
+        "origin",
+        "destination",
+        "outbound_date",
+        "return_date",
+        "distance_km",
+        "complete",
+        "offers",
+    )
+
+    def __init__(
+        self,
+        snapshot_date: str,
+        capture_time: str,
+        origin: str,
+        destination: str,
+        outbound_date: str,
+        return_date: str,
+        distance_km: Optional[int],
+        complete: bool,
+        offers: List[OfferSummary],
+    ) -> None:
+        self.snapshot_date = snapshot_date
+        self.capture_time = capture_time
+        self.origin = origin
+        self.destination = destination
+        self.outbound_date = outbound_date
+        self.return_date = return_date
+        self.distance_km = distance_km
+        self.complete = complete
+        self.offers = offers
+
+    @property
+    def snapshot_key(self) -> str:
+        return (
+            f"{self.origin}_{self.destination}_{self.outbound_date}_{self.return_date}_"
+            f"{self.snapshot_date}_{self.capture_time.replace(':', '')}"
+        )
+
+
+def load_columns(path: str, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Read one archive's arrays (all, or just names) without building records."""
+    if np is None:
+        raise RuntimeError("numpy is required to read the offer archive")
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data["version"])
+        if version not in READABLE_VERSIONS:
+            raise ValueError(f"{path}: unsupported archive version {version}")
+        columns = {name: data[name] for name in (names or data.files) if name in data.files}
+    for name, dtype in (("fx_currency", str), ("fx_rate", np.float64), ("fx_signal_date", str)):
+        if names is None or name in names:
+            columns.setdefault(name, np.array([], dtype=dtype))
+    return columns
+
+
+def archive_fx(columns: Dict[str, Any]) -> FxRates:
+    """The rates the run converted with, from load_columns() output (GBP only when none)."""
+    currencies = columns["fx_currency"].tolist()
+    return FxRates(
+        dict(zip(currencies, columns["fx_rate"].tolist())),
+        dict(zip(currencies, columns["fx_signal_date"].tolist())),
+    )
+
+
+def load_archive(path: str) -> List[ArchivedSearch]:
+    """Read one archive file back into OfferSummary records."""
+    columns = {name: values.tolist() for name, values in load_columns(path).items()}
+
+    slice_minutes: List[Optional[int]] = [None if m < 0 else m for m in columns["slice_minutes"]]
+    slice_segments: List[int] = columns["slice_segments"]
+    offers: List[OfferSummary] = []
+    for i, price in enumerate(columns["offer_price"]):
+        start = columns["offer_slice_start"][i]
+        end = start + columns["offer_slice_count"][i]
+        carriers = columns["offer_carriers"][i]
+        stops = columns["offer_stops"][i]
+        offers.append(
+            OfferSummary(
+                price=None if price != price else price,
+                currency=columns["offer_currency"][i],
+                owner_iata=columns["offer_owner_iata"][i],
+                cabin_class=columns["offer_cabin_class"][i],
+                slice_minutes=tuple(slice_minutes[start:end]),
+                segment_counts=tuple(slice_segments[start:end]),
+                carriers=tuple(carriers.split("|")) if carriers else (),
+                lcc_present=columns["offer_lcc_present"][i],
+                bags=columns["offer_bags"][i],
+                stops=None if stops < 0 else stops,
+                source="archive",
+            )
+        )
+
+    searches = []
+    for i, origin in enumerate(columns["search_origin"]):
+        start = columns["search_offer_start"][i]
+        distance_km = columns["search_distance_km"][i]
+        searches.append(
+            ArchivedSearch(
+                snapshot_date=columns["snapshot_date"],
+                capture_time=columns["capture_time"],
+                origin=origin,
+                destination=columns["search_destination"][i],
+                outbound_date=columns["search_outbound_date"][i],
+                return_date=columns["search_return_date"][i],
+                distance_km=None if distance_km < 0 else distance_km,
+                complete=columns["search_complete"][i],
+                offers=offers[start:start + columns["search_offer_count"][i]],
+            )
+        )
+    return searches
+
+
+def archive_paths(
+    directory: str,
+    since: Optional[dt.date] = None,
+    until: Optional[dt.date] = None,
+) -> List[str]:
+    """Archive files in directory, oldest first, optionally limited to snapshot dates [since, until]."""
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{ARCHIVE_PREFIX}*.npz"))):
+        stamp = os.path.basename(path)[len(ARCHIVE_PREFIX):len(ARCHIVE_PREFIX) + 10]
+        try:
+            day = dt.date.fromisoformat(stamp)
+        except ValueError:
+            continue
+        if since is not None and day < since:
+            continue
+        if until is not None and day > until:
+            continue
+        paths.append(path)
+    return paths
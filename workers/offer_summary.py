@@ -0,0 +1,193 @@
+# workers/offer_summary.py
+"""
+Single-pass Duffel offer summaries shared by the feeder and Atlas capture.
+
+A raw Duffel offer is a deep dict (slices → segments → carriers, services,
+conditions, passengers …) that easily runs to tens of kilobytes. Both
+workers only ever read a handful of fields from it, so each offer is
+walked once into a compact __slots__ record and the raw dict is dropped
+as soon as its page has been summarised.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+LCC_CARRIER_NAMES = {"ryanair", "easyjet", "wizz air", "norwegian"}
+
+_DURATION_RE = re.compile(r"P(?:(?P<days>\d+)D)?T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?")
+
+
+def parse_iso8601_duration_minutes(value: Any) -> Optional[int]:
+    """Convert Duffel ISO-8601 duration strings such as PT2H35M into minutes."""
+    if not value or not isinstance(value, str):
+        return None
+
+    match = _DURATION_RE.fullmatch(value)
+    if not match:
+        return None
+
+    days = int(match.group("days") or 0)
+    hours = int(match.group("hours") or 0)
+    minutes = int(match.group("minutes") or 0)
+    return days * 1440 + hours * 60 + minutes
+
+
+class OfferSummary:
+    """
+    The fields of one offer that the workers actually use.
+
+    slice_minutes holds one entry per slice (None when Duffel's duration
+    could not be parsed); segment_counts likewise. carriers lists marketing
+    carrier codes in flight order without repeats, so carriers[0] is the
+    first segment's carrier. fx_currency is the quoted currency when price
+    has been converted to GBP (see fx_rates.py), empty otherwise.
+    """
+
+    __slots__ = (
+        "offer_id",
+        "price",
+        "currency",
+        "owner_iata",
+        "cabin_class",
+        "slice_minutes",
+        "segment_counts",
+        "carriers",
+        "lcc_present",
+        "bags",
+        "stops",
+        "source",
+        "fx_currency",
+    )
+
+    def __init__(
+        self,
+        offer_id: str = "",
+        price: Optional[float] = None,
+        currency: str = "GBP",
+        owner_iata: str = "",
+        cabin_class: str = "",
+        slice_minutes: Tuple[Optional[int], ...] = (),
+        segment_counts: Tuple[int, ...] = (),
+        carriers: Tuple[str, ...] = (),
+        lcc_present: bool = False,
+        bags: int = 0,
+        stops: Optional[int] = None,
+        source: str = "duffel",
+        fx_currency: str = "",
+    ) -> None:
+        self.offer_id = offer_id
+        self.price = price
+        self.currency = currency
+        self.owner_iata = owner_iata
+        self.cabin_class = cabin_class
+        self.slice_minutes = slice_minutes
+        self.segment_counts = segment_counts
+        self.carriers = carriers
+        self.lcc_present = lcc_present
+        self.bags = bags
+        self.stops = stops
+        self.source = source
+        self.fx_currency = fx_currency
+
+    def __repr__(self) -> str:
+        return (
+            f"OfferSummary({self.offer_id!r}, {self.price} {self.currency}, "
+            f"slices={self.slice_minutes}, segments={self.segment_counts}, carriers={self.carriers})"
+        )
+
+    @property
+    def is_gbp(self) -> bool:
+        return self.currency == "GBP" and self.price is not None
+
+    @property
+    def direct(self) -> bool:
+        return bool(self.segment_counts) and all(n == 1 for n in self.segment_counts)
+
+    @property
+    def max_slice_stops(self) -> int:
+        return max((n - 1 for n in self.segment_counts), default=0)
+
+    @property
+    def max_slice_minutes(self) -> Optional[int]:
+        if not self.slice_minutes or any(m is None for m in self.slice_minutes):
+            return None
+        return max(self.slice_minutes)
+
+    @property
+    def primary_carrier(self) -> str:
+        return self.carriers[0] if self.carriers else ""
+
+
+def _price(value: Any) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+
+def _bag_quantity(services: Any) -> int:
+    if isinstance(services, dict):
+        services = [services]
+    if not isinstance(services, list):
+        return 0
+    bag_qty = 0
+    for svc in services:
+        if not isinstance(svc, dict):
+            continue
+        t = (svc.get("type") or "").lower()
+        if "bag" in t:
+            try:
+                bag_qty = max(bag_qty, int(svc.get("maximum_quantity") or svc.get("quantity") or 0))
+            except Exception:
+                continue
+    return bag_qty
+
+
+def summarise_offer(offer: Dict[str, Any]) -> OfferSummary:
+    """Walk the offer's slices and segments once and keep only what the workers read."""
+    slice_minutes: List[Optional[int]] = []
+    segment_counts: List[int] = []
+    carriers: List[str] = []
+    lcc_present = False
+
+    for sl in offer.get("slices") or []:
+        segments = sl.get("segments") or []
+        slice_minutes.append(parse_iso8601_duration_minutes(sl.get("duration")))
+        segment_counts.append(len(segments))
+        for seg in segments:
+            mc = seg.get("marketing_carrier") or {}
+            code = (mc.get("iata_code") or "").upper()
+            if code and code not in carriers:
+                carriers.append(code)
+            if (mc.get("name") or "").lower() in LCC_CARRIER_NAMES:
+                lcc_present = True
+
+    return OfferSummary(
+        offer_id=str(offer.get("id") or ""),
+        price=_price(offer.get("total_amount")),
+        currency=(offer.get("total_currency") or "GBP").upper(),
+        owner_iata=((offer.get("owner") or {}).get("iata_code") or "").upper(),
+        cabin_class=(offer.get("cabin_class") or "").strip().lower(),
+        slice_minutes=tuple(slice_minutes),
+        segment_counts=tuple(segment_counts),
+        carriers=tuple(carriers),
+        lcc_present=lcc_present,
+        bags=_bag_quantity(offer.get("available_services")),
+        stops=sum(max(0, n - 1) for n in segment_counts),
+    )
+
+
+def summarise_offers(offers: Iterable[Dict[str, Any]]) -> List[OfferSummary]:
+    return [summarise_offer(offer) for offer in offers]
+
+
+def cheapest_gbp(summaries: Iterable[OfferSummary]) -> Optional[OfferSummary]:
+    return min((s for s in summaries if s.is_gbp), key=lambda s: s.price, default=None)
+
+
+def supplier_codes(summaries: Iterable[OfferSummary]) -> Set[str]:
+    return {s.owner_iata for s in summaries if s.owner_iata}
@@ -12,12 +12,14 @@ This version fixes:
 - no-retry failure on transient Google Sheets outages
 - conflict-affected Middle East destinations polluting RAW_DEALS
 - thin-bucket fragility by over-selecting candidates and alternating queues
+- linear wall-clock growth by running each wave of searches concurrently
 
 Oilpan contracts preserved:
 - Only writes to RAW_DEALS
 - Only sets status = NEW
 - Does not score, enrich, or publish
 - Stateless — no memory between runs except what's in Sheets
+  (the dedupe index is a disposable cache of RAW_DEALS, rebuilt when missing)
 """
 
 from __future__ import annotations
@@ -27,14 +29,25 @@ import json
 import time
 import math
 import hashlib
+import sqlite3
+import threading
 import datetime as dt
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from typing import Any, Dict, List, Optional, Tuple, Set, Callable, TypeVar
 
 import requests
 import gspread
 from google.oauth2.service_account import Credentials
 
+try:
+    from supabase import create_client
+except Exception:
+    create_client = None
+
+from dtd_curve import RECONSTRUCTED_NOTE
+from offer_summary import OfferSummary, cheapest_gbp, summarise_offers, supplier_codes
+
 
 T = TypeVar("T")
 
@@ -193,14 +206,14 @@ def _utc_iso() -> str:
 # DAY INDEX — DETERMINISTIC ROTATION SEED
 # ─────────────────────────────────────────────
 
-def day_index(run_slot: str) -> int:
+def day_index(run_slot: str, now: Optional[dt.datetime] = None) -> int:
     """
     Unique integer per run.
     day_index = YYYY * 1000 + day_of_year + slot_offset
     AM = +1, PM = +2
     Same inputs always produce same outputs.
     """
-    now = dt.datetime.now(dt.timezone.utc)
+    now = now or dt.datetime.now(dt.timezone.utc)
     base = now.year * 1000 + now.timetuple().tm_yday
     offset = 1 if run_slot.upper() == "AM" else 2
     return base + offset
@@ -211,6 +224,9 @@ def day_index(run_slot: str) -> int:
 # ─────────────────────────────────────────────
 
 DUFFEL_API = "https://api.duffel.com/air/offer_requests"
+DUFFEL_OFFERS_API = "https://api.duffel.com/air/offers"
+
+FETCH_MODES = {"inline", "cheapest"}
 
 LONDON_AIRPORTS = {"LHR", "LGW", "LCY"}
 LONG_HAUL_BUCKET_IDS = {4, 5, 6}
@@ -257,16 +273,188 @@ def _hash_trip(origin: str, dest: str, out_date: str, ret_date: str) -> str:
     return hashlib.sha1(s.encode()).hexdigest()[:12]
 
 
-def _pick_dates(dix: int, win_min: int, win_max: int, trip_days: int) -> Tuple[str, str]:
-    span = max(1, win_max - win_min)
-    depart_offset = win_min + (dix % span)
-    out_epoch = int(time.time()) + depart_offset * 86400
+def _dates_for_offset(
+    depart_offset: int,
+    trip_days: int,
+    now_epoch: Optional[int] = None,
+) -> Tuple[str, str]:
+    base = int(time.time()) if now_epoch is None else now_epoch
+    out_epoch = base + depart_offset * 86400
     out = time.strftime("%Y-%m-%d", time.gmtime(out_epoch))
     ret_epoch = out_epoch + max(1, trip_days) * 86400
     ret = time.strftime("%Y-%m-%d", time.gmtime(ret_epoch))
     return out, ret
 
 
+def _pick_dates(
+    dix: int,
+    win_min: int,
+    win_max: int,
+    trip_days: int,
+    now_epoch: Optional[int] = None,
+) -> Tuple[str, str]:
+    span = max(1, win_max - win_min)
+    return _dates_for_offset(win_min + (dix % span), trip_days, now_epoch)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class FetchStats:
+    """Thread-safe response size, parse time and latency counters for one run."""
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self.searches = 0
+        self.responses = 0
+        self.response_bytes = 0
+        self.parse_seconds = 0.0
+        self.latencies: List[float] = []
+        self.suppliers: List[int] = []
+        self.retries = 0
+        self.rescued = 0
+        # Searches left for no-GBP retries; None leaves them uncapped.
+        self.retry_room: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def record_search(self, latency_s: float, suppliers: int, retried: bool, rescued: bool) -> None:
+        with self._lock:
+            self.searches += 1
+            self.latencies.append(latency_s)
+            self.suppliers.append(suppliers)
+            self.retries += int(retried)
+            self.rescued += int(rescued)
+
+    def take_retry(self) -> bool:
+        """Claim one search of retry_room for a retry; False once it is spent."""
+        with self._lock:
+            if self.retry_room is None:
+                return True
+            if self.retry_room <= 0:
+                return False
+            self.retry_room -= 1
+            return True
+
+    def read_json(self, resp: requests.Response) -> Dict[str, Any]:
+        started = time.perf_counter()
+        body = resp.json()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.responses += 1
+            self.response_bytes += len(resp.content or b"")
+            self.parse_seconds += elapsed
+        return body
+
+    def summary(self) -> str:
+        n = max(1, self.searches)
+        return (
+            f"fetch_mode={self.mode} | responses={self.responses} | "
+            f"kb_per_search={round(self.response_bytes / n / 1024, 1)} | "
+            f"parse_ms_per_search={round(self.parse_seconds / n * 1000, 1)}"
+        )
+
+    def latency_summary(self) -> str:
+        avg_suppliers = sum(self.suppliers) / max(1, len(self.suppliers))
+        return (
+            f"latency_p50_s={round(_percentile(self.latencies, 50), 2)} | "
+            f"latency_p95_s={round(_percentile(self.latencies, 95), 2)} | "
+            f"avg_suppliers={round(avg_suppliers, 1)} | "
+            f"gbp_retries={self.retries} | rescued={self.rescued}"
+        )
+
+
+@dataclass
+class LatencyBudget:
+    """
+    Supplier timeout sent with each offer request, plus a longer one used
+    for a single retry when the first answer carried no GBP offer.
+    """
+
+    supplier_timeout_ms: int = 20000
+    retry_supplier_timeout_ms: int = 0
+
+    def http_timeout(self, supplier_timeout_ms: int) -> float:
+        return supplier_timeout_ms / 1000.0 + 15.0
+
+
+def _fetch_cheapest_offer(
+    payload: Dict[str, Any],
+    stats: FetchStats,
+    page_size: int,
+    max_pages: int,
+    supplier_timeout_ms: int,
+    http_timeout: float,
+) -> Tuple[Optional[OfferSummary], Set[str], int]:
+    """
+    Create the offer request without inline offers, then page /air/offers
+    by ascending total_amount until a GBP offer turns up. Returns the
+    cheapest GBP offer, the suppliers seen and how many offers came back.
+    """
+    resp = requests.post(
+        DUFFEL_API,
+        params={"return_offers": "false", "supplier_timeout": supplier_timeout_ms},
+        headers=duffel_headers(),
+        json=payload,
+        timeout=http_timeout,
+    )
+    if resp.status_code >= 400:
+        return None, set(), 0
+    offer_request_id = (stats.read_json(resp).get("data") or {}).get("id")
+    if not offer_request_id:
+        return None, set(), 0
+
+    suppliers: Set[str] = set()
+    seen = 0
+    after: Optional[str] = None
+    for _ in range(max(1, max_pages)):
+        params: Dict[str, Any] = {
+            "offer_request_id": offer_request_id,
+            "sort": "total_amount",
+            "limit": page_size,
+        }
+        if after:
+            params["after"] = after
+        resp = requests.get(DUFFEL_OFFERS_API, headers=duffel_headers(), params=params, timeout=http_timeout)
+        if resp.status_code >= 400:
+            return None, suppliers, seen
+        body = stats.read_json(resp)
+        page_offers = summarise_offers(body.pop("data", None) or [])
+        suppliers |= supplier_codes(page_offers)
+        seen += len(page_offers)
+        best = cheapest_gbp(page_offers)
+        if best:
+            return best, suppliers, seen
+        after = (body.get("meta") or {}).get("after")
+        if not after:
+            return None, suppliers, seen
+    return None, suppliers, seen
+
+
+def _fetch_inline_offer(
+    payload: Dict[str, Any],
+    stats: FetchStats,
+    supplier_timeout_ms: int,
+    http_timeout: float,
+) -> Tuple[Optional[OfferSummary], Set[str], int]:
+    inline = {"data": dict(payload["data"], return_offers=True)}
+    resp = requests.post(
+        DUFFEL_API,
+        params={"supplier_timeout": supplier_timeout_ms},
+        headers=duffel_headers(),
+        json=inline,
+        timeout=http_timeout,
+    )
+    if resp.status_code >= 400:
+        return None, set(), 0
+    offers = summarise_offers(stats.read_json(resp).get("data", {}).get("offers") or [])
+    return cheapest_gbp(offers), supplier_codes(offers), len(offers)
+
+
 def duffel_search(
     origin: str,
     dest: str,
@@ -274,7 +462,13 @@ def duffel_search(
     ret_date: str,
     cabin: str,
     max_connections: int,
-) -> Optional[Dict[str, Any]]:
+    stats: Optional[FetchStats] = None,
+    page_size: int = 5,
+    max_pages: int = 3,
+    budget: Optional[LatencyBudget] = None,
+) -> Optional[OfferSummary]:
+    stats = stats or FetchStats("inline")
+    budget = budget or LatencyBudget()
     payload = {
         "data": {
             "slices": [
@@ -284,85 +478,44 @@ def duffel_search(
             "passengers": [{"type": "adult"}],
             "cabin_class": cabin,
             "max_connections": max_connections,
-            "return_offers": True,
         }
     }
+    started = time.monotonic()
+    offer: Optional[OfferSummary] = None
+    suppliers: Set[str] = set()
+    retried = False
     try:
-        resp = requests.post(
-            DUFFEL_API,
-            headers=duffel_headers(),
-            json=payload,
-            timeout=45,
-        )
-        if resp.status_code >= 400:
-            return None
-        data = resp.json().get("data", {})
-        offers = data.get("offers") or []
-        if not offers:
-            return None
-        gbp = [o for o in offers if (o.get("total_currency") or "").upper() == "GBP"]
-        if not gbp:
-            return None
-        gbp.sort(key=lambda o: float(o.get("total_amount") or "1e18"))
-        return gbp[0]
-    except Exception:
-        return None
-
-
-# ─────────────────────────────────────────────
-# OFFER EXTRACTION
-# ─────────────────────────────────────────────
-
-def extract_carriers(offer: Dict[str, Any]) -> str:
-    carriers: List[str] = []
-    try:
-        for sl in offer.get("slices") or []:
-            for seg in sl.get("segments") or []:
-                mc = seg.get("marketing_carrier") or {}
-                code = (mc.get("iata_code") or "").upper()
-                if code and code not in carriers:
-                    carriers.append(code)
-    except Exception:
-        pass
-    return ",".join(carriers)
-
-
-def extract_stops(offer: Dict[str, Any]) -> int:
-    try:
-        stops = 0
-        for sl in offer.get("slices") or []:
-            stops += max(0, len(sl.get("segments") or []) - 1)
-        return stops
-    except Exception:
-        return 0
-
-
-def extract_cabin_class(offer: Dict[str, Any], fallback: str = "economy") -> str:
-    cc = (offer.get("cabin_class") or "").strip().lower()
-    return cc if cc else fallback
-
+        timeout_ms = budget.supplier_timeout_ms
+        if stats.mode == "cheapest":
+            offer, suppliers, seen = _fetch_cheapest_offer(
+                payload, stats, page_size, max_pages, timeout_ms, budget.http_timeout(timeout_ms)
+            )
+        else:
+            offer, suppliers, seen = _fetch_inline_offer(
+                payload, stats, timeout_ms, budget.http_timeout(timeout_ms)
+            )
 
-def extract_bags_included(offer: Dict[str, Any]) -> str:
-    try:
-        services = offer.get("available_services") or []
-        if isinstance(services, dict):
-            services = [services]
-        if not isinstance(services, list):
-            return ""
-        bag_qty = 0
-        for svc in services:
-            if not isinstance(svc, dict):
-                continue
-            t = (svc.get("type") or "").lower()
-            if "bag" in t or "baggage" in t:
-                q = svc.get("maximum_quantity") or svc.get("quantity") or 0
-                try:
-                    bag_qty = max(bag_qty, int(q))
-                except Exception:
-                    continue
-        return str(bag_qty) if bag_qty > 0 else ""
+        # Offers came back but none in GBP: the GBP-selling suppliers may have
+        # been cut off. Give them one more, longer chance, fetching only the
+        # cheapest page so the retry stays small. An empty answer is final.
+        # The retry is a search of its own and needs room in the run budget.
+        retry_ms = budget.retry_supplier_timeout_ms
+        if offer is None and seen and retry_ms > timeout_ms and stats.take_retry():
+            retried = True
+            offer, retry_suppliers, _ = _fetch_cheapest_offer(
+                payload, stats, page_size, 1, retry_ms, budget.http_timeout(retry_ms)
+            )
+            suppliers |= retry_suppliers
+        return offer
     except Exception:
-        return ""
+        return None
+    finally:
+        stats.record_search(
+            time.monotonic() - started,
+            len(suppliers),
+            retried,
+            rescued=retried and offer is not None,
+        )
 
 
 # ─────────────────────────────────────────────
@@ -618,37 +771,263 @@ def select_origin(
 # DEDUPE (LAST N ROWS ONLY)
 # ─────────────────────────────────────────────
 
-def load_dedupe_set(ws_raw: gspread.Worksheet, lookback_rows: int) -> set:
-    all_values = retry_call(
-        lambda: ws_raw.get_all_values(),
-        label=f"read values from worksheet {ws_raw.title}",
-    )
+TripKey = Tuple[str, str, str, str]
 
-    if len(all_values) < 2:
-        return set()
 
-    header = all_values[0]
-    hm = {str(h).strip(): i for i, h in enumerate(header)}
+def read_raw_tail(
+    ws_raw: gspread.Worksheet,
+    lookback_rows: int,
+) -> Tuple[Dict[str, int], List[List[str]]]:
+    """
+    Read only the tail of RAW_DEALS, walking back from the last grid row in
+    lookback-sized ranges until lookback_rows non-empty rows are collected.
+    """
+    header = retry_call(
+        lambda: ws_raw.row_values(1),
+        label=f"read header row from worksheet {ws_raw.title}",
+    )
+    if not header:
+        return {}, []
 
-    def col(name: str, row: List[str]) -> str:
-        i = hm.get(name)
-        return (row[i] if (i is not None and i < len(row)) else "").strip()
+    hm = {str(h).strip(): i for i, h in enumerate(header)}
+    last_col = gspread.utils.rowcol_to_a1(1, len(header)).rstrip("0123456789")
+
+    chunk = max(1, lookback_rows)
+    end_row = ws_raw.row_count
+    data_rows: List[List[str]] = []
+
+    while end_row >= 2 and len(data_rows) < lookback_rows:
+        start_row = max(2, end_row - chunk + 1)
+        rng = f"A{start_row}:{last_col}{end_row}"
+        block = retry_call(
+            lambda: ws_raw.get(rng),
+            label=f"read range {rng} from worksheet {ws_raw.title}",
+        )
+        block = [r for r in block if any(str(c).strip() for c in r)]
+        data_rows = block + data_rows
+        end_row = start_row - 1
 
-    data_rows = all_values[1:]
     if len(data_rows) > lookback_rows:
         data_rows = data_rows[-lookback_rows:]
+    return hm, data_rows
 
-    s = set()
+
+def _row_col(hm: Dict[str, int], name: str, row: List[str]) -> str:
+    i = hm.get(name)
+    return (str(row[i]) if (i is not None and i < len(row)) else "").strip()
+
+
+def _row_trip_key(hm: Dict[str, int], row: List[str]) -> Optional[TripKey]:
+    o = _row_col(hm, "origin_iata", row).upper()
+    d = _row_col(hm, "destination_iata", row).upper()
+    od = _row_col(hm, "outbound_date", row)
+    rd = _row_col(hm, "return_date", row)
+    if o and d and od and rd:
+        return (o, d, od, rd)
+    return None
+
+
+def load_dedupe_set(ws_raw: gspread.Worksheet, lookback_rows: int) -> Set[TripKey]:
+    hm, data_rows = read_raw_tail(ws_raw, lookback_rows)
+    s: Set[TripKey] = set()
     for r in data_rows:
-        o = col("origin_iata", r).upper()
-        d = col("destination_iata", r).upper()
-        od = col("outbound_date", r)
-        rd = col("return_date", r)
-        if o and d and od and rd:
-            s.add((o, d, od, rd))
+        key = _row_trip_key(hm, r)
+        if key:
+            s.add(key)
     return s
 
 
+class DedupeIndex:
+    """
+    Persistent trip-dedupe index in a local SQLite file.
+
+    The file is restored from the Actions cache between runs, so the feeder
+    no longer has to read RAW_DEALS to dedupe. Keys expire after ttl_days or
+    once their outbound date has passed.
+    """
+
+    def __init__(self, path: str, ttl_days: int) -> None:
+        self.path = path
+        self.ttl_days = max(1, ttl_days)
+        self.existed = os.path.exists(path)
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trips (
+                origin TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                outbound TEXT NOT NULL,
+                ret TEXT NOT NULL,
+                added_at INTEGER NOT NULL,
+                PRIMARY KEY (origin, dest, outbound, ret)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def expire(self) -> int:
+        cutoff = int(time.time()) - self.ttl_days * 86400
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        cur = self.conn.execute(
+            "DELETE FROM trips WHERE added_at < ? OR outbound < ?",
+            (cutoff, today),
+        )
+        self.conn.commit()
+        return cur.rowcount
+
+    def load(self) -> Set[TripKey]:
+        return {
+            (o, d, od, rd)
+            for o, d, od, rd in self.conn.execute("SELECT origin, dest, outbound, ret FROM trips")
+        }
+
+    def add(self, keys: List[TripKey]) -> None:
+        if not keys:
+            return
+        now = int(time.time())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO trips VALUES (?, ?, ?, ?, ?)",
+            [(o, d, od, rd, now) for o, d, od, rd in keys],
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_dedupe_index(path: str, ttl_days: int) -> Optional[DedupeIndex]:
+    if not path:
+        return None
+    try:
+        return DedupeIndex(path, ttl_days)
+    except Exception as exc:
+        print(f"⚠️  Dedupe index unavailable at {path}: {exc}")
+        return None
+
+
+# ─────────────────────────────────────────────
+# ATLAS SNAPSHOT REUSE
+# ─────────────────────────────────────────────
+
+SNAPSHOT_SOURCE = "atlas_snapshot"
+SNAPSHOT_DEAL_PREFIX = "atlas_snap_"
+
+
+def load_snapshot_prices(max_age_hours: float, page_size: int = 1000) -> Dict[TripKey, Dict[str, Any]]:
+    """
+    Prefetch today's priced Atlas snapshots keyed by trip, keeping the latest
+    capture per key and dropping anything older than max_age_hours.
+    Reconstructed DTD-curve rows are modelled prices, not fares, and are skipped,
+    as are fares converted from EUR/USD: the feeder publishes bookable GBP prices.
+    Whether a row can stand in for a given search is reusable_snapshot's call.
+    """
+    url = env_str("MIZAR_SUPABASE_URL")
+    key = env_str("MIZAR_SUPABASE_SERVICE_ROLE_KEY")
+    if create_client is None or not url or not key:
+        return {}
+
+    today = dt.datetime.now(dt.timezone.utc).date()
+    now = dt.datetime.now(dt.timezone.utc)
+    client = create_client(url, key)
+
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        page = retry_call(
+            lambda: (
+                client.table("snapshots")
+                .select(
+                    "snapshot_id,snapshot_date,capture_time_utc,origin_iata,destination_iata,"
+                    "outbound_date,return_date,price_gbp,currency,fx_source_currency,stops,"
+                    "cabin_class,carrier_primary_iata"
+                )
+                .eq("snapshot_date", str(today))
+                .not_.is_("price_gbp", "null")
+                .or_(f"notes.is.null,notes.neq.{RECONSTRUCTED_NOTE}")
+                .range(start, start + page_size - 1)
+                .execute()
+            ).data or [],
+            label="read today's Atlas snapshots",
+        )
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+        start += page_size
+
+    prices: Dict[TripKey, Dict[str, Any]] = {}
+    for r in rows:
+        if r.get("fx_source_currency") or str(r.get("currency") or "GBP").upper() != "GBP":
+            continue
+        try:
+            hh, mm = str(r.get("capture_time_utc") or "00:00").split(":")[:2]
+            captured = dt.datetime.combine(
+                today, dt.time(int(hh), int(mm)), tzinfo=dt.timezone.utc
+            )
+        except Exception:
+            continue
+        if (now - captured).total_seconds() > max_age_hours * 3600:
+            continue
+        k = (
+            str(r.get("origin_iata") or "").upper(),
+            str(r.get("destination_iata") or "").upper(),
+            str(r.get("outbound_date") or "")[:10],
+            str(r.get("return_date") or "")[:10],
+        )
+        prev = prices.get(k)
+        if prev is None or str(prev.get("capture_time_utc")) < str(r.get("capture_time_utc")):
+            prices[k] = r
+    return prices
+
+
+def reusable_snapshot(
+    snapshot_prices: Optional[Dict[TripKey, Dict[str, Any]]],
+    plan: PlannedSearch,
+    cabin: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    The snapshot row for plan's trip if it could have come back from the
+    Duffel search it replaces: same cabin, and no slice with more stops than
+    plan.max_conn (snapshot stops are per slice, like max_connections).
+    """
+    hit = (snapshot_prices or {}).get(plan.trip_key)
+    if not hit or hit.get("stops") is None:
+        return None
+    if int(hit["stops"]) > plan.max_conn:
+        return None
+    if str(hit.get("cabin_class") or "").strip().lower() != cabin.strip().lower():
+        return None
+    return hit
+
+
+def snapshot_offer(snapshot: Dict[str, Any]) -> OfferSummary:
+    """
+    Offer summary of a snapshot row, tagged so the row shows its provenance.
+
+    Snapshots keep the most stops on any one slice; RAW_DEALS stops is the
+    trip total, so it is taken as that many stops on every slice, an upper
+    bound that never scores a snapshot fare as more direct than it is.
+    """
+    carrier = str(snapshot.get("carrier_primary_iata") or "").upper()
+    slice_stops = snapshot.get("stops")
+    slices = 2 if snapshot.get("return_date") else 1
+    return OfferSummary(
+        offer_id=f"{SNAPSHOT_DEAL_PREFIX}{snapshot.get('snapshot_id')}",
+        price=float(snapshot.get("price_gbp") or 0),
+        currency="GBP",
+        cabin_class=str(snapshot.get("cabin_class") or "").strip().lower(),
+        carriers=(carrier,) if carrier else (),
+        stops=int(slice_stops) * slices if slice_stops is not None else None,
+        source=SNAPSHOT_SOURCE,
+    )
+
+
+def is_snapshot_offer(offer: Optional[OfferSummary]) -> bool:
+    return offer is not None and offer.source == SNAPSHOT_SOURCE
+
+
 # ─────────────────────────────────────────────
 # SHEETS WRITE
 # ─────────────────────────────────────────────
@@ -814,6 +1193,662 @@ def filter_blocked_candidates(
     return kept
 
 
+def build_bucket_candidates(
+    all_buckets: Dict[int, List[BucketDest]],
+    bucket_id: int,
+    dix: int,
+    desired_count: int,
+    blocked_iatas: Set[str],
+    blocked_countries: Set[str],
+) -> List[SearchCandidate]:
+    bucket_name = all_buckets.get(bucket_id, [BucketDest(bucket_id, "", "", "", "", "B")])[0].bucket_name
+    candidates = build_search_candidates(
+        bucket_id=bucket_id,
+        bucket_name=bucket_name,
+        bucket_dests=all_buckets.get(bucket_id, []),
+        dix=dix,
+        desired_count=desired_count,
+        allow_c_tier=bucket_id == 6,
+    )
+    return filter_blocked_candidates(
+        candidates=candidates,
+        blocked_iatas=blocked_iatas,
+        blocked_countries=blocked_countries,
+        label=f"bucket {bucket_id}",
+    )
+
+
+def interleave_queues(
+    candidates_a: List[SearchCandidate],
+    candidates_b: List[SearchCandidate],
+) -> List[SearchCandidate]:
+    queue_a = list(candidates_a)
+    queue_b = list(candidates_b)
+    combined_queue: List[SearchCandidate] = []
+    toggle = 0
+
+    while queue_a or queue_b:
+        if toggle % 2 == 0:
+            if queue_a:
+                combined_queue.append(queue_a.pop(0))
+            elif queue_b:
+                combined_queue.append(queue_b.pop(0))
+        else:
+            if queue_b:
+                combined_queue.append(queue_b.pop(0))
+            elif queue_a:
+                combined_queue.append(queue_a.pop(0))
+        toggle += 1
+
+    return combined_queue
+
+
+# ─────────────────────────────────────────────
+# YIELD-AWARE PLANNER
+# ─────────────────────────────────────────────
+
+PROMOTED_STATUSES = {
+    "READY_TO_POST",
+    "READY_FREE",
+    "PUBLISHED",
+    "POSTED_ALL",
+    "POSTED_INSTAGRAM",
+    "VIP_DONE",
+    "READY_FOR_BOTH",
+    "READY_FOR_FREE",
+}
+
+RouteKey = Tuple[str, str, int]
+
+
+@dataclass
+class YieldStats:
+    attempts: float = 0.0
+    offers: float = 0.0
+    dedupe_hits: float = 0.0
+    inserts: float = 0.0
+    promoted: float = 0.0
+
+    def add(self, other: "YieldStats") -> None:
+        self.attempts += other.attempts
+        self.offers += other.offers
+        self.dedupe_hits += other.dedupe_hits
+        self.inserts += other.inserts
+        self.promoted += other.promoted
+
+
+class SearchHistory:
+    """
+    Per-(origin, destination, bucket) feeder outcomes from past runs.
+
+    Lives in the same cached SQLite file as the dedupe index. Inserted trips
+    are remembered so promotions seen later in RAW_DEALS are credited once.
+    """
+
+    def __init__(self, path: str) -> None:
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS search_outcomes (
+                origin TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                bucket_id INTEGER NOT NULL,
+                attempts REAL NOT NULL DEFAULT 0,
+                offers REAL NOT NULL DEFAULT 0,
+                dedupe_hits REAL NOT NULL DEFAULT 0,
+                inserts REAL NOT NULL DEFAULT 0,
+                promoted REAL NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL,
+                PRIMARY KEY (origin, dest, bucket_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS inserted_trips (
+                origin TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                outbound TEXT NOT NULL,
+                ret TEXT NOT NULL,
+                bucket_id INTEGER NOT NULL,
+                inserted_at INTEGER NOT NULL,
+                promoted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (origin, dest, outbound, ret)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+
+    def load(self) -> Dict[RouteKey, YieldStats]:
+        out: Dict[RouteKey, YieldStats] = {}
+        for o, d, b, att, off, dup, ins, prom in self.conn.execute(
+            "SELECT origin, dest, bucket_id, attempts, offers, dedupe_hits, inserts, promoted "
+            "FROM search_outcomes"
+        ):
+            out[(o, d, int(b))] = YieldStats(att, off, dup, ins, prom)
+        return out
+
+    def record(self, outcomes: Dict[RouteKey, YieldStats]) -> None:
+        now = int(time.time())
+        self.conn.executemany(
+            """
+            INSERT INTO search_outcomes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (origin, dest, bucket_id) DO UPDATE SET
+                attempts = attempts + excluded.attempts,
+                offers = offers + excluded.offers,
+                dedupe_hits = dedupe_hits + excluded.dedupe_hits,
+                inserts = inserts + excluded.inserts,
+                updated_at = excluded.updated_at
+            """,
+            [
+                (o, d, b, st.attempts, st.offers, st.dedupe_hits, st.inserts, 0, now)
+                for (o, d, b), st in outcomes.items()
+            ],
+        )
+        self.conn.commit()
+
+    def record_inserts(self, trips: List[Tuple[TripKey, int]]) -> None:
+        now = int(time.time())
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO inserted_trips VALUES (?, ?, ?, ?, ?, ?, 0)",
+            [(o, d, od, rd, b, now) for (o, d, od, rd), b in trips],
+        )
+        self.conn.commit()
+
+    def refresh_promotions(self, hm: Dict[str, int], rows: List[List[str]]) -> int:
+        promoted_keys = [
+            key
+            for key in (
+                _row_trip_key(hm, r)
+                for r in rows
+                if _row_col(hm, "status", r).upper() in PROMOTED_STATUSES
+            )
+            if key
+        ]
+        credited = 0
+        for o, d, od, rd in promoted_keys:
+            row = self.conn.execute(
+                "SELECT bucket_id FROM inserted_trips "
+                "WHERE origin = ? AND dest = ? AND outbound = ? AND ret = ? AND promoted = 0",
+                (o, d, od, rd),
+            ).fetchone()
+            if not row:
+                continue
+            self.conn.execute(
+                "UPDATE inserted_trips SET promoted = 1 "
+                "WHERE origin = ? AND dest = ? AND outbound = ? AND ret = ?",
+                (o, d, od, rd),
+            )
+            self.conn.execute(
+                "UPDATE search_outcomes SET promoted = promoted + 1 "
+                "WHERE origin = ? AND dest = ? AND bucket_id = ?",
+                (o, d, row[0]),
+            )
+            credited += 1
+        self.conn.commit()
+        return credited
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _smoothed(hits: float, trials: float, prior: float, strength: float) -> float:
+    return (hits + strength * prior) / (trials + strength)
+
+
+class YieldPlanner:
+    """
+    Orders each bucket's candidates by expected promotable yield.
+
+    Rates are smoothed per (origin, dest, bucket) toward the (dest, bucket)
+    aggregate, then the bucket aggregate, then the all-routes rate, so
+    sparse history falls back gracefully. Candidates still come from the
+    day's rotation and every queue slot keeps its bucket, origin and dates;
+    only which of the bucket's candidates fills each slot, and the
+    over-selection depth per bucket, change.
+    """
+
+    def __init__(self, history: Dict[RouteKey, YieldStats], prior_strength: float = 4.0) -> None:
+        self.k = prior_strength
+        self.by_route = history
+        self.by_dest: Dict[Tuple[str, int], YieldStats] = {}
+        self.by_bucket: Dict[int, YieldStats] = {}
+        self.total = YieldStats()
+        for (_, d, b), st in history.items():
+            self.by_dest.setdefault((d, b), YieldStats()).add(st)
+            self.by_bucket.setdefault(b, YieldStats()).add(st)
+            self.total.add(st)
+
+    def _levels(self, origin: Optional[str], dest: Optional[str], bucket_id: Optional[int]) -> List[YieldStats]:
+        """History from the all-routes total down to the most specific level asked for."""
+        levels = [self.total]
+        if bucket_id is None:
+            return levels
+        levels.append(self.by_bucket.get(bucket_id, YieldStats()))
+        if dest is None:
+            return levels
+        levels.append(self.by_dest.get((dest, bucket_id), YieldStats()))
+        if origin is not None and (origin, dest, bucket_id) in self.by_route:
+            levels.append(self.by_route[(origin, dest, bucket_id)])
+        return levels
+
+    def offer_rate(self, origin: Optional[str] = None, dest: Optional[str] = None, bucket_id: Optional[int] = None) -> float:
+        rate = 0.5
+        for st in self._levels(origin, dest, bucket_id):
+            rate = _smoothed(st.offers, st.attempts, rate, self.k)
+        return rate
+
+    def promote_rate(self, origin: Optional[str] = None, dest: Optional[str] = None, bucket_id: Optional[int] = None) -> float:
+        rate = 0.2
+        for st in self._levels(origin, dest, bucket_id):
+            rate = _smoothed(st.promoted, st.inserts, rate, self.k)
+        return rate
+
+    def dedupe_rate(self, origin: Optional[str] = None, dest: Optional[str] = None, bucket_id: Optional[int] = None) -> float:
+        rate = 0.1
+        for st in self._levels(origin, dest, bucket_id):
+            rate = _smoothed(st.dedupe_hits, st.attempts + st.dedupe_hits, rate, self.k)
+        return rate
+
+    def expected_promotable(self, origin: Optional[str], dest: str, bucket_id: int) -> float:
+        return self.offer_rate(origin, dest, bucket_id) * self.promote_rate(origin, dest, bucket_id)
+
+    def candidates_per_bucket(self, bucket_id: int, dests_per_bucket: int, baseline: int, max_multiplier: int) -> int:
+        """Over-select enough candidates to cover the bucket's expected dedupe and no-offer losses."""
+        useful = max(0.05, (1.0 - self.dedupe_rate(bucket_id=bucket_id)) * self.offer_rate(bucket_id=bucket_id))
+        needed = int(math.ceil(dests_per_bucket / useful))
+        return max(baseline, min(needed, dests_per_bucket * max(1, max_multiplier)))
+
+    def order(
+        self,
+        queue: List[SearchCandidate],
+        origin_for_slot: Callable[[int, int], Optional[str]],
+    ) -> List[SearchCandidate]:
+        """
+        The queue with each slot filled, in order, by the remaining candidate
+        of the slot's bucket with the highest expected yield from the origin
+        that slot is given (origin_for_slot(slot_offset, bucket_id)). A slot
+        keeps its bucket, so the A/B interleave is unchanged.
+        """
+        remaining: Dict[int, List[SearchCandidate]] = {}
+        for c in queue:
+            remaining.setdefault(c.bucket_id, []).append(c)
+
+        ordered: List[SearchCandidate] = []
+        for slot_offset, slot in enumerate(queue):
+            pool = remaining[slot.bucket_id]
+            origin = origin_for_slot(slot_offset, slot.bucket_id)
+            best = min(
+                pool,
+                key=lambda c: (
+                    -self.expected_promotable(origin, c.destination_iata, c.bucket_id),
+                    c.candidate_index,
+                ),
+            )
+            pool.remove(best)
+            ordered.append(best)
+        return ordered
+
+
+# ─────────────────────────────────────────────
+# CONCURRENT SEARCH EXECUTOR
+# ─────────────────────────────────────────────
+
+@dataclass
+class PlannedSearch:
+    slot_offset: int
+    dest: SearchCandidate
+    origin: str
+    out_date: str
+    ret_date: str
+    max_conn: int
+
+    @property
+    def trip_key(self) -> TripKey:
+        return (self.origin, self.dest.destination_iata, self.out_date, self.ret_date)
+
+
+class RateLimiter:
+    """
+    Shared across search threads.
+    Spaces request starts at least min_interval_s apart, whatever the concurrency.
+    """
+
+    def __init__(self, min_interval_s: float) -> None:
+        self.min_interval_s = max(0.0, min_interval_s)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + self.min_interval_s
+        delay = start_at - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_search_wave(
+    wave: List[PlannedSearch],
+    cabin: str,
+    concurrency: int,
+    limiter: RateLimiter,
+    stats: FetchStats,
+    page_size: int,
+    budget: Optional[LatencyBudget] = None,
+    snapshot_prices: Optional[Dict[TripKey, Dict[str, Any]]] = None,
+    prefetched: Optional[Dict[TripKey, Optional[OfferSummary]]] = None,
+) -> List[Optional[OfferSummary]]:
+    """
+    Run a wave of searches on a bounded pool. Results come back in wave order.
+    Trips searched ahead of time by the previous run's prefetch, or priced by
+    today's Atlas capture, are answered without calling Duffel.
+    """
+
+    def _search(plan: PlannedSearch) -> Optional[OfferSummary]:
+        if prefetched and plan.trip_key in prefetched:
+            return prefetched[plan.trip_key]
+        hit = reusable_snapshot(snapshot_prices, plan, cabin)
+        if hit:
+            return snapshot_offer(hit)
+        limiter.wait()
+        return duffel_search(
+            origin=plan.origin,
+            dest=plan.dest.destination_iata,
+            out_date=plan.out_date,
+            ret_date=plan.ret_date,
+            cabin=cabin,
+            max_connections=plan.max_conn,
+            stats=stats,
+            page_size=page_size,
+            budget=budget,
+        )
+
+    if concurrency <= 1 or len(wave) <= 1:
+        return [_search(plan) for plan in wave]
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(wave))) as pool:
+        return list(pool.map(_search, wave))
+
+
+# ─────────────────────────────────────────────
+# ADAPTIVE DATE GRID
+# ─────────────────────────────────────────────
+
+def coarse_grid_offsets(win_min: int, win_max: int, points: int) -> List[int]:
+    if points <= 1 or win_max <= win_min:
+        return [win_min]
+    step = (win_max - win_min) / (points - 1)
+    return sorted({int(round(win_min + i * step)) for i in range(points)})
+
+
+@dataclass
+class GridRoute:
+    base: PlannedSearch
+    call_cap: int
+    step: int
+    cells: Dict[int, Optional[OfferSummary]] = field(default_factory=dict)
+    plans: Dict[int, PlannedSearch] = field(default_factory=dict)
+    calls: int = 0
+    dedupe_hits: int = 0
+    snapshot_hits: int = 0
+
+    def best(self) -> Optional[Tuple[int, OfferSummary]]:
+        priced = [(off, o) for off, o in self.cells.items() if o]
+        if not priced:
+            return None
+        return min(priced, key=lambda item: (item[1].price, item[0]))
+
+    def refinements(self, win_min: int, win_max: int) -> List[int]:
+        best = self.best()
+        self.step //= 2
+        if best is None or self.step < 1:
+            return []
+        centre = best[0]
+        return [
+            off
+            for off in (centre - self.step, centre + self.step)
+            if win_min <= off <= win_max and off not in self.cells
+        ]
+
+
+def run_date_grid_wave(
+    routes: List[PlannedSearch],
+    caps: List[int],
+    travel_p: TravelParams,
+    trip_len: int,
+    points: int,
+    dedupe: Set[TripKey],
+    cabin: str,
+    concurrency: int,
+    limiter: RateLimiter,
+    stats: FetchStats,
+    page_size: int,
+    budget: Optional[LatencyBudget] = None,
+    snapshot_prices: Optional[Dict[TripKey, Dict[str, Any]]] = None,
+) -> List[GridRoute]:
+    """
+    Probe a coarse grid of outbound dates across the theme window for every
+    route in the wave, then repeatedly halve the step around each route's
+    cheapest cell until its call cap is spent. Every round is one concurrent
+    wave across all routes. Cells already in the dedupe set are not searched.
+    """
+    coarse = coarse_grid_offsets(travel_p.win_min, travel_p.win_max, points)
+    coarse_step = max(1, (travel_p.win_max - travel_p.win_min) // max(1, len(coarse) - 1))
+    grid = [GridRoute(base=plan, call_cap=cap, step=coarse_step) for plan, cap in zip(routes, caps)]
+    proposals: List[List[int]] = [list(coarse) for _ in grid]
+
+    while True:
+        batch: List[Tuple[GridRoute, int, PlannedSearch]] = []
+        for gr, offsets in zip(grid, proposals):
+            room = gr.call_cap - gr.calls
+            for off in offsets:
+                if room <= 0:
+                    break
+                if off in gr.cells:
+                    continue
+                out_date, ret_date = _dates_for_offset(off, trip_len)
+                plan = replace(gr.base, out_date=out_date, ret_date=ret_date)
+                if plan.trip_key in dedupe:
+                    gr.cells[off] = None
+                    gr.dedupe_hits += 1
+                    continue
+                gr.plans[off] = plan
+                hit = reusable_snapshot(snapshot_prices, plan, cabin)
+                if hit:
+                    gr.cells[off] = snapshot_offer(hit)
+                    gr.snapshot_hits += 1
+                    continue
+                batch.append((gr, off, plan))
+                room -= 1
+
+        if not batch:
+            break
+
+        offers = run_search_wave(
+            [plan for _, _, plan in batch], cabin, concurrency, limiter, stats, page_size, budget
+        )
+        for (gr, off, _), offer in zip(batch, offers):
+            gr.cells[off] = offer
+            gr.calls += 1
+
+        proposals = [gr.refinements(travel_p.win_min, travel_p.win_max) for gr in grid]
+
+    return grid
+
+
+# ─────────────────────────────────────────────
+# NEXT-RUN PREFETCH
+# ─────────────────────────────────────────────
+
+def next_run(run_slot: str, now: Optional[dt.datetime] = None) -> Tuple[str, dt.datetime]:
+    """
+    Slot and approximate start of the run after this one. AM and PM runs are
+    scheduled roughly twelve hours apart, and day_index() and _pick_dates()
+    only need the calendar date of the next run.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    return ("PM" if run_slot.upper() == "AM" else "AM"), now + dt.timedelta(hours=12)
+
+
+def plan_run_searches(
+    queue: List[SearchCandidate],
+    tier_airports: Dict[int, List[OriginAirport]],
+    dix: int,
+    travel_p: TravelParams,
+    trip_len: int,
+    dedupe: Set[TripKey],
+    limit: int,
+    now_epoch: Optional[int] = None,
+) -> List[PlannedSearch]:
+    """The first `limit` single-date searches a run with this queue would make."""
+    plans: List[PlannedSearch] = []
+    seen: Set[TripKey] = set()
+    for slot_offset, dest in enumerate(queue):
+        if len(plans) >= limit:
+            break
+        origin = select_origin(tier_airports, dest.bucket_id, dix, slot_offset)
+        if not origin:
+            continue
+        out_date, ret_date = _pick_dates(
+            dix + slot_offset, travel_p.win_min, travel_p.win_max, trip_len, now_epoch
+        )
+        plan = PlannedSearch(
+            slot_offset=slot_offset,
+            dest=dest,
+            origin=origin,
+            out_date=out_date,
+            ret_date=ret_date,
+            max_conn=max_connections_for_bucket(dest.bucket_id, travel_p),
+        )
+        if plan.trip_key in dedupe or plan.trip_key in seen:
+            continue
+        seen.add(plan.trip_key)
+        plans.append(plan)
+    return plans
+
+
+class PrefetchCache:
+    """
+    Offers searched ahead of time for the next run, kept in the dedupe
+    index's SQLite file. A NULL price records a search that found no GBP
+    offer. Entries older than the freshness window are deleted on read, so
+    a stale price can never reach RAW_DEALS.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prefetched_offers (
+                origin TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                outbound TEXT NOT NULL,
+                ret TEXT NOT NULL,
+                offer_id TEXT,
+                price REAL,
+                currency TEXT,
+                cabin_class TEXT,
+                carriers TEXT,
+                stops INTEGER,
+                bags INTEGER,
+                fetched_at INTEGER NOT NULL,
+                PRIMARY KEY (origin, dest, outbound, ret)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def fresh(self, max_age_hours: float) -> Dict[TripKey, Optional[OfferSummary]]:
+        cutoff = int(time.time() - max_age_hours * 3600)
+        self.conn.execute("DELETE FROM prefetched_offers WHERE fetched_at < ?", (cutoff,))
+        self.conn.commit()
+        cached: Dict[TripKey, Optional[OfferSummary]] = {}
+        for o, d, od, rd, offer_id, price, currency, cabin_class, carriers, stops, bags in self.conn.execute(
+            "SELECT origin, dest, outbound, ret, offer_id, price, currency, cabin_class, carriers, stops, bags "
+            "FROM prefetched_offers"
+        ):
+            cached[(o, d, od, rd)] = None if price is None else OfferSummary(
+                offer_id=offer_id or "",
+                price=price,
+                currency=currency or "GBP",
+                cabin_class=cabin_class or "",
+                carriers=tuple(c for c in (carriers or "").split(",") if c),
+                stops=stops,
+                bags=bags or 0,
+            )
+        return cached
+
+    def store(self, results: List[Tuple[TripKey, Optional[OfferSummary]]]) -> None:
+        if not results:
+            return
+        now = int(time.time())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO prefetched_offers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (o, d, od, rd, None, None, None, None, None, None, None, now)
+                if offer is None
+                else (
+                    o, d, od, rd, offer.offer_id, offer.price, offer.currency, offer.cabin_class,
+                    ",".join(offer.carriers), offer.stops, offer.bags, now,
+                )
+                for (o, d, od, rd), offer in results
+            ],
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# ─────────────────────────────────────────────
+# RAW_DEALS ROW
+# ─────────────────────────────────────────────
+
+def build_raw_row(
+    plan: PlannedSearch,
+    offer: OfferSummary,
+    cabin: str,
+    theme: str,
+) -> List[Any]:
+    dest = plan.dest
+    price_gbp = int(math.ceil(offer.price or 0))
+
+    row_map: Dict[str, Any] = {h: "" for h in RAW_HEADERS_REQUIRED}
+    row_map.update(
+        {
+            "deal_id": offer.offer_id or _hash_trip(*plan.trip_key),
+            "origin_iata": plan.origin,
+            "destination_iata": dest.destination_iata,
+            "origin_city": "",
+            "destination_city": dest.city,
+            "destination_country": dest.country,
+            "outbound_date": plan.out_date,
+            "return_date": plan.ret_date,
+            "price_gbp": price_gbp,
+            "currency": offer.currency,
+            "stops": offer.stops if offer.stops is not None else "",
+            "cabin_class": offer.cabin_class or cabin,
+            "carriers": ",".join(offer.carriers),
+            "theme": theme,
+            "status": "NEW",
+            "publish_window": "",
+            "score": "",
+            "bags_incl": str(offer.bags) if offer.bags > 0 else "",
+            "graphic_url": "",
+            "booking_link_vip": "",
+            "posted_vip_at": "",
+            "posted_free_at": "",
+            "posted_instagram_at": "",
+            "ingested_at_utc": _utc_iso(),
+            "phrase_used": "",
+            "phrase_category": "",
+            "scored_timestamp": "",
+        }
+    )
+    return [row_map[h] for h in RAW_HEADERS_REQUIRED]
+
+
 # ─────────────────────────────────────────────
 # MAIN
 # ─────────────────────────────────────────────
@@ -833,7 +1868,27 @@ def main() -> int:
     max_inserts = env_int("DUFFEL_MAX_INSERTS", 20)
     dests_per_bucket = env_int("DUFFEL_ROUTES_PER_RUN", 2)
     lookback_rows = env_int("DEDUPE_LOOKBACK_ROWS", 2000)
+    dedupe_index_path = env_str("FEEDER_DEDUPE_INDEX_PATH", ".cache/feeder_dedupe.sqlite")
+    dedupe_ttl_days = env_int("DEDUPE_INDEX_TTL_DAYS", 45)
+    planner_mode = env_str("FEEDER_PLANNER", "rotation").lower()
+    planner_max_multiplier = env_int("PLANNER_MAX_CANDIDATE_MULTIPLIER", 4)
+    promotion_lookback_rows = env_int("PLANNER_PROMOTION_LOOKBACK_ROWS", 500)
     sleep_s = env_float("FEEDER_SLEEP_SECONDS", 0.1)
+    concurrency = max(1, env_int("FEEDER_SEARCH_CONCURRENCY", 1))
+    fetch_mode = env_str("DUFFEL_FETCH_MODE", "inline").lower()
+    offer_page_size = max(1, env_int("DUFFEL_OFFER_PAGE_SIZE", 5))
+    date_grid = env_str("FEEDER_DATE_MODE", "single").lower() == "grid"
+    snapshot_reuse = env_str("FEEDER_SNAPSHOT_REUSE", "true").lower() in ("1", "true", "yes")
+    snapshot_max_age_hours = env_float("FEEDER_SNAPSHOT_MAX_AGE_HOURS", 12.0)
+    prefetch_next = env_str("FEEDER_PREFETCH_NEXT", "false").lower() in ("1", "true", "yes")
+    prefetch_max_age_hours = env_float("FEEDER_PREFETCH_MAX_AGE_HOURS", 16.0)
+    prefetch_max_searches = env_int("FEEDER_PREFETCH_MAX_SEARCHES", max_searches)
+    latency_budget = LatencyBudget(
+        supplier_timeout_ms=env_int("DUFFEL_SUPPLIER_TIMEOUT_MS", 12000),
+        retry_supplier_timeout_ms=env_int("DUFFEL_RETRY_SUPPLIER_TIMEOUT_MS", 25000),
+    )
+    grid_points = max(1, env_int("DATE_GRID_POINTS", 4))
+    grid_max_calls = max(1, env_int("DATE_GRID_MAX_CALLS", 6))
     cabin = env_str("CABIN_CLASS", "economy").lower()
 
     candidate_multiplier = env_int("DUFFEL_CANDIDATE_MULTIPLIER", 2)
@@ -844,6 +1899,17 @@ def main() -> int:
 
     dix = day_index(run_slot)
     print(f"📅 Day index: {dix} | Slot: {run_slot}")
+    print(f"⚡ Search concurrency: {concurrency} | min interval: {sleep_s}s")
+    if fetch_mode not in FETCH_MODES:
+        print(f"⚠️  Unknown DUFFEL_FETCH_MODE={fetch_mode!r}; using inline.")
+        fetch_mode = "inline"
+    print(
+        f"⏱️  Supplier timeout: {latency_budget.supplier_timeout_ms}ms "
+        f"| GBP retry: {latency_budget.retry_supplier_timeout_ms}ms"
+    )
+    if date_grid:
+        print(f"🗓️  Date grid: {grid_points} coarse point(s), ≤{grid_max_calls} call(s) per route")
+    print(f"📦 Fetch mode: {fetch_mode}" + (f" (page size {offer_page_size})" if fetch_mode == "cheapest" else ""))
     print(f"🚫 Blocked IATAs loaded: {len(blocked_iatas)}")
     print(f"🚫 Blocked countries loaded: {sorted(blocked_countries)}")
 
@@ -882,8 +1948,40 @@ def main() -> int:
         label=f"open worksheet {raw_tab}",
     )
     ensure_headers(ws_raw)
-    dedupe = load_dedupe_set(ws_raw, lookback_rows)
-    print(f"🔍 Dedupe set loaded: {len(dedupe)} recent trips")
+
+    dedupe_index = open_dedupe_index(dedupe_index_path, dedupe_ttl_days)
+    if dedupe_index is not None and dedupe_index.existed:
+        expired = dedupe_index.expire()
+        dedupe = dedupe_index.load()
+        print(f"🔍 Dedupe index loaded: {len(dedupe)} trips ({expired} expired) from {dedupe_index_path}")
+    else:
+        dedupe = load_dedupe_set(ws_raw, lookback_rows)
+        print(f"🔍 Dedupe set loaded from sheet tail: {len(dedupe)} recent trips")
+        if dedupe_index is not None:
+            dedupe_index.add(sorted(dedupe))
+            dedupe_index.expire()
+            print(f"   Seeded dedupe index at {dedupe_index_path}")
+
+    history: Optional[SearchHistory] = None
+    planner: Optional[YieldPlanner] = None
+    if planner_mode == "yield" and dedupe_index_path:
+        history = SearchHistory(dedupe_index_path)
+        hm_tail, tail_rows = read_raw_tail(ws_raw, promotion_lookback_rows)
+        credited = history.refresh_promotions(hm_tail, tail_rows)
+        planner = YieldPlanner(history.load())
+        print(
+            f"🧭 Yield planner: {len(planner.by_route)} route(s) of history | "
+            f"promotions credited={credited} | "
+            f"offer_rate={planner.offer_rate():.2f} | "
+            f"dedupe_rate={planner.dedupe_rate():.2f}"
+        )
+
+    def bucket_depth(bucket_id: int) -> int:
+        if planner is None:
+            return candidates_per_bucket
+        return planner.candidates_per_bucket(
+            bucket_id, dests_per_bucket, candidates_per_bucket, planner_max_multiplier
+        )
 
     ws_buckets = retry_call(
         lambda: sh.worksheet(buckets_tab),
@@ -903,45 +2001,40 @@ def main() -> int:
         print("❌ CONFIG_ORIGINS is empty or missing. Exiting.")
         return 1
 
+    snapshot_prices: Dict[TripKey, Dict[str, Any]] = {}
+    if snapshot_reuse:
+        try:
+            snapshot_prices = load_snapshot_prices(snapshot_max_age_hours)
+            print(f"♻️  Atlas snapshot prices prefetched: {len(snapshot_prices)} trip(s)")
+        except Exception as exc:
+            print(f"⚠️  Atlas snapshot prefetch failed, searching Duffel only: {exc}")
+
+    # Prefetched offers are keyed by _pick_dates() trips, so date-grid runs
+    # neither read nor write them.
+    prefetch_cache: Optional[PrefetchCache] = None
+    prefetched: Dict[TripKey, Optional[OfferSummary]] = {}
+    if dedupe_index_path and not date_grid:
+        try:
+            prefetch_cache = PrefetchCache(dedupe_index_path)
+            prefetched = prefetch_cache.fresh(prefetch_max_age_hours)
+            print(f"🔮 Prefetched searches available: {len(prefetched)} (≤{prefetch_max_age_hours:g}h old)")
+        except Exception as exc:
+            print(f"⚠️  Prefetch cache unavailable at {dedupe_index_path}: {exc}")
+            prefetch_cache = None
+    elif prefetch_next:
+        print("⚠️  FEEDER_PREFETCH_NEXT is ignored in date-grid mode.")
+
     # ── Select buckets for this run ──
     bucket_a, bucket_b = select_buckets(dix)
     print(f"🪣 Buckets this run: {bucket_a} + {bucket_b}")
+    if planner is not None:
+        print(f"🧭 Candidates/bucket: {bucket_a}={bucket_depth(bucket_a)} | {bucket_b}={bucket_depth(bucket_b)}")
 
-    bucket_a_name = all_buckets.get(bucket_a, [BucketDest(bucket_a, "", "", "", "", "B")])[0].bucket_name
-    bucket_b_name = all_buckets.get(bucket_b, [BucketDest(bucket_b, "", "", "", "", "B")])[0].bucket_name
-
-    allow_c_a = bucket_a == 6
-    allow_c_b = bucket_b == 6
-
-    candidates_a = build_search_candidates(
-        bucket_id=bucket_a,
-        bucket_name=bucket_a_name,
-        bucket_dests=all_buckets.get(bucket_a, []),
-        dix=dix,
-        desired_count=candidates_per_bucket,
-        allow_c_tier=allow_c_a,
-    )
-
-    candidates_b = build_search_candidates(
-        bucket_id=bucket_b,
-        bucket_name=bucket_b_name,
-        bucket_dests=all_buckets.get(bucket_b, []),
-        dix=dix + 100,
-        desired_count=candidates_per_bucket,
-        allow_c_tier=allow_c_b,
-    )
-
-    candidates_a = filter_blocked_candidates(
-        candidates=candidates_a,
-        blocked_iatas=blocked_iatas,
-        blocked_countries=blocked_countries,
-        label=f"bucket {bucket_a}",
+    candidates_a = build_bucket_candidates(
+        all_buckets, bucket_a, dix, bucket_depth(bucket_a), blocked_iatas, blocked_countries
     )
-    candidates_b = filter_blocked_candidates(
-        candidates=candidates_b,
-        blocked_iatas=blocked_iatas,
-        blocked_countries=blocked_countries,
-        label=f"bucket {bucket_b}",
+    candidates_b = build_bucket_candidates(
+        all_buckets, bucket_b, dix + 100, bucket_depth(bucket_b), blocked_iatas, blocked_countries
     )
 
     if not candidates_a and not candidates_b:
@@ -959,123 +2052,182 @@ def main() -> int:
     dedupe_skips = 0
     london_used = 0
     pending_rows: List[List[Any]] = []
-
-    queue_a = list(candidates_a)
-    queue_b = list(candidates_b)
-    combined_queue: List[SearchCandidate] = []
-    toggle = 0
-
-    while queue_a or queue_b:
-        if toggle % 2 == 0:
-            if queue_a:
-                combined_queue.append(queue_a.pop(0))
-            elif queue_b:
-                combined_queue.append(queue_b.pop(0))
-        else:
-            if queue_b:
-                combined_queue.append(queue_b.pop(0))
-            elif queue_a:
-                combined_queue.append(queue_a.pop(0))
-        toggle += 1
+    inserted_keys: List[TripKey] = []
+    inserted_buckets: List[int] = []
+    outcomes: Dict[RouteKey, YieldStats] = {}
+    expected_inserts = 0.0
+    expected_promotable = 0.0
+
+    combined_queue = interleave_queues(candidates_a, candidates_b)
+    # Each slot's origin and dates come from its queue position, so the
+    # planner fills slots (within their bucket) scored against that origin;
+    # the A/B interleave keeps bucket coverage exactly as in rotation mode.
+    if planner is not None:
+        combined_queue = planner.order(
+            combined_queue, lambda pos, bucket_id: select_origin(tier_airports, bucket_id, dix, pos)
+        )
+        print(f"🧭 Planned queue: {[d.destination_iata for d in combined_queue]}")
+    limiter = RateLimiter(sleep_s)
+    fetch_stats = FetchStats(fetch_mode)
+    queue_pos = 0
+    grid_calls = 0
+    grid_savings = 0.0
+    snapshot_hits = 0
+    prefetch_hits = 0
+    search_started = time.monotonic()
 
     print("=" * 70)
 
-    for slot_offset, dest in enumerate(combined_queue):
-        if searches >= max_searches or len(pending_rows) >= max_inserts:
-            break
+    # Candidates are planned in queue order in waves no larger than the
+    # remaining search and insert budgets, so every planned search is one the
+    # serial loop would also have made. A trip key repeated inside a wave
+    # closes the wave so the earlier result reaches the dedupe set first.
+    # In date-grid mode each route reserves up to DATE_GRID_MAX_CALLS of the
+    # search budget and its dates come from the grid, not _pick_dates().
+    while (
+        queue_pos < len(combined_queue)
+        and searches < max_searches
+        and len(pending_rows) < max_inserts
+    ):
+        call_room = max_searches - searches
+        insert_room = max_inserts - len(pending_rows)
+        reserved = 0
+        wave: List[PlannedSearch] = []
+        caps: List[int] = []
+        wave_keys: Set[TripKey] = set()
+
+        while queue_pos < len(combined_queue) and len(wave) < insert_room and reserved < call_room:
+            slot_offset = queue_pos
+            dest = combined_queue[queue_pos]
+
+            origin = select_origin(
+                tier_airports=tier_airports,
+                bucket_id=dest.bucket_id,
+                dix=dix,
+                slot_offset=slot_offset,
+            )
 
-        origin = select_origin(
-            tier_airports=tier_airports,
-            bucket_id=dest.bucket_id,
-            dix=dix,
-            slot_offset=slot_offset,
-        )
+            if not origin:
+                queue_pos += 1
+                print(f"⚠️  No eligible origin for bucket {dest.bucket_id}. Skipping {dest.destination_iata}.")
+                continue
 
-        if not origin:
-            print(f"⚠️  No eligible origin for bucket {dest.bucket_id}. Skipping {dest.destination_iata}.")
-            continue
+            out_date, ret_date = _pick_dates(
+                dix + slot_offset,
+                travel_p.win_min,
+                travel_p.win_max,
+                trip_len,
+            )
+            plan = PlannedSearch(
+                slot_offset=slot_offset,
+                dest=dest,
+                origin=origin,
+                out_date=out_date,
+                ret_date=ret_date,
+                max_conn=max_connections_for_bucket(dest.bucket_id, travel_p),
+            )
+            wave_key = (origin, dest.destination_iata, "", "") if date_grid else plan.trip_key
 
-        out_date, ret_date = _pick_dates(
-            dix + slot_offset,
-            travel_p.win_min,
-            travel_p.win_max,
-            trip_len,
-        )
-        trip_key = (origin, dest.destination_iata, out_date, ret_date)
+            if wave_key in wave_keys:
+                break
+            queue_pos += 1
 
-        if trip_key in dedupe:
-            dedupe_skips += 1
-            print(f"⏭️  Dedupe skip: {origin}→{dest.destination_iata} {out_date}/{ret_date}")
-            continue
+            if not date_grid and plan.trip_key in dedupe:
+                dedupe_skips += 1
+                outcomes.setdefault((origin, dest.destination_iata, dest.bucket_id), YieldStats()).dedupe_hits += 1
+                print(f"⏭️  Dedupe skip: {origin}→{dest.destination_iata} {out_date}/{ret_date}")
+                continue
 
-        if origin in LONDON_AIRPORTS:
-            london_used += 1
+            if origin in LONDON_AIRPORTS:
+                london_used += 1
 
-        searches += 1
-        bucket_label = f"[B{dest.bucket_id}:{dest.bucket_name}]"
-        max_conn = max_connections_for_bucket(dest.bucket_id, travel_p)
+            cap = min(grid_max_calls, call_room - reserved) if date_grid else 1
+            reserved += cap
+            bucket_label = f"[B{dest.bucket_id}:{dest.bucket_name}]"
+            when = f"grid≤{cap} calls" if date_grid else f"{out_date}/{ret_date}"
 
-        print(
-            f"🔎 Search {searches}/{max_searches} "
-            f"{origin}→{dest.destination_iata} {out_date}/{ret_date} "
-            f"{bucket_label} | liquidity={dest.liquidity_tier} | max_conn={max_conn}"
-        )
+            print(
+                f"🔎 Search {searches + reserved}/{max_searches} "
+                f"{origin}→{dest.destination_iata} {when} "
+                f"{bucket_label} | liquidity={dest.liquidity_tier} | max_conn={plan.max_conn}"
+            )
 
-        offer = duffel_search(
-            origin=origin,
-            dest=dest.destination_iata,
-            out_date=out_date,
-            ret_date=ret_date,
-            cabin=cabin,
-            max_connections=max_conn,
-        )
+            if planner is not None:
+                expected_inserts += planner.offer_rate(origin, dest.destination_iata, dest.bucket_id)
+                expected_promotable += planner.expected_promotable(origin, dest.destination_iata, dest.bucket_id)
+
+            wave.append(plan)
+            caps.append(cap)
+            wave_keys.add(wave_key)
+
+        # No-GBP retries are searches too; they may use only the room the
+        # wave left, and are added to the count once it is back.
+        fetch_stats.retry_room = call_room - reserved
+        retries_before = fetch_stats.retries
+
+        results: List[Tuple[PlannedSearch, Optional[OfferSummary], int]] = []
+        if date_grid:
+            grid = run_date_grid_wave(
+                wave, caps, travel_p, trip_len, grid_points, dedupe,
+                cabin, concurrency, limiter, fetch_stats, offer_page_size, latency_budget,
+                snapshot_prices,
+            )
+            for gr in grid:
+                dedupe_skips += gr.dedupe_hits
+                snapshot_hits += gr.snapshot_hits
+                outcomes.setdefault(
+                    (gr.base.origin, gr.base.dest.destination_iata, gr.base.dest.bucket_id), YieldStats()
+                ).dedupe_hits += gr.dedupe_hits
+                best = gr.best()
+                grid_calls += gr.calls
+                if best:
+                    probed = [o.price for o in gr.cells.values() if o]
+                    grid_savings += sum(probed) / len(probed) - min(probed)
+                    results.append((gr.plans[best[0]], best[1], gr.calls))
+                else:
+                    results.append((gr.base, None, gr.calls))
+        else:
+            offers = run_search_wave(
+                wave, cabin, concurrency, limiter, fetch_stats, offer_page_size, latency_budget,
+                snapshot_prices, prefetched,
+            )
+            results = [
+                (plan, offer, 0 if is_snapshot_offer(offer) or plan.trip_key in prefetched else 1)
+                for plan, offer in zip(wave, offers)
+            ]
+
+        searches += fetch_stats.retries - retries_before
+        for plan, offer, calls in results:
+            searches += calls
+            route = f"{plan.origin}→{plan.dest.destination_iata}"
+            if not date_grid and plan.trip_key in prefetched:
+                prefetch_hits += 1
+                route += " 🔮 prefetched"
+            stats = outcomes.setdefault((plan.origin, plan.dest.destination_iata, plan.dest.bucket_id), YieldStats())
+            stats.attempts += max(1, calls)
+
+            if not offer:
+                if calls:
+                    no_offer += 1
+                print(f"   ❌ No offer ({route})")
+                continue
 
-        if not offer:
-            no_offer += 1
-            print("   ❌ No offer")
-            time.sleep(sleep_s)
-            continue
+            row = build_raw_row(plan, offer, cabin, theme_today)
+            if is_snapshot_offer(offer):
+                route += " ♻️ atlas snapshot"
+                if not date_grid:
+                    snapshot_hits += 1
+            dated = f" {plan.out_date}/{plan.ret_date} after {calls} call(s)" if date_grid else ""
+            print(f"   ✅ £{row[RAW_HEADERS_REQUIRED.index('price_gbp')]} {route}{dated} ({plan.dest.city}, {plan.dest.country})")
 
-        price_gbp = int(math.ceil(float(offer.get("total_amount") or 0)))
-        currency = (offer.get("total_currency") or "GBP").upper()
-        print(f"   ✅ £{price_gbp} ({dest.city}, {dest.country})")
-
-        row_map: Dict[str, Any] = {h: "" for h in RAW_HEADERS_REQUIRED}
-        row_map.update(
-            {
-                "deal_id": offer.get("id") or _hash_trip(origin, dest.destination_iata, out_date, ret_date),
-                "origin_iata": origin,
-                "destination_iata": dest.destination_iata,
-                "origin_city": "",
-                "destination_city": dest.city,
-                "destination_country": dest.country,
-                "outbound_date": out_date,
-                "return_date": ret_date,
-                "price_gbp": price_gbp,
-                "currency": currency,
-                "stops": extract_stops(offer),
-                "cabin_class": extract_cabin_class(offer, fallback=cabin),
-                "carriers": extract_carriers(offer),
-                "theme": theme_today,
-                "status": "NEW",
-                "publish_window": "",
-                "score": "",
-                "bags_incl": extract_bags_included(offer),
-                "graphic_url": "",
-                "booking_link_vip": "",
-                "posted_vip_at": "",
-                "posted_free_at": "",
-                "posted_instagram_at": "",
-                "ingested_at_utc": _utc_iso(),
-                "phrase_used": "",
-                "phrase_category": "",
-                "scored_timestamp": "",
-            }
-        )
+            stats.offers += 1
+            stats.inserts += 1
+            pending_rows.append(row)
+            inserted_keys.append(plan.trip_key)
+            inserted_buckets.append(plan.dest.bucket_id)
+            dedupe.add(plan.trip_key)
 
-        pending_rows.append([row_map[h] for h in RAW_HEADERS_REQUIRED])
-        dedupe.add(trip_key)
-        time.sleep(sleep_s)
+    search_wall_s = round(time.monotonic() - search_started, 1)
 
     # ── Single batch write ──
     print("=" * 70)
@@ -1085,6 +2237,15 @@ def main() -> int:
     else:
         print("⚠️  No rows inserted this run.")
 
+    if dedupe_index is not None:
+        dedupe_index.add(inserted_keys)
+        dedupe_index.close()
+
+    if history is not None:
+        history.record(outcomes)
+        history.record_inserts(list(zip(inserted_keys, inserted_buckets)))
+        history.close()
+
     # ── Run summary ──
     london_pct = round(london_used / max(1, searches) * 100, 1)
     offer_rate = round((searches - no_offer) / max(1, searches) * 100, 1)
@@ -1095,10 +2256,69 @@ def main() -> int:
     print(f"   slot={run_slot} | day_index={dix}")
     print(f"   buckets={bucket_a}+{bucket_b}")
     print(f"   searches={searches} | inserted={len(pending_rows)}")
+    print(f"   concurrency={concurrency} | search_wall_s={search_wall_s}")
+    print(f"   {fetch_stats.summary()}")
+    print(f"   {fetch_stats.latency_summary()}")
+    print(f"   snapshot_hits={snapshot_hits} | prefetch_hits={prefetch_hits}")
+    if date_grid:
+        print(f"   date_grid_calls={grid_calls} | saved_vs_mean_probe_gbp={round(grid_savings)}")
     print(f"   dedupe_skips={dedupe_skips} | no_offer={no_offer}")
     print(f"   offer_rate={offer_rate}%")
     print(f"   unique_dests={unique_dests} | unique_origins={unique_origins}")
     print(f"   london_used={london_used} | london_share={london_pct}%")
+    if planner is not None:
+        print(
+            f"   planner=yield | expected_inserts={expected_inserts:.1f} "
+            f"| actual_inserts={len(pending_rows)} "
+            f"| expected_promotable={expected_promotable:.1f}"
+        )
+
+    # ── Prefetch the next run ──
+    # day_index() is deterministic, so the next run's searches are known now.
+    # Running them in this job's idle tail leaves the scheduled run with
+    # cache lookups and a single append.
+    if prefetch_next and prefetch_cache is not None:
+        try:
+            next_slot, next_now = next_run(run_slot)
+            next_dix = day_index(next_slot, next_now)
+            next_a, next_b = select_buckets(next_dix)
+            next_queue = interleave_queues(
+                build_bucket_candidates(
+                    all_buckets, next_a, next_dix, bucket_depth(next_a), blocked_iatas, blocked_countries
+                ),
+                build_bucket_candidates(
+                    all_buckets, next_b, next_dix + 100, bucket_depth(next_b), blocked_iatas, blocked_countries
+                ),
+            )
+            if planner is not None:
+                next_queue = planner.order(
+                    next_queue,
+                    lambda pos, bucket_id: select_origin(tier_airports, bucket_id, next_dix, pos),
+                )
+            plans = [
+                plan
+                for plan in plan_run_searches(
+                    next_queue, tier_airports, next_dix, travel_p, trip_len, dedupe,
+                    prefetch_max_searches, int(next_now.timestamp()),
+                )
+                if plan.trip_key not in prefetched
+                and reusable_snapshot(snapshot_prices, plan, cabin) is None
+            ]
+            prefetch_stats = FetchStats(fetch_mode)
+            prefetch_stats.retry_room = max(0, prefetch_max_searches - len(plans))
+            offers = run_search_wave(
+                plans, cabin, concurrency, limiter, prefetch_stats, offer_page_size, latency_budget
+            )
+            prefetch_cache.store([(plan.trip_key, offer) for plan, offer in zip(plans, offers)])
+            print(
+                f"\n🔮 Prefetched next run (slot={next_slot} | day_index={next_dix} | buckets={next_a}+{next_b}): "
+                f"searches={len(plans)} | offers={sum(1 for o in offers if o)}"
+            )
+        except Exception as exc:
+            print(f"⚠️  Next-run prefetch failed: {exc}")
+
+    if prefetch_cache is not None:
+        prefetch_cache.close()
 
     return 0
 
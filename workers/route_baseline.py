@@ -0,0 +1,409 @@
+# workers/route_baseline.py
+"""
+Route price baselines as mergeable running state, persisted per day.
+
+price_z_score, price_ratio and price_percentile place a fare against the
+other fares of its (route, dtd_bucket, season_bucket) group. The workers
+recomputed every group from all the snapshots they could fetch; the trainer
+rescanned a group's history for every row. Here a group is a BaselineState:
+
+- count, mean and M2 (Welford), so a day's fares are folded in without
+  revisiting older ones and two states merge exactly (Chan et al.);
+- a log-bucketed price sketch (DDSketch layout, RELATIVE_ACCURACY), so the
+  share of fares at or below a price is one binary search over the sketch
+  and sketches merge by adding bucket counts.
+
+Two tables hold them. route_baseline_history has one row per group per
+snapshot_date with the cumulative state through that date, so a read "as
+of" a date never sees later fares; route_baselines holds each group's
+latest row for workers that only need today's view. route_baseline.sql
+creates both: route, dtd_bucket, season_bucket, as_of_date, n, mean, m2,
+sketch (JSON object of bucket index -> count), updated_at.
+
+The enrichment worker extends the history from the previous day's state
+with each new snapshot_date; rerunning a date replaces its rows.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DTD_BINS = [-1, 7, 21, 60, 120, 9999]
+DTD_LABELS = ["0-7", "8-21", "22-60", "61-120", "120+"]
+
+# Sigma rules the baseline features have always used.
+DEFAULT_SIGMA = 10.0
+MIN_SIGMA = 5.0
+
+# Sketch buckets are (gamma^(i-1), gamma^i] with gamma = (1+a)/(1-a), so a
+# bucket's prices are within a of each other. Prices below MIN_PRICE share
+# the lowest bucket.
+RELATIVE_ACCURACY = 0.001
+MIN_PRICE = 0.01
+_LOG_GAMMA = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
+
+CURRENT_TABLE = "route_baselines"
+HISTORY_TABLE = "route_baseline_history"
+KEY_COLUMNS = ["route", "dtd_bucket", "season_bucket"]
+
+Key = Tuple[str, str, str]
+
+
+def dtd_buckets(dtd: Any) -> Any:
+    """dtd_bucket for a column of days-to-departure (NaN outside the bins)."""
+    return pd.cut(pd.to_numeric(dtd, errors="coerce"), bins=DTD_BINS, labels=DTD_LABELS)
+
+
+def dtd_bucket(days: Any) -> Optional[str]:
+    try:
+        days = float(days)
+    except (TypeError, ValueError):
+        return None
+    for label, low, high in zip(DTD_LABELS, DTD_BINS, DTD_BINS[1:]):
+        if low < days <= high:
+            return label
+    return None
+
+
+def sketch_index(prices: np.ndarray) -> np.ndarray:
+    prices = np.maximum(np.asarray(prices, dtype=float), MIN_PRICE)
+    return np.ceil(np.log(prices) / _LOG_GAMMA).astype(np.int64)
+
+
+@dataclass
+class BaselineState:
+    """Running count/mean/M2 and price sketch of one group."""
+
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    sketch: Dict[int, int] = field(default_factory=dict)
+    _cdf: Optional[Tuple[np.ndarray, np.ndarray]] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def of(cls, prices: Any) -> "BaselineState":
+        values = np.asarray(prices, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        mean = float(values.mean())
+        index, counts = np.unique(sketch_index(values), return_counts=True)
+        return cls(
+            n=len(values),
+            mean=mean,
+            m2=float(((values - mean) ** 2).sum()),
+            sketch={int(i): int(c) for i, c in zip(index, counts)},
+        )
+
+    def merge(self, other: "BaselineState") -> "BaselineState":
+        if not other.n:
+            return self
+        if not self.n:
+            return other
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        sketch = dict(self.sketch)
+        for i, c in other.sketch.items():
+            sketch[i] = sketch.get(i, 0) + c
+        return BaselineState(
+            n=n,
+            mean=self.mean + delta * other.n / n,
+            m2=self.m2 + other.m2 + delta * delta * self.n * other.n / n,
+            sketch=sketch,
+        )
+
+    @property
+    def sigma(self) -> float:
+        if self.n < 2:
+            return DEFAULT_SIGMA
+        return max(MIN_SIGMA, math.sqrt(self.m2 / (self.n - 1)))
+
+    def percentile(self, prices: Any) -> np.ndarray:
+        """Percent of the group's fares in buckets at or below each price's bucket."""
+        if self._cdf is None:
+            index = np.array(sorted(self.sketch), dtype=np.int64)
+            cumulative = np.cumsum([self.sketch[i] for i in index]).astype(float)
+            self._cdf = (index, cumulative)
+        index, cumulative = self._cdf
+        prices = np.asarray(prices, dtype=float)
+        out = np.full(prices.shape, np.nan)
+        if not self.n or not len(index):
+            return out
+        ok = ~np.isnan(prices)
+        pos = np.searchsorted(index, sketch_index(prices[ok]), side="right") - 1
+        out[ok] = np.where(pos >= 0, cumulative[np.maximum(pos, 0)], 0.0) / self.n * 100
+        return out
+
+    def to_row(self, key: Key, as_of: str) -> Dict[str, Any]:
+        route, bucket, season = key
+        return {
+            "route": route,
+            "dtd_bucket": bucket,
+            "season_bucket": season,
+            "as_of_date": as_of,
+            "n": self.n,
+            "mean": self.mean,
+            "m2": self.m2,
+            "sketch": {str(i): c for i, c in sorted(self.sketch.items())},
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "BaselineState":
+        return cls(
+            n=int(row.get("n") or 0),
+            mean=float(row.get("mean") or 0.0),
+            m2=float(row.get("m2") or 0.0),
+            sketch={int(i): int(c) for i, c in (row.get("sketch") or {}).items()},
+        )
+
+
+def row_key(row: Dict[str, Any]) -> Key:
+    return (str(row["route"]), str(row["dtd_bucket"]), str(row["season_bucket"]))
+
+
+class BaselineHistory:
+    """Cumulative state of each group after each as_of_date, for point-in-time reads."""
+
+    def __init__(self) -> None:
+        self._dates: Dict[Key, List[str]] = {}
+        self._states: Dict[Key, List[BaselineState]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(dates) for dates in self._dates.values())
+
+    def keys(self) -> List[Key]:
+        return list(self._dates)
+
+    def put(self, key: Key, as_of: str, state: BaselineState) -> None:
+        dates = self._dates.setdefault(key, [])
+        states = self._states.setdefault(key, [])
+        i = bisect.bisect_left(dates, as_of)
+        if i < len(dates) and dates[i] == as_of:
+            states[i] = state
+        else:
+            dates.insert(i, as_of)
+            states.insert(i, state)
+
+    def extend(self, other: "BaselineHistory") -> None:
+        """Add every state of other, replacing same-day states already held."""
+        for key, dates in other._dates.items():
+            for as_of, state in zip(dates, other._states[key]):
+                self.put(key, as_of, state)
+
+    def latest(self, key: Key) -> Optional[Tuple[str, BaselineState]]:
+        dates = self._dates.get(key)
+        return (dates[-1], self._states[key][-1]) if dates else None
+
+    def as_of(self, key: Key, as_of: Optional[str] = None) -> Optional[BaselineState]:
+        """State through as_of (inclusive), or the latest state when as_of is None."""
+        dates = self._dates.get(key)
+        if not dates:
+            return None
+        if as_of is None:
+            return self._states[key][-1]
+        i = bisect.bisect_right(dates, str(as_of)[:10]) - 1
+        return self._states[key][i] if i >= 0 else None
+
+    def rows(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            state.to_row(key, as_of)
+            for key, dates in self._dates.items()
+            for as_of, state in zip(dates, self._states[key])
+            if since is None or as_of >= since
+        ]
+
+    def latest_rows(self, keys: Optional[Iterable[Key]] = None) -> List[Dict[str, Any]]:
+        keys = self._dates if keys is None else keys
+        return [
+            self._states[key][-1].to_row(key, self._dates[key][-1])
+            for key in keys
+            if self._dates.get(key)
+        ]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "BaselineHistory":
+        history = cls()
+        for row in rows:
+            history.put(row_key(row), str(row["as_of_date"])[:10], BaselineState.from_row(row))
+        return history
+
+
+def _key_frame(routes: Any, buckets: Any, seasons: Any, extra: Dict[str, Any]) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        {
+            "route": np.asarray(routes, dtype=object),
+            "dtd_bucket": np.asarray(buckets, dtype=object),
+            "season_bucket": np.asarray(seasons, dtype=object),
+            **{name: np.asarray(values) for name, values in extra.items()},
+        }
+    )
+    frame["complete"] = frame[KEY_COLUMNS].notna().all(axis=1)
+    return frame
+
+
+def accumulate(
+    routes: Any,
+    buckets: Any,
+    seasons: Any,
+    snapshot_dates: Any,
+    prices: Any,
+    base: Optional[Dict[Key, BaselineState]] = None,
+) -> BaselineHistory:
+    """
+    History of every group in the given rows from each group's base state,
+    one entry per snapshot_date holding all fares up to and including it.
+    Pass observed fares only: reconstructed DTD-curve rows are modelled
+    prices and would pull the baseline toward the model.
+    """
+    frame = _key_frame(
+        routes, buckets, seasons,
+        {"as_of": [str(d)[:10] for d in snapshot_dates], "price": np.asarray(prices, dtype=float)},
+    )
+    frame = frame[frame["complete"]].astype({col: str for col in KEY_COLUMNS})
+
+    history = BaselineHistory()
+    base = base or {}
+    for key, group in frame.groupby(KEY_COLUMNS, sort=False):
+        state = base.get(key, BaselineState())
+        for as_of, day in group.groupby("as_of", sort=True):
+            # A day with no priced fares still records the carried-over state,
+            # so its rows read the same baseline as in a full rebuild.
+            state = state.merge(BaselineState.of(day["price"].to_numpy()))
+            if state.n:
+                history.put(key, as_of, state)
+    return history
+
+
+def lookup(
+    history: BaselineHistory,
+    routes: Any,
+    buckets: Any,
+    seasons: Any,
+    prices: Any,
+    as_of: Any = None,
+) -> Dict[str, np.ndarray]:
+    """
+    baseline_n, baseline_mu, baseline_sigma, price_z_score, price_ratio and
+    price_percentile per row from the group's state as of the row's date
+    (latest state when as_of is None). NaN, and n 0, where the group has no
+    state yet. Values are unrounded.
+    """
+    n_rows = len(np.asarray(prices))
+    extra = {"price": np.asarray(prices, dtype=float), "row": np.arange(n_rows)}
+    if as_of is not None:
+        extra["as_of"] = [str(d)[:10] for d in as_of]
+    frame = _key_frame(routes, buckets, seasons, extra)
+    frame = frame[frame["complete"]].astype({col: str for col in KEY_COLUMNS})
+
+    out = {name: np.full(n_rows, np.nan) for name in ("baseline_mu", "baseline_sigma", "price_percentile")}
+    out["baseline_n"] = np.zeros(n_rows, dtype=np.int64)
+    by = KEY_COLUMNS + (["as_of"] if as_of is not None else [])
+    for group_key, group in frame.groupby(by, sort=False):
+        key = tuple(group_key[:3])
+        state = history.as_of(key, group_key[3] if as_of is not None else None)
+        if state is None or not state.n:
+            continue
+        rows = group["row"].to_numpy()
+        out["baseline_n"][rows] = state.n
+        out["baseline_mu"][rows] = state.mean
+        out["baseline_sigma"][rows] = state.sigma
+        out["price_percentile"][rows] = state.percentile(group["price"].to_numpy())
+
+    price = extra["price"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["price_z_score"] = (price - out["baseline_mu"]) / out["baseline_sigma"]
+        ratio = price / out["baseline_mu"]
+    out["price_ratio"] = np.where(np.isfinite(ratio), ratio, np.nan)
+    return out
+
+
+# ------------------------------------------------------------
+# Persistence
+# ------------------------------------------------------------
+
+def _fetch_all(client: Any, table: str, apply_filters: Any = None, page_size: int = 1000) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        query = client.table(table).select("*")
+        if apply_filters is not None:
+            query = apply_filters(query)
+        batch = (
+            query.order("route").order("dtd_bucket").order("season_bucket").order("as_of_date")
+            .range(offset, offset + page_size - 1)
+            .execute()
+        ).data or []
+        rows.extend(batch)
+        if len(batch) < page_size:
+            break
+        offset += page_size
+    return rows
+
+
+def load_current(client: Any) -> BaselineHistory:
+    """Each group's latest state (one entry per group)."""
+    return BaselineHistory.from_rows(_fetch_all(client, CURRENT_TABLE))
+
+
+def load_history(client: Any, until: Optional[str] = None) -> BaselineHistory:
+    """Every persisted daily state, optionally only those up to until."""
+    apply_filters = (lambda q: q.lte("as_of_date", until)) if until else None
+    return BaselineHistory.from_rows(_fetch_all(client, HISTORY_TABLE, apply_filters))
+
+
+def base_states(client: Any, keys: Iterable[Key], before: str) -> Dict[Key, BaselineState]:
+    """
+    State of each group through the last date before `before`.
+
+    Usually the current row; when that row is already on or after `before`
+    (a rerun) the history is asked for the one before it.
+    """
+    current = load_current(client)
+    base: Dict[Key, BaselineState] = {}
+    for key in keys:
+        latest = current.latest(key)
+        if latest is None:
+            continue
+        if latest[0] < before:
+            base[key] = latest[1]
+            continue
+        route, bucket, season = key
+        rows = (
+            client.table(HISTORY_TABLE)
+            .select("*")
+            .eq("route", route)
+            .eq("dtd_bucket", bucket)
+            .eq("season_bucket", season)
+            .lt("as_of_date", before)
+            .order("as_of_date", desc=True)
+            .limit(1)
+            .execute()
+        ).data or []
+        if rows:
+            base[key] = BaselineState.from_row(rows[0])
+    return base
+
+
+def save(client: Any, history: BaselineHistory, chunk_size: int = 500) -> int:
+    """Upsert every daily state in history, then each group's latest state."""
+    rows = history.rows()
+    for start in range(0, len(rows), chunk_size):
+        client.table(HISTORY_TABLE).upsert(
+            rows[start:start + chunk_size],
+            on_conflict="route,dtd_bucket,season_bucket,as_of_date",
+        ).execute()
+    latest = history.latest_rows()
+    for start in range(0, len(latest), chunk_size):
+        client.table(CURRENT_TABLE).upsert(
+            latest[start:start + chunk_size],
+            on_conflict="route,dtd_bucket,season_bucket",
+        ).execute()
+    return len(rows)
@@ -0,0 +1,30 @@
+-- workers/route_baseline.sql
+-- Tables behind workers/route_baseline.py. Apply once in the Supabase SQL
+-- editor before deploying the baseline store; atlas_backfill_v2 fills them on
+-- its next run (groups with no stored state are rebuilt from their history).
+
+create table if not exists public.route_baseline_history (
+    route          text             not null,
+    dtd_bucket     text             not null,
+    season_bucket  text             not null,
+    as_of_date     date             not null,
+    n              integer          not null,
+    mean           double precision not null,
+    m2             double precision not null,
+    sketch         jsonb            not null default '{}'::jsonb,
+    updated_at     timestamptz      not null default now(),
+    primary key (route, dtd_bucket, season_bucket, as_of_date)
+);
+
+create table if not exists public.route_baselines (
+    route          text             not null,
+    dtd_bucket     text             not null,
+    season_bucket  text             not null,
+    as_of_date     date             not null,
+    n              integer          not null,
+    mean           double precision not null,
+    m2             double precision not null,
+    sketch         jsonb            not null default '{}'::jsonb,
+    updated_at     timestamptz      not null default now(),
+    primary key (route, dtd_bucket, season_bucket)
+);
@@ -0,0 +1,119 @@
+# workers/route_momentum.py
+"""
+Per-cell price momentum over route-sorted arrays.
+
+The feature workers compute trend, volatility and direction features per
+(origin, destination, outbound_date) cell over its snapshot history. They
+used groupby().transform(lambda ...) and rolling().apply(), calling back
+into Python once per cell or once per window. These functions do the same
+with NumPy over a frame already sorted by cell and snapshot_date:
+
+- groups are the cell ids from group_ids(), contiguous after the sort, with
+  -1 for rows whose key has a missing value (those rows get NaN, as
+  groupby drops them);
+- a rolling window is a (rows x width) matrix of each row's predecessors in
+  its own cell, NaN where the cell has none, so a window statistic is one
+  NumPy reduction along the rows.
+
+Results match the pandas code they replace to float tolerance.
+"""
+
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def group_ids(df: pd.DataFrame, key: List[str]) -> np.ndarray:
+    """Cell id per row (-1 where a key column is missing). df must be sorted by key."""
+    return df.groupby(key, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _positions(groups: np.ndarray) -> np.ndarray:
+    """Position of each row within its cell."""
+    n = len(groups)
+    starts = np.r_[True, groups[1:] != groups[:-1]] if n else np.zeros(0, dtype=bool)
+    first = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    return np.arange(n) - first
+
+
+def windows(values: np.ndarray, groups: np.ndarray, width: int) -> np.ndarray:
+    """
+    Row i holds values[i - width + 1 .. i] from i's own cell, oldest first.
+
+    Slots before the start of the cell, and every slot of rows outside any
+    cell, are NaN.
+    """
+    n = len(values)
+    position = _positions(groups)
+    out = np.full((n, width), np.nan)
+    for lag in range(width):
+        ok = (position >= lag) & (groups >= 0)
+        rows = np.nonzero(ok)[0]
+        out[rows, width - 1 - lag] = values[rows - lag]
+    return out
+
+
+def capped_pct_change(values: np.ndarray, groups: np.ndarray, periods: int) -> np.ndarray:
+    """
+    pct_change within each cell over min(periods, max(1, cell size - 1)) rows.
+
+    Short cells compare against their first snapshot rather than having no
+    trend at all.
+    """
+    n = len(values)
+    position = _positions(groups)
+    in_cell = groups >= 0
+    size = np.zeros(n, dtype=int)
+    size[in_cell] = np.bincount(groups[in_cell])[groups[in_cell]]
+    lag = np.clip(size - 1, 1, periods)
+    ok = (groups >= 0) & (position >= lag)
+    out = np.full(n, np.nan)
+    rows = np.nonzero(ok)[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[rows] = values[rows] / values[rows - lag[rows]] - 1
+    return out
+
+
+def rolling_std(values: np.ndarray, groups: np.ndarray, window: int, min_periods: int = 2) -> np.ndarray:
+    """Sample standard deviation over each row's last window prices in its cell."""
+    w = windows(values, groups, window)
+    count = (~np.isnan(w)).sum(axis=1)
+    out = np.full(len(values), np.nan)
+    rows = count >= max(min_periods, 2)
+    if rows.any():
+        out[rows] = np.nanstd(w[rows], axis=1, ddof=1)
+    return out
+
+
+def direction_consistency(values: np.ndarray, groups: np.ndarray, window: int) -> np.ndarray:
+    """
+    Share of rises among the consecutive moves inside each row's window,
+    rounded to 3 places. Moves touching a missing price are skipped; NaN
+    when the window holds no move.
+    """
+    w = windows(values, groups, window)
+    moves = np.diff(w, axis=1)
+    valid = (~np.isnan(moves)).sum(axis=1)
+    up = (moves > 0).sum(axis=1)
+    out = np.full(len(values), np.nan)
+    rows = valid > 0
+    out[rows] = np.round(up[rows] / valid[rows], 3)
+    return out
+
+
+def rise_share(values: np.ndarray, groups: np.ndarray, window: int, min_periods: int = 2) -> np.ndarray:
+    """
+    Mean over each row's last window rows of "price rose since the previous
+    snapshot", a missing move counting as not rising.
+    """
+    w = windows(values, groups, window + 1)
+    rose = (np.diff(w, axis=1) > 0).astype(float)
+    present = ~np.isnan(windows(np.zeros(len(values)), groups, window))
+    count = present.sum(axis=1)
+    out = np.full(len(values), np.nan)
+    rows = count >= min_periods
+    out[rows] = (rose * present).sum(axis=1)[rows] / count[rows]
+    return out
@@ -0,0 +1,53 @@
+-- workers/snapshot_feature_update.sql
+-- Feature write path for workers/atlas_backfill_v2.py. Apply once in the
+-- Supabase SQL editor before deploying the backfill.
+--
+-- A plain UPDATE keyed on snapshot_id: the backfill only sends snapshot_id
+-- and the feature columns, which an upsert would reject as an insert row
+-- missing the snapshots NOT NULL columns. Returns the number of rows updated.
+--
+-- snapshot_id is compared with the table column uncast so the primary key
+-- index serves the join; the record side is declared uuid to match it.
+
+create or replace function public.update_snapshot_features(rows jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update public.snapshots s
+        set season_bucket             = r.season_bucket,
+            days_to_next_bank_holiday = r.days_to_next_bank_holiday,
+            trip_overlaps_holiday     = r.trip_overlaps_holiday,
+            holiday_intensity_score   = r.holiday_intensity_score,
+            price_z_score             = r.price_z_score,
+            price_percentile          = r.price_percentile,
+            price_ratio               = r.price_ratio,
+            baseline_mu               = r.baseline_mu,
+            baseline_sigma            = r.baseline_sigma,
+            trend_3d                  = r.trend_3d,
+            trend_7d                  = r.trend_7d,
+            volatility_7d             = r.volatility_7d,
+            direction_consistency_7d  = r.direction_consistency_7d,
+            jet_fuel_7d_change_pct    = r.jet_fuel_7d_change_pct
+        from jsonb_to_recordset(rows) as r(
+            snapshot_id               uuid,
+            season_bucket             text,
+            days_to_next_bank_holiday integer,
+            trip_overlaps_holiday     boolean,
+            holiday_intensity_score   double precision,
+            price_z_score             double precision,
+            price_percentile          double precision,
+            price_ratio               double precision,
+            baseline_mu               double precision,
+            baseline_sigma            double precision,
+            trend_3d                  double precision,
+            trend_7d                  double precision,
+            volatility_7d             double precision,
+            direction_consistency_7d  double precision,
+            jet_fuel_7d_change_pct    double precision
+        )
+        where s.snapshot_id = r.snapshot_id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
@@ -0,0 +1,10 @@
+-- workers/snapshot_fx_source.sql
+-- Quoted currency of snapshot fares converted to GBP by atlas_snapshot_capture
+-- (NULL when Duffel quoted GBP). price_gbp and currency stay GBP.
+
+alter table public.snapshots add column if not exists fx_source_currency text;
+
+-- Rows written before the column existed kept the quoted currency in currency.
+update public.snapshots
+set fx_source_currency = currency, currency = 'GBP'
+where currency in ('EUR', 'USD');
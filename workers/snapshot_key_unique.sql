@@ -0,0 +1,12 @@
+-- workers/snapshot_key_unique.sql
+-- Conflict target for atlas_snapshot_capture's chunked upserts
+-- (on_conflict=snapshot_key). Apply once in the Supabase SQL editor before
+-- deploying the capture; without it PostgREST rejects every upsert.
+--
+-- If older runs left duplicate snapshot_keys, the index build fails; keep
+-- one row per key first:
+--   delete from public.snapshots s using public.snapshots d
+--   where s.snapshot_key = d.snapshot_key and s.ctid < d.ctid;
+
+create unique index if not exists snapshots_snapshot_key_key
+    on public.snapshots (snapshot_key);
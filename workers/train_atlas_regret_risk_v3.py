@@ -36,6 +36,10 @@ from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import brier_score_loss
 
+import route_baseline
+from dtd_curve import RECONSTRUCTED_NOTE
+from holiday_calendar import calendar_features
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -66,19 +70,6 @@ PAGE_SIZE = int(os.environ.get("ATLAS_TRAINING_PAGE_SIZE", "1000"))
 MIDDLE_EAST_AIRPORTS = {"DXB", "AUH", "DOH", "AMM", "BEY", "TLV"}
 UK_ORIGINS = ["MAN", "LGW", "LHR", "EDI", "BRS", "LPL", "BHX", "NCL", "GLA"]
 
-# Keep this aligned with main.py.
-UK_BANK_HOLIDAYS = [
-    date(2025, 1, 1), date(2025, 4, 18), date(2025, 4, 21),
-    date(2025, 5, 5), date(2025, 5, 26), date(2025, 8, 25),
-    date(2025, 12, 25), date(2025, 12, 26),
-    date(2026, 1, 1), date(2026, 4, 3), date(2026, 4, 6),
-    date(2026, 5, 4), date(2026, 5, 25), date(2026, 8, 31),
-    date(2026, 12, 25), date(2026, 12, 28),
-    date(2027, 1, 1), date(2027, 3, 26), date(2027, 3, 29),
-    date(2027, 5, 3), date(2027, 5, 31), date(2027, 8, 30),
-    date(2027, 12, 27), date(2027, 12, 28),
-]
-
 FEATURE_COLS = [
     "price_gbp",
     "price_z_score",
@@ -115,7 +106,7 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 # ------------------------------------------------------------
-# Date / calendar helpers aligned with main.py
+# Date helpers
 # ------------------------------------------------------------
 
 def utc_now() -> datetime:
@@ -133,43 +124,6 @@ def parse_date(value: Any) -> date | None:
         return None
 
 
-def assign_season_bucket(d: date) -> str:
-    m, day = d.month, d.day
-    if (m == 12 and day >= 20) or (m == 1 and day <= 5):
-        return "christmas"
-    if (m == 4 and 1 <= day <= 15) or (m == 3 and 24 <= day <= 31):
-        return "easter"
-    if (m == 7 and day >= 15) or m == 8 or (m == 9 and day <= 1):
-        return "summer_peak"
-    if (m == 1 and day >= 15) or m == 2 or (m == 3 and day <= 15):
-        return "ski"
-    if (m == 2 and 14 <= day <= 21) or (m == 10 and 19 <= day <= 30):
-        return "half_term"
-    if m in {4, 5, 6, 9, 10}:
-        return "shoulder"
-    return "off_peak"
-
-
-def days_to_next_bank_holiday(d: date) -> int:
-    future = [h for h in UK_BANK_HOLIDAYS if h >= d]
-    return (min(future) - d).days if future else 365
-
-
-def holiday_intensity_score(d: date) -> float:
-    base = {
-        "christmas": 0.95,
-        "easter": 0.85,
-        "summer_peak": 0.90,
-        "half_term": 0.75,
-        "ski": 0.70,
-        "shoulder": 0.45,
-        "off_peak": 0.20,
-    }.get(assign_season_bucket(d), 0.30)
-    if days_to_next_bank_holiday(d) <= 3:
-        base = min(1.0, base + 0.15)
-    return round(base, 3)
-
-
 # ------------------------------------------------------------
 # Supabase loading
 # ------------------------------------------------------------
@@ -199,7 +153,7 @@ def fetch_snapshots() -> list[dict[str, Any]]:
     cols = (
         "snapshot_id,snapshot_date,origin_iata,destination_iata,"
         "outbound_date,return_date,price_gbp,cabin_class,direct,stops,"
-        "carrier_count,lcc_present,offer_count,cheapest_offer_gbp,most_expensive_offer_gbp"
+        "carrier_count,lcc_present,offer_count,cheapest_offer_gbp,most_expensive_offer_gbp,notes"
     )
     raw_rows = fetch_all_rows("snapshots", cols, "snapshot_date")
     cleaned: list[dict[str, Any]] = []
@@ -213,6 +167,8 @@ def fetch_snapshots() -> list[dict[str, Any]]:
 
         if not origin or not destination or not snapshot_date:
             continue
+        if row.get("notes") == RECONSTRUCTED_NOTE:
+            continue
         if origin in MIDDLE_EAST_AIRPORTS or destination in MIDDLE_EAST_AIRPORTS:
             continue
 
@@ -231,6 +187,14 @@ def fetch_snapshots() -> list[dict[str, Any]]:
         row["price_gbp_float"] = price
         cleaned.append(row)
 
+    calendar = calendar_features(
+        [row["outbound_date_obj"] for row in cleaned],
+        [row["return_date_obj"] for row in cleaned],
+    )
+    for col, values in calendar.items():
+        for row, value in zip(cleaned, values.tolist()):
+            row[col] = value
+
     log.info("Usable snapshots after cleaning: %d", len(cleaned))
     return cleaned
 
@@ -324,29 +288,63 @@ def make_labelled_rows(snapshots: list[dict[str, Any]]) -> list[dict[str, Any]]:
 # Feature engineering aligned with main.py names
 # ------------------------------------------------------------
 
+def baseline_key(row: dict[str, Any]) -> tuple[str, str, str] | None:
+    outbound_date = row.get("outbound_date_obj")
+    if not outbound_date:
+        return None
+    bucket = route_baseline.dtd_bucket((outbound_date - row["snapshot_date_obj"]).days)
+    if bucket is None:
+        return None
+    return (f"{row['origin_iata']}-{row['destination_iata']}", bucket, row["season_bucket"])
+
+
+def load_route_baselines(snapshots: list[dict[str, Any]]) -> route_baseline.BaselineHistory:
+    """
+    Daily route baselines from the persisted store. Groups the store does not
+    hold yet (the incremental backfill only seeds groups it touches) are
+    rebuilt from the fetched snapshots, as is everything when the store is
+    empty or unreachable.
+    """
+    try:
+        baselines = route_baseline.load_history(supabase)
+    except Exception as exc:
+        log.warning("Could not fetch %s: %s", route_baseline.HISTORY_TABLE, exc)
+        baselines = route_baseline.BaselineHistory()
+
+    stored = set(baselines.keys())
+    keyed = [(baseline_key(row), row) for row in snapshots]
+    keyed = [(key, row) for key, row in keyed if key is not None and key not in stored]
+    rebuilt = route_baseline.accumulate(
+        [key[0] for key, _ in keyed],
+        [key[1] for key, _ in keyed],
+        [key[2] for key, _ in keyed],
+        [row["snapshot_date_obj"] for _, row in keyed],
+        [row["price_gbp_float"] for _, row in keyed],
+    )
+    baselines.extend(rebuilt)
+
+    log.info(
+        "Route baselines: %d stored groups, %d rebuilt from the fetched snapshots.",
+        len(stored),
+        len(rebuilt.keys()),
+    )
+    if not stored:
+        log.warning("No stored route baselines; every group was rebuilt from the fetched snapshots.")
+    return baselines
+
+
 def build_feature_indexes(snapshots: list[dict[str, Any]]) -> dict[str, Any]:
-    by_route_season: dict[tuple[str, str, str], list[tuple[date, float]]] = defaultdict(list)
     by_route: dict[tuple[str, str], list[tuple[date, float]]] = defaultdict(list)
 
     for row in snapshots:
-        origin = row["origin_iata"]
-        destination = row["destination_iata"]
-        snapshot_date = row["snapshot_date_obj"]
-        outbound_date = row.get("outbound_date_obj")
-        price = row["price_gbp_float"]
-
-        if outbound_date:
-            season = assign_season_bucket(outbound_date)
-            by_route_season[(origin, destination, season)].append((snapshot_date, price))
-
-        by_route[(origin, destination)].append((snapshot_date, price))
+        by_route[(row["origin_iata"], row["destination_iata"])].append(
+            (row["snapshot_date_obj"], row["price_gbp_float"])
+        )
 
-    for values in by_route_season.values():
-        values.sort(key=lambda x: x[0])
     for values in by_route.values():
         values.sort(key=lambda x: x[0])
 
-    return {"by_route_season": by_route_season, "by_route": by_route}
+    return {"baselines": load_route_baselines(snapshots), "by_route": by_route}
 
 
 def route_relative_features(
@@ -354,27 +352,20 @@ def route_relative_features(
     indexes: dict[str, Any],
 ) -> dict[str, float]:
     neutral = {"price_z_score": 0.0, "price_ratio": 1.0, "price_percentile": 50.0}
-    outbound_date = row.get("outbound_date_obj")
-    if not outbound_date:
+    key = baseline_key(row)
+    if key is None:
         return neutral
 
-    season = assign_season_bucket(outbound_date)
-    key = (row["origin_iata"], row["destination_iata"], season)
-    snapshot_date = row["snapshot_date_obj"]
-    price = row["price_gbp_float"]
-
-    history = [p for d, p in indexes["by_route_season"].get(key, []) if d <= snapshot_date]
-    if len(history) < 3:
+    # Point-in-time: the group's state through the snapshot date, never later.
+    state = indexes["baselines"].as_of(key, row["snapshot_date_obj"].isoformat())
+    if state is None or state.n < 3:
         return neutral
 
-    n = len(history)
-    mean_price = sum(history) / n
-    sigma = max(5.0, (sum((p - mean_price) ** 2 for p in history) / n) ** 0.5)
-
+    price = row["price_gbp_float"]
     return {
-        "price_z_score": round((price - mean_price) / sigma, 3),
-        "price_ratio": round(price / mean_price, 3) if mean_price > 0 else 1.0,
-        "price_percentile": round(sum(1 for p in history if p <= price) / n * 100, 1),
+        "price_z_score": round((price - state.mean) / state.sigma, 3),
+        "price_ratio": round(price / state.mean, 3) if state.mean > 0 else 1.0,
+        "price_percentile": round(float(state.percentile([price])[0]), 1),
     }
 
 
@@ -510,7 +501,6 @@ def build_feature_row(
 ) -> dict[str, float] | None:
     snapshot_date = row["snapshot_date_obj"]
     outbound_date = row.get("outbound_date_obj")
-    return_date = row.get("return_date_obj")
 
     if not outbound_date:
         return None
@@ -519,7 +509,7 @@ def build_feature_row(
     if dtd < 0:
         return None
 
-    days_to_bh = days_to_next_bank_holiday(outbound_date)
+    days_to_bh = row["days_to_next_bank_holiday"]
     rel = route_relative_features(row, indexes)
     momentum = route_momentum_features(row, indexes)
     route_key = (row["origin_iata"], row["destination_iata"])
@@ -536,19 +526,15 @@ def build_feature_row(
     )
     market = market_signal_for_date(signals_by_date, snapshot_date)
 
-    trip_overlaps_holiday = 0.0
-    if return_date is not None:
-        trip_overlaps_holiday = 1.0 if any(outbound_date <= h <= return_date for h in UK_BANK_HOLIDAYS) else 0.0
-
     feature_map = {
         "price_gbp": row["price_gbp_float"],
         "price_z_score": rel["price_z_score"],
         "price_ratio": rel["price_ratio"],
         "price_percentile": rel["price_percentile"],
         "dtd": float(dtd),
-        "holiday_intensity_score": holiday_intensity_score(outbound_date),
+        "holiday_intensity_score": row["holiday_intensity_score"],
         "days_to_next_bank_holiday": float(days_to_bh),
-        "trip_overlaps_holiday": trip_overlaps_holiday,
+        "trip_overlaps_holiday": 1.0 if row["trip_overlaps_holiday"] else 0.0,
         "trend_7d": momentum["trend_7d"],
         "volatility_7d": momentum["volatility_7d"],
         "direction_consistency_7d": momentum["direction_consistency_7d"],